@@ -1,266 +1,411 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, request
 from flask_cors import CORS
+from bson import ObjectId
+from bson.errors import InvalidId
 from database_utils import get_properties_collection
-import re
-import time
+from query_planner import TEXT_SCORE, QueryPlanner, has_text_search, normalize_search_term
+from index_manager import ensure_indexes_once
+from pagination import (
+    CURSOR_SORT,
+    InvalidCursorError,
+    InvalidPaginationError,
+    apply_cursor,
+    encode_cursor,
+    parse_page_args,
+)
+from response_cache import create_response_cache
+from facets import get_precomputed_facets, run_facet_search
+from geo import InvalidGeoQueryError, parse_geo_args
+from projections import InvalidProjectionError, projection_for, requested_fields
+from serialization import DEFAULT_COMPRESS_MIN_SIZE, compress, get_serializer
+from metrics import CONTENT_TYPE, REGISTRY, CallbackMetric, RequestTimer, record_cache_lookup
+from slow_queries import create_slow_query_log
+from structured_logging import (
+    configure_logging,
+    get_request_id,
+    get_request_logger,
+    new_request_id,
+    reset_request_id,
+    set_request_id,
+)
+import logging
 import os
 
+configure_logging()
+logger = logging.getLogger(__name__)
+# Generated queries and timings: INFO, kept for a sampled share of requests
+request_log = get_request_logger(__name__)
+
 app = Flask(__name__)
 CORS(app)  # Allow cross-origin requests (so React can call Flask)
 
+# Built once at import: compiled patterns + LRU cache of search term -> query
+query_planner = QueryPlanner(cache_size=int(os.environ.get("QUERY_CACHE_SIZE", 1024)))
+CallbackMetric(
+    "query_planner_cache_requests_total", "Search term lookups in the query planner's cache, by result.",
+    "counter", lambda: {("hit",): query_planner.hits, ("miss",): query_planner.misses}, ["result"],
+)
+
+# Whole /api/properties responses, invalidated when the scraper bumps the data generation
+response_cache = create_response_cache(
+    redis_url=os.environ.get("RESPONSE_CACHE_URL"),
+    maxsize=int(os.environ.get("RESPONSE_CACHE_SIZE", 512)),
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", 300)),
+    generation_check_interval=float(os.environ.get("DATA_GENERATION_CHECK_INTERVAL", 1.0)),
+)
+
+# Searches whose database phases exceed SLOW_QUERY_MS get their plans explained and stored
+slow_query_log = create_slow_query_log()
+
+# Response encoding: fast JSON (orjson when installed), gzip/br above a size threshold
+dumps = get_serializer()
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", DEFAULT_COMPRESS_MIN_SIZE))
+
+# queryUsed (the generated Mongo query) is only sent with ?debug=1, or always with API_DEBUG_QUERY=true
+DEBUG_QUERY = os.environ.get("API_DEBUG_QUERY", "false").lower() == "true"
+
+def bootstrap_indexes():
+    # The declared indexes (listing_text, 2dsphere, typed fields) the planner's queries need
+    ensure_indexes_once(lambda: get_properties_collection('daft'))
+
+@app.before_request
+def start_request():
+    bootstrap_indexes()
+    g.timer = RequestTimer(request.endpoint or "unknown")
+    # Every log line of the request carries this ID (the caller's X-Request-ID if it sent one)
+    g.request_id_token = set_request_id(new_request_id(request.headers.get("X-Request-ID")))
+
+@app.after_request
+def add_request_headers(response):
+    # Per-phase durations (ms) for the browser's network panel; also records the request histogram
+    timer = g.get("timer")
+    if timer is not None:
+        response.headers["Server-Timing"] = timer.finish(response.status_code)
+    request_id = get_request_id()
+    if request_id:
+        response.headers["X-Request-ID"] = request_id
+    return response
+
+@app.teardown_request
+def clear_request_id(exc=None):
+    token = g.pop("request_id_token", None)
+    if token is not None:
+        reset_request_id(token)
+
+def json_response(payload, status=200):
+    """Serialize `payload` and compress it if the client accepts gzip/br and it is big enough."""
+    timer = g.timer
+    with timer.phase("serialize"):
+        body = dumps(payload)
+    with timer.phase("compress"):
+        body, encoding = compress(body, request.headers.get("Accept-Encoding"), COMPRESS_MIN_SIZE)
+    response = Response(body, status=status, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+def wants_query_used(args):
+    return DEBUG_QUERY or args.get("debug", "").lower() in ("1", "true")
+
+def without_debug_fields(response, args):
+    """The response as sent to this client; never mutates `response` (it may be the cached object)."""
+    if wants_query_used(args):
+        return response
+    return {key: value for key, value in response.items() if key != "queryUsed"}
+
 def parse_search_query(search_term):
     """
     Advanced query parsing for property search.
     The chatbot/LLM provides a refined string like:
     "house 3 bed 3 bath under 400k dublin"
     We convert that into a MongoDB query.
+
+    Parsing is delegated to the module-level QueryPlanner, whose patterns
+    are compiled once and whose results are cached per normalized term.
     """
+    query = query_planner.plan(search_term)
+    request_log.info("Generated query", extra={"search_term": search_term, "query": query})
+    return query
 
-    # Normalize text
-    search_term = search_term.lower().strip()
-
-    # Extract all locations from the search term first - expanded list with more towns
-    locations = [
-        # Counties
-        "carlow", "cavan", "clare", "cork", "donegal", "dublin", "galway", "kerry",
-        "kildare", "kilkenny", "laois", "leitrim", "limerick", "longford", "louth",
-        "mayo", "meath", "monaghan", "offaly", "roscommon", "sligo", "tipperary",
-        "waterford", "westmeath", "wexford", "wicklow", "antrim", "armagh", "down", 
-        "fermanagh", "londonderry", "tyrone",
-        # Major towns and cities
-        "athlone", "mullingar", "tullamore", "portlaoise", "naas", "navan", "drogheda", "dundalk",
-        "swords", "bray", "greystones", "arklow", "gorey", "enniscorthy", "wexford", "kilkenny",
-        "carlow", "athy", "newbridge", "kildare", "maynooth", "celbridge", "leixlip", "lucan",
-        "clondalkin", "tallaght", "dun laoghaire", "balbriggan", "skerries", "malahide", "howth",
-        "sutton", "raheny", "clontarf", "killester", "fairview", "drumcondra", "phibsborough",
-        "cabra", "blanchardstown", "castleknock", "chapelizod", "palmerstown", "ballyfermot",
-        "inchicore", "kilmainham", "dolphins barn", "crumlin", "walkinstown", "terenure",
-        "rathfarnham", "churchtown", "dundrum", "ballinteer", "sandyford", "stepaside",
-        "leopardstown", "foxrock", "cabinteely", "killiney", "dalkey", "sandycove", "glasthule",
-        "monkstown", "blackrock", "booterstown", "ballsbridge", "donnybrook", "ranelagh",
-        "rathmines", "harold's cross", "rathgar", "milltown", "clonskeagh", "goatstown",
-        "stillorgan", "kilmacud", "mount merrion", "deansgrange", "dun laoghaire", "glasnevin",
-        "santry", "beaumont", "artane", "killester", "coolock", "darndale", "donaghmede",
-        "kilbarrack", "raheny", "clontarf", "east wall", "north wall", "kilshane", "mulhuddart"
-    ]
-    
-    # Find all locations mentioned in the search term
-    detected_locations = []
-    for loc in locations:
-        if re.search(r'\b' + loc + r'\b', search_term, re.IGNORECASE):
-            detected_locations.append(loc)
-    
-    # Create a modified search term with locations removed
-    # This prevents locations from being processed in the normal segment loop
-    modified_search_term = search_term
-    for loc in detected_locations:
-        modified_search_term = re.sub(r'\b' + loc + r'\b', '', modified_search_term, flags=re.IGNORECASE)
-    
-    # split on some words like 'and', 'with', commas, etc.
-    segments = re.split(r'\band\b|\bwith\b|,', modified_search_term)
-    
-    # Start with an $and query container
-    query = {"$and": []}
-
-    # Price range helper (under/over/between)
-    price_ranges = {
-        'under': lambda price: {"price_numeric": {"$lte": price}},
-        'over': lambda price: {"price_numeric": {"$gte": price}},
-        'between': lambda minp, maxp: {
-            "price_numeric": {"$gte": minp, "$lte": maxp}
-        }
-    }
+def build_properties_query(search_term, geo_condition=None):
+    """Planner query for the search term, narrowed to the near/bbox area if one was given."""
+    query = parse_search_query(search_term) if search_term else {}
+    if geo_condition:
+        # The planner never emits 'location', so the two merge without clashing
+        query.update(geo_condition)
+    return query
 
-    # Regex to detect "under 400k", "over 300k", "between 200k and 300k"
-    price_patterns = [
-        r'under\s*(\d+)\s*k',
-        r'over\s*(\d+)\s*k',
-        r'between\s*(\d+)\s*k\s*and\s*(\d+)\s*k'
-    ]
-
-    # Property type synonyms
-    # If user says "house", we also match "detached", "semi-detached", "terraced".
-    property_types = {
-        "house": ["house", "detached", "semi-detached", "terraced", "townhouse","bungalow"],
-        "apartment": ["apartment", "flat"],
-        "detached": ["detached"],
-        "terraced": ["terraced","end of terraced"],
-        "semi-detached": ["semi-detached"],
-        "townhouse": ["townhouse"],
-        "bungalow": ["bungalow"]
-    }
+def geo_cache_parts(args):
+    return {name: args.get(name) for name in ('near', 'radius', 'bbox') if args.get(name) is not None}
 
-    # Common features we might see
-    feature_keywords = ['garden', 'parking', 'balcony', 'view', 'garage', 'pool']
-    
-    def add_condition(cond):
-        """Helper to append a sub-condition into the $and list."""
-        if cond is not None and cond not in query["$and"]:
-            query["$and"].append(cond)
-
-    # Process non-location segments
-    for seg in segments:
-        seg = seg.strip()
-        if not seg:  # Skip empty segments
-            continue
-            
-        matched_segment = False
-
-        # 1) Price Patterns
-        for pattern in price_patterns:
-            match = re.search(pattern, seg)
-            if match:
-                matched_segment = True
-                if 'under' in pattern:
-                    # e.g. "under 400k"
-                    price_val = int(match.group(1)) * 1000
-                    add_condition(price_ranges['under'](price_val))
-                elif 'over' in pattern:
-                    # e.g. "over 300k"
-                    price_val = int(match.group(1)) * 1000
-                    add_condition(price_ranges['over'](price_val))
-                elif 'between' in pattern:
-                    # e.g. "between 200k and 300k"
-                    min_price = int(match.group(1)) * 1000
-                    max_price = int(match.group(2)) * 1000
-                    add_condition(price_ranges['between'](min_price, max_price))
-                break
-
-        # Also handle if user just typed "300k" (with no "under"/"over/between")
-        if not matched_segment:
-            standalone_price = re.match(r'^(\d+)\s*k$', seg)
-            if standalone_price:
-                matched_segment = True
-                price_val = int(standalone_price.group(1)) * 1000
-                # by default, treat "300k" as "under 300k"
-                add_condition(price_ranges['under'](price_val))
-
-        # 2) Property type synonyms
-        for main_type, synonyms in property_types.items():
-            # If seg includes "house", "detached", etc.
-            for syn in synonyms:
-                if syn in seg:
-                    matched_segment = True
-                    # We'll do a regex OR across synonyms
-                    # e.g. if user typed "house", we search "house|detached|semi-detached|terraced"
-                    type_regex = "|".join(property_types[main_type])
-                    add_condition({"property_type": {"$regex": type_regex, "$options": "i"}})
-                    break
-
-        # 3) Bedrooms / Bathrooms
-        # e.g. "3 bed", "4 bedroom", "2 bath", "3 bathrooms"
-        bedroom_match = re.search(r'(\d+)\s*bed', seg)
-        if bedroom_match:
-            matched_segment = True
-            bed_num = bedroom_match.group(1)
-            # If "bedrooms" is stored as a string or number, adapt as needed
-            add_condition({"bedrooms": {"$regex": bed_num, "$options": "i"}})
-
-        bathroom_match = re.search(r'(\d+)\s*bath', seg)
-        if bathroom_match:
-            matched_segment = True
-            bath_num = bathroom_match.group(1)
-            add_condition({"bathrooms": {"$regex": bath_num, "$options": "i"}})
-
-        # 4) Features (garden, parking, etc.)
-        for keyword in feature_keywords:
-            if keyword in seg:
-                matched_segment = True
-                add_condition({
-                    "$or": [
-                        {"description": {"$regex": keyword, "$options": "i"}},
-                        {"features":    {"$regex": keyword, "$options": "i"}}
-                    ]
-                })
-
-        # 5) If none of the above matched, do a fallback text match
-        #    This ensures the user typed something that we still catch in address, description, etc.
-        if not matched_segment and seg:
-            add_condition({
-                "$or": [
-                    {"address":      {"$regex": seg, "$options": "i"}},
-                    {"description":  {"$regex": seg, "$options": "i"}},
-                    {"features":     {"$regex": seg, "$options": "i"}},
-                    {"property_type":{"$regex": seg, "$options": "i"}}
-                ]
-            })
-
-    # Handle locations as a separate OR condition
-    if detected_locations:
-        location_conditions = []
-        for loc in detected_locations:
-            location_conditions.append({
-                "$or": [
-                    {"address": {"$regex": loc, "$options": "i"}},
-                    {"county": {"$regex": loc, "$options": "i"}},
-                    {"description": {"$regex": "\\bin " + loc + "\\b", "$options": "i"}}
-                ]
-            })
-        
-        # Add a combined location OR condition
-        if location_conditions:
-            add_condition({"$or": location_conditions})
-
-    # If $and is empty (meaning user gave us nothing?), fallback again
-    if len(query["$and"]) == 0:
-        # just do a broad match on entire search_term
-        query = {
-            "$or": [
-                {"address":      {"$regex": search_term, "$options": "i"}},
-                {"description":  {"$regex": search_term, "$options": "i"}},
-                {"features":     {"$regex": search_term, "$options": "i"}},
-                {"property_type":{"$regex": search_term, "$options": "i"}}
-            ]
-        }
+def properties_cache_key(generation, search_term, page, cursor, limit, fields=None, **extra):
+    return response_cache.make_key(
+        generation,
+        search=normalize_search_term(search_term),
+        page=None if cursor is not None else page,
+        cursor=cursor,
+        limit=limit,
+        fields=fields,
+        **extra
+    )
 
-    print(f"Generated query for '{search_term}': {query}")
-    return query
+def properties_page_spec(query, cursor, skip, limit, fields=None):
+    """
+    What one page of results reads, as a dict of filter, projection, sort,
+    skip and limit: keyset order when paginating by cursor, relevance for
+    $text searches, natural order otherwise. The slow-query log explains
+    the same spec.
+
+    `fields` (from requested_fields) limits what is read back; None is the
+    whole document.
+    """
+    if cursor is not None:
+        # The keyset needs _id and price_numeric of the last document
+        projection = None
+        if fields is not None:
+            projection = dict.fromkeys(fields, 1)
+            projection["price_numeric"] = 1
+        return {"filter": apply_cursor(query, cursor), "projection": projection,
+                "sort": CURSOR_SORT, "skip": None, "limit": limit}
+    projection = projection_for(fields)
+    sort = None
+    if has_text_search(query):
+        # Full-text matches come back most relevant first
+        projection["score"] = TEXT_SCORE
+        sort = [("score", TEXT_SCORE)]
+    return {"filter": query, "projection": projection, "sort": sort, "skip": skip, "limit": limit}
+
+def find_page(collection, spec):
+    """The find() for a properties_page_spec(). Works for the pymongo and
+    motor collections alike (same chainable cursor API)."""
+    page = collection.find(spec["filter"], spec["projection"])
+    if spec["sort"]:
+        page = page.sort(spec["sort"])
+    if spec["skip"] is not None:
+        page = page.skip(spec["skip"])
+    return page.limit(spec["limit"])
+
+def find_properties_page(collection, query, cursor, skip, limit, fields=None):
+    """The find() for one page of results (see properties_page_spec)."""
+    return find_page(collection, properties_page_spec(query, cursor, skip, limit, fields))
+
+def read_page(cursor, timer):
+    """The cursor's documents; the first batch is timed as "find", the rest as "drain"."""
+    documents = iter(cursor)
+    with timer.phase("find"):
+        first = next(documents, None)
+    if first is None:
+        return []
+    with timer.phase("drain"):
+        return [first] + list(documents)
+
+def build_properties_response(properties, total, query, cursor, limit, fields=None):
+    """The /api/properties JSON body for one fetched page."""
+    next_cursor = None
+    # An empty page has no last document to continue from
+    if cursor is not None and properties and len(properties) == limit:
+        next_cursor = encode_cursor(properties[-1])
+    drop_price = fields is not None and "price_numeric" not in fields
+    for prop in properties:
+        prop.pop("_id", None)
+        prop.pop("score", None)
+        if drop_price:
+            prop.pop("price_numeric", None)
+
+    response = {
+        "properties": properties,
+        "total": total,
+        "queryUsed": query
+    }
+    if cursor is not None:
+        response["nextCursor"] = next_cursor
+    return response
 
 @app.route('/api/properties', methods=['GET'])
 def get_properties():
+    """
+    Search/list properties.
+
+    Two pagination modes are supported:
+    - page=N (legacy): skip/limit over the natural order.
+    - cursor=<opaque> : keyset pagination ordered by (price_numeric, _id).
+      Pass an empty cursor for the first page, then the returned nextCursor.
+      Each page is an index range scan, so deep pages cost the same as page 1.
+
+    Free-text searches ($text) are ordered by relevance in page mode; in cursor
+    mode they follow the keyset order like every other search.
+
+    Map views can restrict results to an area: near=<lat>,<lng>&radius=<km>
+    or bbox=<minLng>,<minLat>,<maxLng>,<maxLat> (2dsphere-indexed).
+
+    view=summary returns only the fields a listing card shows, fields=a,b,c
+    exactly those fields; the default (view=full) is the whole document.
+    The generated Mongo query is echoed as queryUsed with debug=1.
+
+    Each phase (cache, parse, count, find, drain, serialize, compress) is
+    reported in the Server-Timing header and the /metrics histograms.
+    Searches slower than SLOW_QUERY_MS in the database are explained and
+    logged by slow_queries.py.
+    """
+    timer = g.timer
     try:
         # Retrieve pagination and searchTerm from query params
-        limit = int(request.args.get('limit', 20)) 
-        page = int(request.args.get('page', 1))     
+        limit, page = parse_page_args(request.args)
+        cursor = request.args.get('cursor')
         search_term = request.args.get('searchTerm', '').strip()
+        geo_condition = parse_geo_args(request.args)
+        fields = requested_fields(request.args)
 
         collection = get_properties_collection("daft")
 
+        # Identical searches are answered from the response cache until the data changes
+        cache_key = None
+        with timer.phase("cache"):
+            generation = response_cache.current_generation(collection)
+            cached = None
+            if generation is not None:
+                cache_key = properties_cache_key(generation, search_term, page, cursor, limit, fields,
+                                                 **geo_cache_parts(request.args))
+                cached = response_cache.get(cache_key)
+                record_cache_lookup("response", cached is not None)
+        if cached is not None:
+            return json_response(without_debug_fields(cached, request.args))
+
         # Calculate skip for pagination
         skip = (page - 1) * limit
 
-        # Build query if there's a search term
-        if search_term:
-            query = parse_search_query(search_term)
-        else:
-            query = {}
+        # Build query from the search term and area (if any)
+        with timer.phase("parse"):
+            query = build_properties_query(search_term, geo_condition)
+
+        # Query the database: the count, the page's first batch, then the rest of the page
+        spec = properties_page_spec(query, cursor, skip, limit, fields)
+        with timer.phase("count"):
+            total_properties = collection.count_documents(query)
+        properties = read_page(find_page(collection, spec), timer)
+        request_log.info("Database query", extra={"query": query, "timings_ms": timer.phase_ms()})
+        # Over SLOW_QUERY_MS: explained in the background, see slow_queries.py
+        slow_query_log.observe(collection, spec, timer, count_query=query, search_term=search_term,
+                               endpoint="get_properties")
+
+        response = build_properties_response(properties, total_properties, query, cursor, limit, fields)
+        if cache_key is not None:
+            response_cache.set(cache_key, response)
+        return json_response(without_debug_fields(response, request.args))
+    except (InvalidCursorError, InvalidPaginationError, InvalidGeoQueryError, InvalidProjectionError) as e:
+        return json_response({"error": str(e)}, 400)
+    except Exception as e:
+        logger.exception("get_properties failed")
+        return json_response({"error": str(e)}, 500)
+
+@app.route('/api/properties/facets', methods=['GET'])
+def get_property_facets():
+    """
+    Search results plus counts by county, property type, bedrooms and price
+    bucket, from a single $facet aggregation (page=N pagination only).
+
+    Accepts the same searchTerm, near/radius/bbox and view/fields parameters.
+    Without a search or area, the histograms are the ones precomputed after
+    the last scrape, so only the page of results is queried.
+    """
+    try:
+        limit, page = parse_page_args(request.args)
+        search_term = request.args.get('searchTerm', '').strip()
+        geo_condition = parse_geo_args(request.args)
+        fields = requested_fields(request.args)
 
-        # Timing the database query
-        start_time = time.time()
+        collection = get_properties_collection("daft")
+        timer = g.timer
 
-        # Query the database
-        total_properties = collection.count_documents(query)
-        properties = list(
-            collection
-            .find(query, {"_id": 0})
-            .skip(skip)
-            .limit(limit)
-        )
+        cache_key = None
+        with timer.phase("cache"):
+            generation = response_cache.current_generation(collection)
+            cached = None
+            if generation is not None:
+                cache_key = properties_cache_key(generation, search_term, page, None, limit, fields, facets=True,
+                                                 **geo_cache_parts(request.args))
+                cached = response_cache.get(cache_key)
+                record_cache_lookup("response", cached is not None)
+        if cached is not None:
+            return json_response(without_debug_fields(cached, request.args))
 
-         # TIMING END: Calculate query time
-        query_time_ms = (time.time() - start_time) * 1000  # Convert to milliseconds
-        print(f"Database Query Time: {query_time_ms:.2f}ms for query: {query}")
+        skip = (page - 1) * limit
+        with timer.phase("parse"):
+            query = build_properties_query(search_term, geo_condition)
 
+        precomputed = None
+        if not query and generation is not None:
+            with timer.phase("precomputed"):
+                precomputed = get_precomputed_facets(collection, generation)
+            record_cache_lookup("facets", precomputed is not None)
+        if precomputed is not None:
+            total_properties, facets = precomputed
+            properties = read_page(find_properties_page(collection, query, None, skip, limit, fields), timer)
+        else:
+            with timer.phase("aggregate"):
+                total_properties, properties, facets = run_facet_search(
+                    collection, query, skip, limit, projection_for(fields)
+                )
+        request_log.info("Facet query", extra={"query": query, "timings_ms": timer.phase_ms()})
 
-        return jsonify({
+        response = {
             "properties": properties,
             "total": total_properties,
-            "queryUsed": query  
-        })
+            "facets": facets,
+            "queryUsed": query
+        }
+        if cache_key is not None:
+            response_cache.set(cache_key, response)
+        return json_response(without_debug_fields(response, request.args))
+    except (InvalidPaginationError, InvalidGeoQueryError, InvalidProjectionError) as e:
+        return json_response({"error": str(e)}, 400)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        logger.exception("get_property_facets failed")
+        return json_response({"error": str(e)}, 500)
+
+@app.route('/api/property', methods=['GET'])
+def get_property():
+    """
+    One listing with every field (or fields=a,b,c), looked up by
+    ?link=<listing url> (unique index) or ?id=<ObjectId hex>.
+    """
+    try:
+        link = request.args.get('link')
+        property_id = request.args.get('id')
+        if bool(link) == bool(property_id):
+            return json_response({"error": "Pass exactly one of link or id"}, 400)
+        if property_id:
+            try:
+                lookup = {"_id": ObjectId(property_id)}
+            except (InvalidId, TypeError):
+                return json_response({"error": "id must be a 24-character hex ObjectId"}, 400)
+        else:
+            lookup = {"link": link}
+
+        projection = projection_for(requested_fields(request.args))
+        projection.pop("_id")  # returned as "id"
+        with g.timer.phase("find"):
+            doc = get_properties_collection("daft").find_one(lookup, projection)
+        if doc is None:
+            return json_response({"error": "Property not found"}, 404)
+        doc["id"] = str(doc.pop("_id"))
+        return json_response({"property": doc})
+    except InvalidProjectionError as e:
+        return json_response({"error": str(e)}, 400)
+    except Exception as e:
+        logger.exception("get_property failed")
+        return json_response({"error": str(e)}, 500)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """This process' metrics in the Prometheus text format."""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 
 if __name__ == '__main__':
+    # Make sure the collection is indexed before the first request
+    bootstrap_indexes()
+
     port = int(os.environ.get("PORT", 8080))
     app.run(host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,204 @@
+"""
+Async (ASGI) variant of GET /api/properties, backed by motor. It also
+serves this process' /metrics.
+
+The Flask handler holds a worker thread for both Mongo round trips; here the
+count and the page fetch are awaited together, so one process can keep many
+requests in flight. The JSON bodies are the same as app.py's (same planner,
+response cache and page helpers).
+
+Run with e.g.:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8080 --workers 4
+"""
+import asyncio
+import logging
+from urllib.parse import parse_qs
+from app import (
+    COMPRESS_MIN_SIZE,
+    build_properties_query,
+    build_properties_response,
+    dumps,
+    find_page,
+    geo_cache_parts,
+    properties_cache_key,
+    properties_page_spec,
+    response_cache,
+    slow_query_log,
+    without_debug_fields,
+)
+from database_utils import get_async_properties_collection
+from geo import InvalidGeoQueryError, parse_geo_args
+from index_manager import ensure_indexes_once, indexes_bootstrapped
+from metrics import CONTENT_TYPE, REGISTRY, RequestTimer, record_cache_lookup
+from pagination import InvalidCursorError, InvalidPaginationError, parse_page_args
+from projections import InvalidProjectionError, requested_fields
+from serialization import compress
+from structured_logging import get_request_id, get_request_logger, new_request_id, set_request_id
+
+logger = logging.getLogger(__name__)
+request_log = get_request_logger(__name__)
+
+# Same headers flask-cors adds to every response
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+]
+PREFLIGHT_HEADERS = CORS_HEADERS + [
+    (b"access-control-allow-methods", b"GET, HEAD, OPTIONS"),
+    (b"access-control-allow-headers", b"*"),
+]
+
+
+def get_collection():
+    return get_async_properties_collection("daft")
+
+
+async def bootstrap_indexes():
+    """Create missing indexes once per process (at startup, or the first request if there is no lifespan)."""
+    if not indexes_bootstrapped():
+        # Blocking pymongo calls, through motor's underlying collection
+        await asyncio.to_thread(ensure_indexes_once, lambda: get_collection().delegate)
+
+
+async def get_properties(args, timer=None):
+    """
+    Handle one /api/properties request given its (first-value) query args.
+    Returns (status, body) with the same bodies as the Flask handler.
+    """
+    timer = timer or RequestTimer("get_properties")
+    try:
+        limit, page = parse_page_args(args)
+        cursor = args.get('cursor')
+        search_term = args.get('searchTerm', '').strip()
+        geo_condition = parse_geo_args(args)
+        fields = requested_fields(args)
+
+        collection = get_collection()
+
+        cache_key = None
+        with timer.phase("cache"):
+            generation = await response_cache.current_generation_async(collection)
+            cached = None
+            if generation is not None:
+                cache_key = properties_cache_key(generation, search_term, page, cursor, limit, fields,
+                                                 **geo_cache_parts(args))
+                cached = await response_cache.get_async(cache_key)
+                record_cache_lookup("response", cached is not None)
+        if cached is not None:
+            return 200, without_debug_fields(cached, args)
+
+        skip = (page - 1) * limit
+        with timer.phase("parse"):
+            query = build_properties_query(search_term, geo_condition)
+
+        # Both round trips in flight at once (the page cursor is built first:
+        # an invalid `cursor` raises before anything is sent). They overlap,
+        # so they are timed together as "query".
+        spec = properties_page_spec(query, cursor, skip, limit, fields)
+        page_cursor = find_page(collection, spec)
+        with timer.phase("query"):
+            total_properties, properties = await asyncio.gather(
+                collection.count_documents(query),
+                page_cursor.to_list(length=limit),
+            )
+        request_log.info("Database query", extra={"query": query, "timings_ms": timer.phase_ms()})
+        # The explain runs on the slow-query worker thread, through motor's
+        # underlying pymongo collection
+        slow_query_log.observe(getattr(collection, "delegate", None), spec, timer, count_query=query,
+                               search_term=search_term, endpoint="get_properties")
+
+        response = build_properties_response(properties, total_properties, query, cursor, limit, fields)
+        if cache_key is not None:
+            await response_cache.set_async(cache_key, response)
+        return 200, without_debug_fields(response, args)
+    except (InvalidCursorError, InvalidPaginationError, InvalidGeoQueryError, InvalidProjectionError) as e:
+        return 400, {"error": str(e)}
+    except Exception as e:
+        logger.exception("get_properties failed")
+        return 500, {"error": str(e)}
+
+
+def _query_args(scope):
+    # Like request.args.get(): first value of each parameter, blanks kept
+    parsed = parse_qs(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)
+    return {key: values[0] for key, values in parsed.items()}
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _send_json(send, status, body, headers=CORS_HEADERS, include_body=True, accept_encoding=None,
+                     timer=None):
+    # Same serializer and compression as the Flask app
+    timer = timer or RequestTimer("unknown")
+    with timer.phase("serialize"):
+        payload = dumps(body)
+    with timer.phase("compress"):
+        payload, encoding = compress(payload, accept_encoding, COMPRESS_MIN_SIZE)
+    response_headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(payload)).encode()),
+        (b"vary", b"Accept-Encoding"),
+    ]
+    if encoding:
+        response_headers.append((b"content-encoding", encoding.encode()))
+    response_headers.append((b"server-timing", timer.finish(status).encode()))
+    request_id = get_request_id()
+    if request_id:
+        response_headers.append((b"x-request-id", request_id.encode()))
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": response_headers + headers,
+    })
+    await send({"type": "http.response.body", "body": payload if include_body else b""})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await bootstrap_indexes()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    await bootstrap_indexes()
+
+    path = scope["path"].rstrip("/")
+    if path == "/metrics":
+        body = REGISTRY.render().encode()
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", CONTENT_TYPE.encode()), (b"content-length", str(len(body)).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+        return
+    if path != "/api/properties":
+        await _send_json(send, 404, {"error": "Not found"})
+        return
+    method = scope["method"]
+    if method == "OPTIONS":
+        await send({"type": "http.response.start", "status": 200, "headers": PREFLIGHT_HEADERS})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    if method not in ("GET", "HEAD"):
+        await _send_json(send, 405, {"error": "Method not allowed"})
+        return
+
+    # Each request runs in its own task, so the ID doesn't leak into the next one
+    set_request_id(new_request_id(_header(scope, b"x-request-id")))
+    timer = RequestTimer("get_properties")
+    status, body = await get_properties(_query_args(scope), timer)
+    await _send_json(send, status, body, include_body=method == "GET",
+                     accept_encoding=_header(scope, b"accept-encoding"), timer=timer)
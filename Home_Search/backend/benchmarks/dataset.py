@@ -0,0 +1,129 @@
+import random
+from datetime import datetime, timedelta
+from index_manager import ensure_indexes
+from normalization import normalize_listing
+
+# Deterministic synthetic daft listings: the display strings the scraper
+# stores plus the typed fields normalize_listing derives from them, so
+# queries see the same document shape as production.
+
+DEFAULT_SIZE = 100000
+DEFAULT_SEED = 1234
+INSERT_BATCH_SIZE = 5000
+
+# (county, share of listings, [(area, lat, lng), ...])
+REGIONS = [
+    ("Dublin", 0.38, [
+        ("Ranelagh, Dublin 6", 53.3260, -6.2560), ("Rathmines, Dublin 6", 53.3220, -6.2650),
+        ("Clontarf, Dublin 3", 53.3640, -6.2040), ("Tallaght, Dublin 24", 53.2860, -6.3730),
+        ("Swords, Co. Dublin", 53.4600, -6.2180), ("Dun Laoghaire, Co. Dublin", 53.2940, -6.1340),
+        ("Lucan, Co. Dublin", 53.3570, -6.4490), ("Drumcondra, Dublin 9", 53.3700, -6.2550),
+    ]),
+    ("Cork", 0.14, [
+        ("Ballincollig, Co. Cork", 51.8880, -8.5890), ("Douglas, Co. Cork", 51.8770, -8.4360),
+        ("Kinsale, Co. Cork", 51.7060, -8.5220), ("Mallow, Co. Cork", 52.1340, -8.6450),
+    ]),
+    ("Galway", 0.08, [("Salthill, Co. Galway", 53.2610, -9.0790), ("Oranmore, Co. Galway", 53.2680, -8.9280)]),
+    ("Kildare", 0.08, [("Naas, Co. Kildare", 53.2160, -6.6660), ("Maynooth, Co. Kildare", 53.3810, -6.5920)]),
+    ("Meath", 0.07, [("Navan, Co. Meath", 53.6520, -6.6810), ("Ratoath, Co. Meath", 53.5060, -6.4640)]),
+    ("Wicklow", 0.06, [("Bray, Co. Wicklow", 53.2030, -6.0980), ("Greystones, Co. Wicklow", 53.1440, -6.0630)]),
+    ("Limerick", 0.06, [("Castletroy, Co. Limerick", 52.6680, -8.5500)]),
+    ("Louth", 0.05, [("Drogheda, Co. Louth", 53.7180, -6.3560), ("Dundalk, Co. Louth", 54.0000, -6.4050)]),
+    ("Wexford", 0.04, [("Gorey, Co. Wexford", 52.6750, -6.2930)]),
+    ("Donegal", 0.04, [("Letterkenny, Co. Donegal", 54.9500, -7.7330)]),
+]
+COUNTY_PRICE_FACTOR = {"Dublin": 1.6, "Wicklow": 1.35, "Kildare": 1.2, "Cork": 1.1, "Galway": 1.1}
+
+STREETS = [
+    "Main Street", "Church Road", "Park Avenue", "The Crescent", "Oak Drive", "Mill Lane",
+    "Castle View", "Seafield Road", "Beechwood Close", "Orchard Grove", "Station Road", "Harbour Walk",
+]
+
+# (property_type, share, bedroom range, base price)
+PROPERTY_TYPES = [
+    ("Semi-Detached", 0.27, (2, 5), 340000),
+    ("Terraced", 0.18, (2, 4), 290000),
+    ("Detached", 0.17, (3, 6), 450000),
+    ("Apartment", 0.22, (1, 3), 260000),
+    ("Bungalow", 0.07, (2, 4), 320000),
+    ("End of Terrace", 0.05, (2, 4), 300000),
+    ("Site", 0.04, (0, 0), 120000),
+]
+
+FEATURES = [
+    "Garden", "Private parking", "Off-street parking", "Gas fired central heating", "Double glazed windows",
+    "South facing rear garden", "Sea views", "Balcony", "Garage", "Walk-in wardrobe", "Solar panels",
+    "Heat pump", "Alarm", "Close to schools", "Close to public transport", "Attic storage",
+]
+
+DESCRIPTION_SENTENCES = [
+    "An exceptional family home in a much sought after location.",
+    "The property has been extensively refurbished by the current owners.",
+    "Accommodation comprises an entrance hall, living room, kitchen/dining room and utility.",
+    "Upstairs there are {beds} bedrooms, one en suite, and a family bathroom.",
+    "To the rear is a private garden laid mainly in lawn with a patio area.",
+    "Located within walking distance of shops, schools and the local park.",
+    "Excellent transport links with the bus and rail a short stroll away.",
+    "Viewing is highly recommended to appreciate the space on offer.",
+    "The apartment enjoys bright, well proportioned rooms throughout.",
+    "Ample off-street parking to the front behind electric gates.",
+]
+
+BER_RATINGS = ["A2", "A3", "B1", "B2", "B3", "C1", "C2", "C3", "D1", "D2", "E1", "E2", "F", "G"]
+MAP_LINK = "https://www.google.com/maps/@?api=1&map_action=pano&viewpoint={lat:.5f},{lng:.5f}"
+FIRST_LISTED = datetime(2023, 1, 1)
+
+
+def _weighted(rng, options, weight_index=1):
+    return rng.choices(options, weights=[option[weight_index] for option in options])[0]
+
+
+def synthetic_listing(rng, number):
+    """One listing as the scraper would store it (display strings plus normalized fields)."""
+    county, _, areas = _weighted(rng, REGIONS)
+    area, lat, lng = rng.choice(areas)
+    property_type, _, (min_beds, max_beds), base_price = _weighted(rng, PROPERTY_TYPES)
+
+    beds = rng.randint(min_beds, max_beds)
+    baths = max(1, beds - rng.randint(0, 2)) if beds else 0
+    floor_area = 25 + beds * rng.randint(18, 32) if beds else 0
+    price = base_price * COUNTY_PRICE_FACTOR.get(county, 0.9) * (1 + 0.12 * (beds - 3)) * rng.uniform(0.75, 1.3)
+
+    details = {
+        "address": f"{rng.randint(1, 250)} {rng.choice(STREETS)}, {area}",
+        "price": "Price on Application" if rng.random() < 0.03 else f"€{round(price, -3):,.0f}",
+        "bedrooms": f"{beds} Bed" if beds else "Beds not available.",
+        "bathrooms": f"{baths} Bath" if baths else "Baths not available.",
+        "area": f"{floor_area} m²" if floor_area else "Floor area not available.",
+        "property_type": property_type,
+        "description": " ".join(rng.sample(DESCRIPTION_SENTENCES, rng.randint(3, 6))).format(beds=beds),
+        "features": rng.sample(FEATURES, rng.randint(2, 7)),
+        "map_link": MAP_LINK.format(lat=lat + rng.uniform(-0.02, 0.02), lng=lng + rng.uniform(-0.02, 0.02)),
+        "link": f"https://www.daft.ie/for-sale/{property_type.lower().replace(' ', '-')}/{5000000 + number}",
+        "ber_rating": "BER Exempt" if property_type == "Site" else f"BER {rng.choice(BER_RATINGS)}",
+        "date_entered": (FIRST_LISTED + timedelta(days=rng.randint(0, 540))).strftime("%d/%m/%Y"),
+    }
+    details.update(normalize_listing(details))
+    return details
+
+
+def synthetic_listings(size=DEFAULT_SIZE, seed=DEFAULT_SEED):
+    """`size` listings; the same seed always yields the same documents."""
+    rng = random.Random(seed)
+    for number in range(size):
+        yield synthetic_listing(rng, number)
+
+
+def seed_collection(collection, size=DEFAULT_SIZE, seed=DEFAULT_SEED):
+    """Replace the collection's contents with the synthetic dataset and create the declared indexes."""
+    collection.drop()
+    batch = []
+    for listing in synthetic_listings(size, seed):
+        batch.append(listing)
+        if len(batch) == INSERT_BATCH_SIZE:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+    ensure_indexes(collection)
+    return collection.count_documents({})
@@ -0,0 +1,336 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import platform
+import re
+import statistics
+import time
+from functools import partial
+from urllib.parse import urlencode
+from unittest.mock import patch
+
+from benchmarks.dataset import DEFAULT_SEED, DEFAULT_SIZE, seed_collection
+import app as app_module
+import database_utils
+import daft_property_details_scraper
+from daft_property_details_scraper import scrape_daft_details
+from query_planner import QueryPlanner, has_text_search
+from routes import filter_properties as filter_route
+
+# Offline performance suite: times the search parsing, the API read path,
+# the filter helpers and detail page parsing, and compares the medians with
+# the committed baselines.json. Run from backend/:
+#
+#   python -m benchmarks.run_benchmarks                    # compare with the baselines
+#   python -m benchmarks.run_benchmarks --update-baseline  # record new baselines
+#   python -m benchmarks.run_benchmarks --mongo-uri mongodb://localhost:27017
+#
+# Without --mongo-uri the dataset lives in mongomock, which scans in Python:
+# its numbers track our code's overhead, not Mongo's. $text queries are only
+# run against a real mongod (mongomock has no text search).
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+QUERIES_FILE = os.path.join(BENCHMARKS_DIR, "queries.txt")
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, "fixtures")
+BASELINES_FILE = os.path.join(BENCHMARKS_DIR, "baselines.json")
+
+# A benchmark regresses when its median exceeds baseline * threshold (after
+# scaling by the machine calibration); per-benchmark thresholds in
+# baselines.json override this
+DEFAULT_THRESHOLD = 1.5
+
+# Queries sent to the database benchmarks (a spread sample of the corpus)
+DB_QUERY_COUNT = 10
+
+BENCH_DATABASE = "home_search_bench"
+BENCH_COLLECTION = "daft"
+
+PARSERS = ["html.parser", "lxml"]
+
+
+def load_queries(path=QUERIES_FILE):
+    """The chatbot query corpus: one search string per line, # comments skipped."""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def load_fixtures(directory=FIXTURES_DIR):
+    """Saved detail pages as {fake daft link: html bytes}."""
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.html"))):
+        with open(path, "rb") as f:
+            fixtures["https://www.daft.ie/for-sale/" + os.path.basename(path)] = f.read()
+    return fixtures
+
+
+def calibrate(repeat=5):
+    """
+    Milliseconds for a fixed pure-Python workload (best of `repeat`).
+    Baselines are scaled by current/recorded calibration so a slower
+    machine doesn't read as a regression.
+    """
+    pattern = re.compile(r"(\d+)\s*bed")
+    text = " ".join(f"house {i} bed garden" for i in range(2000))
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(20):
+            sorted(pattern.findall(text), key=int)
+            json.dumps({str(i): [i, str(i)] for i in range(500)})
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1000, 3)
+
+
+def measure(calls, rounds, warmup=1):
+    """Run every call `warmup` + `rounds` times; per-call timings of the measured rounds in ms."""
+    timings = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for round_number in range(warmup + rounds):
+            for call in calls:
+                start = time.perf_counter()
+                call()
+                elapsed = time.perf_counter() - start
+                if round_number >= warmup:
+                    timings.append(elapsed * 1000)
+    timings.sort()
+    return {
+        "calls": len(timings),
+        "median_ms": round(statistics.median(timings), 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        "mean_ms": round(statistics.fmean(timings), 4),
+    }
+
+
+# -----------------------------------------------------------------------------
+# Benchmarks: each returns the list of zero-argument calls making up one round
+# -----------------------------------------------------------------------------
+def bench_parse_cold(context):
+    # cache_size=0: every term is parsed from scratch
+    planner = QueryPlanner(cache_size=0)
+    return [partial(planner.plan, query) for query in context["queries"]]
+
+
+def bench_parse_warm(context):
+    # The app's planner, as a running server sees repeated refinements
+    return [partial(app_module.parse_search_query, query) for query in context["queries"]]
+
+
+def _get(client, url):
+    # Every request has to reach Mongo, not the response cache
+    app_module.response_cache.clear()
+    response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(f"{url} returned {response.status_code}: {response.get_data(as_text=True)}")
+
+
+def bench_get_properties(context):
+    client = app_module.app.test_client()
+    urls = ["/api/properties?" + urlencode({"searchTerm": query}) for query in context["db_queries"]]
+    urls += [
+        "/api/properties",
+        "/api/properties?page=50",
+        "/api/properties?cursor=",
+        "/api/properties?view=summary&searchTerm=" + context["db_queries"][0],
+    ]
+    return [partial(_get, client, url) for url in urls]
+
+
+def bench_filter_database_utils(context):
+    return [partial(database_utils.filter_properties, query) for query in context["db_queries"]]
+
+
+def bench_filter_route(context):
+    return [partial(filter_route.filter_properties, query) for query in context["db_queries"]]
+
+
+def _scrape(link, parser):
+    if scrape_daft_details(link, parser) is None:
+        raise RuntimeError(f"scrape_daft_details failed for {link}")
+
+
+def bench_scrape_details(parser, context):
+    return [partial(_scrape, link, parser) for link in context["fixtures"]]
+
+
+# name -> (benchmark, default rounds, uses the dataset)
+BENCHMARKS = {
+    "parse_search_query.cold": (bench_parse_cold, 50, False),
+    "parse_search_query.warm": (bench_parse_warm, 50, False),
+    "get_properties": (bench_get_properties, 3, True),
+    "filter_properties.database_utils": (bench_filter_database_utils, 3, True),
+    "filter_properties.routes": (bench_filter_route, 3, True),
+}
+for _parser in PARSERS:
+    BENCHMARKS[f"scrape_daft_details[{_parser}]"] = (partial(bench_scrape_details, _parser), 20, False)
+
+
+def parser_available(name):
+    if name == "html.parser":
+        return True
+    try:
+        __import__(name)
+        return True
+    except ImportError:
+        return False
+
+
+def _bench_collection(mongo_uri):
+    if mongo_uri:
+        from pymongo import MongoClient
+        return MongoClient(mongo_uri)[BENCH_DATABASE][BENCH_COLLECTION]
+    import mongomock
+    return mongomock.MongoClient()[BENCH_DATABASE][BENCH_COLLECTION]
+
+
+def selected_benchmarks(only=None):
+    names = [name for name in BENCHMARKS if not only or any(part in name for part in only)]
+    skipped = {}
+    for name in names:
+        parser = re.search(r"\[(.+)\]", name)
+        if parser and not parser_available(parser.group(1)):
+            skipped[name] = f"{parser.group(1)} is not installed"
+    return [name for name in names if name not in skipped], skipped
+
+
+def run_benchmarks(only=None, size=DEFAULT_SIZE, seed=DEFAULT_SEED, mongo_uri=None, rounds=None):
+    """
+    Run the selected benchmarks. Returns {"calibration_ms", "environment",
+    "dataset", "benchmarks": {name: stats}, "skipped": {name: reason}}.
+    """
+    names, skipped = selected_benchmarks(only)
+    queries = load_queries()
+    context = {"queries": queries, "fixtures": load_fixtures()}
+    fixture_pages = context["fixtures"]
+    dataset = None
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(patch.object(daft_property_details_scraper, "fetch_page",
+                                         side_effect=lambda link: fixture_pages[link]))
+
+        if any(BENCHMARKS[name][2] for name in names):
+            backend = "mongod" if mongo_uri else "mongomock"
+            collection = _bench_collection(mongo_uri)
+            print(f"Seeding {size} synthetic listings into {backend}...")
+            start = time.perf_counter()
+            seed_collection(collection, size, seed)
+            print(f"Seeded in {time.perf_counter() - start:.1f}s")
+            dataset = {"backend": backend, "size": size, "seed": seed}
+
+            step = max(1, len(queries) // DB_QUERY_COUNT)
+            db_queries = queries[::step][:DB_QUERY_COUNT]
+            if not mongo_uri:
+                db_queries = [q for q in db_queries if not has_text_search(QueryPlanner(cache_size=0).plan(q))]
+            context["db_queries"] = db_queries
+
+            for target in (app_module, database_utils, filter_route):
+                stack.enter_context(patch.object(target, "get_properties_collection", return_value=collection))
+
+        results = {}
+        for name in names:
+            benchmark, default_rounds, _ = BENCHMARKS[name]
+            results[name] = measure(benchmark(context), rounds or default_rounds)
+            print(f"{name:<40} median {results[name]['median_ms']:>10.3f} ms   p95 {results[name]['p95_ms']:>10.3f} ms")
+
+    return {
+        "calibration_ms": calibrate(),
+        "environment": {"python": platform.python_version(), "machine": platform.machine()},
+        "dataset": dataset,
+        "benchmarks": results,
+        "skipped": skipped,
+    }
+
+
+def compare_to_baseline(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    {name: (status, ratio)} with status "ok", "regression", "no baseline" or
+    "dataset differs". ratio is current median / calibrated baseline median.
+    """
+    scale = results["calibration_ms"] / baseline["calibration_ms"] if baseline.get("calibration_ms") else 1.0
+    report = {}
+    for name, stats in results["benchmarks"].items():
+        recorded = baseline.get("benchmarks", {}).get(name)
+        if recorded is None:
+            report[name] = ("no baseline", None)
+            continue
+        if BENCHMARKS.get(name, (None, None, False))[2] and results["dataset"] != baseline.get("dataset"):
+            report[name] = ("dataset differs", None)
+            continue
+        ratio = stats["median_ms"] / (recorded["median_ms"] * scale)
+        limit = recorded.get("threshold", threshold)
+        report[name] = ("regression" if ratio > limit else "ok", round(ratio, 2))
+    return report
+
+
+def load_baseline(path=BASELINES_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BASELINES_FILE, previous=None):
+    """Write the results as the new baseline, keeping hand-set per-benchmark thresholds."""
+    previous = previous or {}
+    benchmarks = {}
+    for name, stats in results["benchmarks"].items():
+        entry = {"median_ms": stats["median_ms"], "p95_ms": stats["p95_ms"]}
+        threshold = previous.get("benchmarks", {}).get(name, {}).get("threshold")
+        if threshold is not None:
+            entry["threshold"] = threshold
+        benchmarks[name] = entry
+    # A partial run (--only) keeps the other benchmarks' baselines
+    for name, entry in previous.get("benchmarks", {}).items():
+        benchmarks.setdefault(name, entry)
+
+    baseline = {
+        "calibration_ms": results["calibration_ms"],
+        "environment": results["environment"],
+        "dataset": results["dataset"] or previous.get("dataset"),
+        "benchmarks": dict(sorted(benchmarks.items())),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline performance benchmarks.")
+    parser.add_argument("--only", action="append", help="run benchmarks whose name contains this (repeatable)")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="synthetic listings to seed")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--mongo-uri", help=f"seed and query a real mongod (database {BENCH_DATABASE}, dropped first)")
+    parser.add_argument("--rounds", type=int, help="measured rounds per benchmark (default: per benchmark)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown factor where baselines.json sets none")
+    parser.add_argument("--baseline", default=BASELINES_FILE)
+    parser.add_argument("--update-baseline", action="store_true", help="record these results as the baseline")
+    parser.add_argument("--output", help="also write the raw results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.only, args.size, args.seed, args.mongo_uri, args.rounds)
+    for name, reason in results["skipped"].items():
+        print(f"{name:<40} skipped: {reason}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    baseline = load_baseline(args.baseline)
+    if args.update_baseline:
+        save_baseline(results, args.baseline, previous=baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    report = compare_to_baseline(results, baseline, args.threshold)
+    for name, (status, ratio) in report.items():
+        print(f"{name:<40} {status}" + (f" ({ratio}x baseline)" if ratio is not None else ""))
+    regressions = [name for name, (status, _) in report.items() if status == "regression"]
+    if regressions:
+        print(f"Regressed: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,117 @@
+import atexit
+import logging
+import threading
+import time
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+
+class BulkUpsertWriter:
+    """
+    Buffers upserts and writes them as unordered bulk_write batches, flushed
+    when `batch_size` operations are queued or the oldest queued operation is
+    `flush_interval` seconds old. Whatever is still buffered is flushed on
+    close(), on leaving a `with` block, or at interpreter exit.
+
+    Every flushed batch is recorded in `batches` with its inserted, modified,
+    matched and failed counts; `totals` sums them.
+    """
+
+    def __init__(self, collection, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._ops = []
+        self._oldest_op_at = None
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        self.batches = []
+        self.totals = {"operations": 0, "inserted": 0, "modified": 0, "matched": 0, "failed": 0}
+
+        # Time-based flushing while the producer is busy elsewhere (e.g. fetching pages)
+        self._closed = threading.Event()
+        self._timer = None
+        if flush_interval:
+            self._timer = threading.Thread(target=self._flush_periodically, daemon=True)
+            self._timer.start()
+        atexit.register(self.flush)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def upsert(self, filter, update):
+        """Queue an upsert; flushes immediately once the batch is full or too old."""
+        with self._buffer_lock:
+            self._ops.append(UpdateOne(filter, update, upsert=True))
+            if self._oldest_op_at is None:
+                self._oldest_op_at = time.monotonic()
+            due = len(self._ops) >= self.batch_size or self._is_stale()
+        if due:
+            self.flush()
+
+    def _is_stale(self):
+        return (self.flush_interval and self._oldest_op_at is not None
+                and time.monotonic() - self._oldest_op_at >= self.flush_interval)
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval / 2):
+            with self._buffer_lock:
+                due = self._is_stale()
+            if due:
+                self.flush()
+
+    def flush(self):
+        """Write everything buffered so far as one unordered batch. Returns the batch stats (or None)."""
+        with self._flush_lock:
+            with self._buffer_lock:
+                ops, self._ops = self._ops, []
+                self._oldest_op_at = None
+            if not ops:
+                return None
+
+            stats = {"operations": len(ops), "inserted": 0, "modified": 0, "matched": 0, "failed": 0}
+            try:
+                result = self.collection.bulk_write(ops, ordered=False)
+                stats.update(
+                    inserted=result.upserted_count,
+                    modified=result.modified_count,
+                    matched=result.matched_count,
+                )
+            except BulkWriteError as e:
+                # Unordered: everything except the reported writeErrors was applied
+                details = e.details
+                stats.update(
+                    inserted=details.get("nUpserted", 0),
+                    modified=details.get("nModified", 0),
+                    matched=details.get("nMatched", 0),
+                    failed=len(details.get("writeErrors", [])),
+                )
+                logger.warning("Bulk write batch had %d failed operations: %s",
+                               stats['failed'], details.get('writeErrors', [])[:3])
+            except PyMongoError as e:
+                stats["failed"] = len(ops)
+                logger.error("Bulk write batch of %d operations failed: %s", len(ops), e)
+
+            self.batches.append(stats)
+            for key, value in stats.items():
+                self.totals[key] += value
+            logger.debug("Flushed bulk write batch", extra={"batch": stats})
+            return stats
+
+    def close(self):
+        """Stop the timer and flush whatever is still buffered."""
+        self._closed.set()
+        if self._timer is not None:
+            self._timer.join()
+        self.flush()
+        atexit.unregister(self.flush)
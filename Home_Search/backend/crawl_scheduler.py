@@ -0,0 +1,278 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Per-host request rate (requests/second) and concurrency start low, grow
+# while the site answers quickly and are halved on 429/5xx or network
+# errors (AIMD, as in TCP congestion control).
+DEFAULT_RATE = 2.0
+DEFAULT_MIN_RATE = 0.2
+DEFAULT_MAX_RATE = 4.0
+DEFAULT_INITIAL_CONCURRENCY = 2
+DEFAULT_MAX_CONCURRENCY = 4
+# Responses slower than this don't count towards speeding up
+DEFAULT_TARGET_LATENCY = 1.0
+DEFAULT_DECREASE_FACTOR = 0.5
+# At most one decrease per host in this many seconds, so a burst of
+# failures from requests already in flight counts as one signal
+DEFAULT_DECREASE_COOLDOWN = 2.0
+
+# Retry queue: attempt n waits about base * 2**(n-1) seconds (capped), with jitter
+DEFAULT_RETRY_BASE_DELAY = 5.0
+DEFAULT_RETRY_MAX_DELAY = 300.0
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Statuses that mean "slow down"; other 4xx are answers about the URL itself
+CONGESTION_STATUSES = (429, 500, 502, 503, 504)
+
+
+def is_congestion(status):
+    """True for throttling/overload responses; None is a network error or timeout."""
+    return status is None or status in CONGESTION_STATUSES or status >= 500
+
+
+def is_retryable_error(error):
+    """Whether a failed fetch is worth another attempt later (network errors, 429, 5xx)."""
+    if isinstance(error, FetchFailed):
+        return is_congestion(error.status)
+    if isinstance(error, requests.RequestException):
+        response = getattr(error, "response", None)
+        return is_congestion(response.status_code if response is not None else None)
+    return False
+
+
+class FetchFailed(Exception):
+    """A page came back empty; `status` is the last HTTP status seen for it (None if unknown)."""
+
+    def __init__(self, url, status=None):
+        super().__init__(f"Fetching {url} failed" + (f" with HTTP {status}" if status is not None else ""))
+        self.url = url
+        self.status = status
+
+
+class TokenBucket:
+    """
+    `rate` tokens per second, up to `capacity` saved for bursts. reserve()
+    books the next token and returns how long to wait for it, so callers
+    queue up fairly instead of polling.
+    """
+
+    def __init__(self, rate, capacity=1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def pause(self, seconds):
+        """No token for the next `seconds` (e.g. a Retry-After)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class AimdLimit:
+    """A limit that grows by `increase` per `value` successes and is multiplied by `decrease` on congestion."""
+
+    def __init__(self, value, minimum, maximum, increase=1.0, decrease=DEFAULT_DECREASE_FACTOR):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.value = min(max(value, minimum), maximum)
+
+    def on_success(self):
+        self.value = min(self.maximum, self.value + self.increase / self.value)
+
+    def on_congestion(self):
+        self.value = max(self.minimum, self.value * self.decrease)
+
+
+class CrawlAttempt:
+    """Yielded by CrawlScheduler.slot(); `status` is the last HTTP status seen for the URL in the block."""
+
+    def __init__(self, url):
+        self.url = url
+        self.status = None
+
+
+class _HostState:
+    def __init__(self, scheduler):
+        self.rate = AimdLimit(scheduler.initial_rate, scheduler.min_rate, scheduler.max_rate,
+                              increase=scheduler.rate_increase, decrease=scheduler.decrease_factor)
+        self.concurrency = AimdLimit(scheduler.initial_concurrency, 1, scheduler.max_concurrency,
+                                     decrease=scheduler.decrease_factor)
+        self.bucket = TokenBucket(self.rate.value)
+        self.in_flight = 0
+        self.last_decrease = float("-inf")
+        self.responses = 0
+        self.congested = 0
+        self.condition = threading.Condition()
+
+
+class CrawlScheduler:
+    """
+    Adaptive per-host politeness for the crawler. slot(url) waits for a
+    free request slot (AIMD concurrency limit) and a token (AIMD rate);
+    observe() is registered with the HTTP client and adjusts both from each
+    response: a fast 2xx/3xx raises them a little, a 429/5xx or network
+    error halves them (at most once per `decrease_cooldown`), and a
+    Retry-After pauses the host.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE,
+                 concurrency=DEFAULT_INITIAL_CONCURRENCY, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 target_latency=DEFAULT_TARGET_LATENCY, rate_increase=0.5,
+                 decrease_factor=DEFAULT_DECREASE_FACTOR, decrease_cooldown=DEFAULT_DECREASE_COOLDOWN):
+        self.initial_rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.initial_concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.rate_increase = rate_increase
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._local = threading.local()
+
+    def _host(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = _HostState(self)
+            return self._hosts[host]
+
+    @contextmanager
+    def slot(self, url):
+        """Hold a request slot for the URL's host for the duration of the block."""
+        state = self._host(url)
+        with state.condition:
+            while state.in_flight >= int(state.concurrency.value):
+                state.condition.wait()
+            state.in_flight += 1
+        attempt = CrawlAttempt(url)
+        try:
+            delay = state.bucket.reserve()
+            if delay > 0:
+                time.sleep(delay)
+            self._local.attempt = attempt
+            yield attempt
+        finally:
+            self._local.attempt = None
+            with state.condition:
+                state.in_flight -= 1
+                state.condition.notify_all()
+
+    def observe(self, url, status, seconds, retry_after=None):
+        """HttpClient observer: adapt the host's rate and concurrency to one response."""
+        attempt = getattr(self._local, "attempt", None)
+        if attempt is not None and attempt.url == url:
+            attempt.status = status
+
+        state = self._host(url)
+        with state.condition:
+            state.responses += 1
+            if is_congestion(status):
+                state.congested += 1
+                now = time.monotonic()
+                if now - state.last_decrease >= self.decrease_cooldown:
+                    state.last_decrease = now
+                    state.rate.on_congestion()
+                    state.concurrency.on_congestion()
+                    state.bucket.set_rate(state.rate.value)
+                    logger.warning("Backing off %s after %s: %.2f requests/s, %d at a time",
+                                   urlsplit(url).netloc, status or "a network error",
+                                   state.rate.value, int(state.concurrency.value))
+            elif status < 400 and seconds is not None and seconds <= self.target_latency:
+                state.rate.on_success()
+                state.concurrency.on_success()
+                state.bucket.set_rate(state.rate.value)
+                # A raised concurrency limit may let a waiting request in
+                state.condition.notify_all()
+        if retry_after:
+            state.bucket.pause(retry_after)
+
+    def stats(self):
+        """Current rate, concurrency and response counts per host."""
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {
+            host: {
+                "rate": round(state.rate.value, 3),
+                "concurrency": int(state.concurrency.value),
+                "responses": state.responses,
+                "congested": state.congested,
+            }
+            for host, state in hosts.items()
+        }
+
+
+class RetryQueue:
+    """
+    Failed work waiting for another attempt. Attempt n+1 becomes due about
+    base_delay * 2**(n-1) seconds (at most max_delay, jittered) after
+    attempt n failed; push() refuses items that used up `max_attempts`.
+    """
+
+    def __init__(self, base_delay=DEFAULT_RETRY_BASE_DELAY, max_delay=DEFAULT_RETRY_MAX_DELAY,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self._heap = []
+        self._order = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        # Jitter keeps retries of one failed burst from arriving together
+        return delay * random.uniform(0.5, 1.0)
+
+    def push(self, item, attempt):
+        """Schedule attempt `attempt + 1` of `item`; False if it already had max_attempts."""
+        if attempt >= self.max_attempts:
+            return False
+        due = time.monotonic() + self.backoff(attempt)
+        heapq.heappush(self._heap, (due, next(self._order), item, attempt + 1))
+        return True
+
+    def pop_due(self):
+        """[(item, attempt number)] of everything whose backoff has elapsed."""
+        now = time.monotonic()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, item, attempt = heapq.heappop(self._heap)
+            due.append((item, attempt))
+        return due
+
+    def time_until_next(self):
+        if not self._heap:
+            return 0.0
+        return max(0.0, self._heap[0][0] - time.monotonic())
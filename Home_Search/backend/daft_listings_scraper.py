@@ -1,91 +1,364 @@
-import urllib.request
 from bs4 import BeautifulSoup
 from daft_property_details_scraper import scrape_daft_details
-from database_utils import get_properties_collection
+from database_utils import bump_data_generation, get_properties_collection
+from concurrent.futures import ThreadPoolExecutor
+from bulk_writer import DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL, BulkUpsertWriter
+from crawl_scheduler import (
+    DEFAULT_INITIAL_CONCURRENCY,
+    DEFAULT_MAX_RATE,
+    DEFAULT_RATE,
+    CrawlScheduler,
+    FetchFailed,
+    RetryQueue,
+    is_retryable_error,
+)
+from host_limiter import HostLimiter
+from http_session import fetch_page, get_http_client
+from daft_next_data import extract_next_data_listings, listing_to_details
+from facets import precompute_facets
+from normalization import normalize_listing
+from structured_logging import configure_logging
+import hashlib
+import json
+import logging
 import time
-import re 
 
-properties_collection = get_properties_collection('daft')
+logger = logging.getLogger(__name__)
 
-def scrape_daft_listings(base_url, max_page_index=12740):
-    page_index = 0
-    has_properties = True
+# Looked up on use (see get_listings_collection) so importing the scraper doesn't connect;
+# set it to write somewhere other than the 'daft' collection
+properties_collection = None
 
-    while has_properties and page_index <= max_page_index:
-        url = base_url.format(page_index)
-        req = urllib.request.Request(
-            url,
-            headers={'User-Agent': "Brave/1.49.120"}
-        )
+# Detail pages fetched in parallel per listing page, and politeness towards daft.ie
+# (ceilings for the crawl scheduler's adaptive concurrency and rate)
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_PER_HOST = 4
+DEFAULT_MIN_HOST_INTERVAL = 0.25
 
-        try:
-            resp = urllib.request.urlopen(req)
-            content = resp.read()
-            soup = BeautifulSoup(content, 'html.parser')
+# Results pages failing in a row before the crawl stops starting new ones
+DEFAULT_MAX_FAILED_PAGES = 5
 
-            # Adjust this selector if Daft changes their classes
-            properties = soup.find_all('a', class_='sc-b457dee4-17 kUElAW')
+# Incremental mode: stop after this many consecutive pages with nothing new or changed
+DEFAULT_KNOWN_PAGES_STOP = 3
+
+# How listings are read off a search results page
+EXTRACTION_JSON = 'json'  # embedded __NEXT_DATA__; detail page only if fields are missing
+EXTRACTION_DOM = 'dom'    # listing anchors; detail page for every listing
+
+# Only on the detail page: the search JSON never carries them
+DETAIL_ONLY_FIELDS = ('description', 'features')
+
+# JSON mode skips a listing's detail page when the search page already gives all of these
+# (detail-only fields also count as given when the stored document has them)
+JSON_REQUIRED_FIELDS = ('address', 'price', 'bedrooms', 'bathrooms', 'property_type') + DETAIL_ONLY_FIELDS
+
+
+def get_listings_collection():
+    if properties_collection is not None:
+        return properties_collection
+    return get_properties_collection('daft')
+
+
+def card_fingerprint(card):
+    """Hash of the listing card shown on the search page (price, address, beds... as displayed)."""
+    text = " ".join(card.get_text(" ", strip=True).split())
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def details_fingerprint(details):
+    """Hash of the listing fields taken from the search page's embedded JSON."""
+    return hashlib.sha1(json.dumps(details, sort_keys=True).encode('utf-8')).hexdigest()
 
-            if not properties:
-                print('No more properties found. Stopping scraping.')
-                has_properties = False
-                break
 
-            for prop in properties:
-                try:
-                    link = prop.get('href')
-                    if not link:
-                        print("Property link not found in the property listing.")
-                        continue
-
-                    # Convert relative URL
-                    if not link.startswith('http'):
-                        link = 'https://www.daft.ie' + link
-
-                    # Fetch property details (strings, etc.)
-                    details = scrape_daft_details(link)
-                    if details:
-                        # ----------------------------------------------
-                        # 1) Parse numeric price
-                        # ----------------------------------------------
-                        price_str = details.get('price', '')  # e.g. "€695,000"
-                        digits = re.sub(r'[^\d]', '', price_str)  # => "695000"
-                        if digits.isdigit():
-                            details['price_numeric'] = int(digits)
-                        else:
-                            details['price_numeric'] = None
-
-                        # ----------------------------------------------
-                        # 2) Parse numeric bedrooms
-                        # ----------------------------------------------
-                        beds_str = details.get('bedrooms', '')  # e.g. "3 Bed"
-                        bed_match = re.search(r'(\d+)', beds_str)
-                        if bed_match:
-                            details['bedrooms_numeric'] = int(bed_match.group(1))
-                        else:
-                            details['bedrooms_numeric'] = None
-
-                        # ----------------------------------------------
-                        # 3) Now upsert into MongoDB
-                        # ----------------------------------------------
-                        properties_collection.update_one(
-                            {'link': link},
-                            {'$set': details},
-                            upsert=True
-                        )
-                        print(f"Scraped property at address: {details['address']}")
-                except AttributeError as e:
-                    print(f"Error processing a property listing: {e}")
+def extract_listing_cards(content, extraction=EXTRACTION_JSON):
+    """
+    The listing cards on one search results page, as dicts with the listing's
+    link, a card_hash fingerprint and the details already known from the page.
+
+    In JSON mode the cards come from the embedded __NEXT_DATA__ blob with their
+    structured fields; pages without a usable blob fall back to DOM scraping,
+    where only the link is known.
+    """
+    if extraction == EXTRACTION_JSON:
+        listings = extract_next_data_listings(content)
+        if listings is not None:
+            cards = []
+            for listing in listings:
+                details = listing_to_details(listing)
+                if not details:
+                    logger.warning("Property link not found in the property listing.")
                     continue
+                cards.append({'link': details['link'], 'card_hash': details_fingerprint(details), 'details': details})
+            return cards
+
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Adjust this selector if Daft changes their classes
+    cards = []
+    for prop in soup.find_all('a', class_='sc-b457dee4-17 kUElAW'):
+        link = prop.get('href')
+        if not link:
+            logger.warning("Property link not found in the property listing.")
+            continue
+
+        # Convert relative URL
+        if not link.startswith('http'):
+            link = 'https://www.daft.ie' + link
+        cards.append({'link': link, 'card_hash': card_fingerprint(prop), 'details': {}})
+    return cards
+
+
+def merge_details(page_details, card_details):
+    """Detail-page fields, with gaps (missing or "... not available.") filled from the search card."""
+    merged = dict(page_details)
+    for key, value in card_details.items():
+        current = merged.get(key)
+        if current in (None, '', []) or (isinstance(current, str) and current.endswith('not available.')):
+            merged[key] = value
+    return merged
+
+
+def known_card_hashes(links):
+    """card_hash currently stored for each of the given links that is already in Mongo."""
+    cursor = get_listings_collection().find({'link': {'$in': links}}, {'_id': 0, 'link': 1, 'card_hash': 1})
+    return {doc['link']: doc.get('card_hash') for doc in cursor}
+
+
+def stored_detail_fields(links):
+    """Which DETAIL_ONLY_FIELDS the stored document of each given link (already in Mongo) has."""
+    projection = dict.fromkeys(('link',) + DETAIL_ONLY_FIELDS, 1)
+    projection['_id'] = 0
+    cursor = get_listings_collection().find({'link': {'$in': links}}, projection)
+    return {doc['link']: {field for field in DETAIL_ONLY_FIELDS if field in doc} for doc in cursor}
+
+
+def missing_fields(card, required_fields):
+    """The required fields the card doesn't carry."""
+    return {field for field in required_fields if field not in card['details']}
+
 
-            print(f'Page starting from index {page_index} scraped successfully.')
-            page_index += 20  # Next page
-            time.sleep(1)     # Optional delay
+def fetch_listing_details(links, executor=None, limiter=None):
+    """
+    Fetch the detail pages for one page of listings.
+    With an executor the downloads run in parallel (bounded by the executor's
+    workers and the limiter, a CrawlScheduler or HostLimiter); either way the
+    result is a list of (link, details_or_None, error_or_None) in the same
+    order as `links`. A page that came back empty is a FetchFailed error
+    carrying the HTTP status the scheduler saw for it.
+    """
+    limiter = limiter or HostLimiter(DEFAULT_MAX_PER_HOST, DEFAULT_MIN_HOST_INTERVAL)
 
+    def fetch(link):
+        with limiter.slot(link) as attempt:
+            try:
+                details = scrape_daft_details(link)
+            except Exception as e:
+                return None, e
+        if not details:
+            return None, FetchFailed(link, getattr(attempt, 'status', None))
+        return details, None
+
+    if executor is None:
+        results = [fetch(link) for link in links]
+    else:
+        results = list(executor.map(fetch, links))
+    return [(link, details, error) for link, (details, error) in zip(links, results)]
+
+
+def store_listing(writer, card, details):
+    """Queue the upsert of one listing (typed fields and card_hash added)."""
+    # ----------------------------------------------
+    # 1) Typed fields (price_numeric, bedrooms_numeric,
+    #    bathrooms_numeric, area_sqm, ber_ordinal,
+    #    date_entered_at, county, location)
+    # ----------------------------------------------
+    details.update(normalize_listing(details))
+
+    # Remember what the card looked like for incremental runs
+    details['card_hash'] = card['card_hash']
+
+    # ----------------------------------------------
+    # 2) Now queue the upsert into MongoDB
+    # ----------------------------------------------
+    writer.upsert({'link': card['link']}, {'$set': details})
+    logger.debug("Scraped property", extra={"address": details.get('address'), "link": card['link']})
+
+
+def schedule_retry(retries, item, attempt, error, what):
+    """Put failed work back on the retry queue; False (and logged) when it is given up."""
+    if is_retryable_error(error) and retries.push(item, attempt):
+        logger.warning("Error fetching %s (attempt %d), will retry: %s", what, attempt, error)
+        return True
+    logger.error("Giving up on %s after %d attempt(s): %s", what, attempt, error)
+    return False
+
+
+def scrape_daft_listings(base_url, max_page_index=12740, concurrency=DEFAULT_CONCURRENCY,
+                         max_per_host=DEFAULT_MAX_PER_HOST, min_host_interval=DEFAULT_MIN_HOST_INTERVAL,
+                         batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                         incremental=False, stop_after_known_pages=DEFAULT_KNOWN_PAGES_STOP,
+                         extraction=EXTRACTION_JSON, required_fields=JSON_REQUIRED_FIELDS,
+                         scheduler=None, retries=None, max_failed_pages=DEFAULT_MAX_FAILED_PAGES):
+    """
+    Crawl the Daft search results and upsert every listing's details.
+    Detail pages of each results page are downloaded `concurrency` at a time
+    (1 = sequential) while results are stored in listing order.
+    Upserts are buffered and written in unordered bulk_write batches of
+    `batch_size` (or every `flush_interval` seconds); returns the writer's totals.
+
+    Requests are paced by a CrawlScheduler: an adaptive per-host rate (at
+    most one request per `min_host_interval`) and concurrency (at most
+    `max_per_host`) that back off on 429/5xx and speed up on fast answers.
+    Results pages and detail pages that fail with a network error, 429 or
+    5xx go on the `retries` queue with exponential backoff; other errors
+    drop the listing, or end the crawl for a results page. After
+    `max_failed_pages` results pages in a row fail, no new pages are
+    started and only the queued retries are worked off.
+
+    With incremental=True, each card on the results page is fingerprinted and
+    compared with the card_hash stored in Mongo; only new or changed listings
+    get their detail page fetched. Since results are newest first, the crawl
+    stops after `stop_after_known_pages` consecutive pages with nothing new.
+
+    With extraction='json' (default) the structured fields of all listings on
+    a page come from its embedded JSON in one request, and a detail page is
+    only fetched for listings missing any of `required_fields`. Description
+    and features are never in the JSON, so they come from the detail page
+    the first time a listing is seen and are kept from the stored document
+    afterwards. Detail-page values win over the JSON ones.
+    extraction='dom' fetches every detail page.
+    """
+    page_index = 0
+    more_pages = True
+    known_pages_in_a_row = 0
+    failed_pages_in_a_row = 0
+    if scheduler is None:
+        max_rate = 1 / min_host_interval if min_host_interval > 0 else DEFAULT_MAX_RATE
+        scheduler = CrawlScheduler(rate=min(DEFAULT_RATE, max_rate), max_rate=max_rate,
+                                   concurrency=min(DEFAULT_INITIAL_CONCURRENCY, max_per_host),
+                                   max_concurrency=max_per_host)
+    retries = retries if retries is not None else RetryQueue()
+    http_client = get_http_client()
+    # The scheduler and the retry queue do the backing off; urllib3 retrying
+    # 429/5xx as well would stack a second backoff on top
+    client_retries = http_client.retries
+    http_client.set_retries(0)
+    http_client.add_observer(scheduler.observe)
+    executor = ThreadPoolExecutor(max_workers=concurrency) if concurrency > 1 else None
+    writer = BulkUpsertWriter(get_listings_collection(), batch_size, flush_interval)
+
+    def fetch_and_store(cards):
+        """Fetch what `cards` [(card, attempt)] still miss and store them; failures go on the retry queue."""
+        # Skip detail pages for listings whose card (or stored document, for
+        # description/features) already carries every required field
+        missing = {card['link']: missing_fields(card, required_fields) for card, _ in cards}
+        only_detail = [link for link, fields in missing.items() if fields and fields <= set(DETAIL_ONLY_FIELDS)]
+        stored = stored_detail_fields(only_detail) if only_detail else {}
+        to_fetch = [link for link, fields in missing.items() if fields - stored.get(link, set())]
+        fetched = {
+            link: (details, error)
+            for link, details, error in fetch_listing_details(to_fetch, executor, scheduler)
+        }
+
+        for card, attempt in cards:
+            link = card['link']
+            details = dict(card['details'])
+            if link in fetched:
+                page_details, error = fetched[link]
+                if error is not None:
+                    schedule_retry(retries, ('listing', card), attempt, error, f"property listing {link}")
+                    continue
+                details = merge_details(page_details, card['details'])
+            try:
+                if details:
+                    store_listing(writer, card, details)
+            except AttributeError as e:
+                logger.warning("Error processing property listing %s: %s", link, e)
+
+    def crawl_page(page_index, attempt):
+        nonlocal more_pages, known_pages_in_a_row, failed_pages_in_a_row
+        url = base_url.format(page_index)
+        try:
+            with scheduler.slot(url):
+                content = fetch_page(url)
+            cards = extract_listing_cards(content, extraction)
         except Exception as e:
-            print(f'Error fetching page starting from index {page_index}: {e}')
-            break
+            if not is_retryable_error(e):
+                logger.exception("Error fetching page starting from index %d", page_index)
+                more_pages = False
+                return
+            schedule_retry(retries, ('page', page_index), attempt, e, f"page starting from index {page_index}")
+            failed_pages_in_a_row += 1
+            if failed_pages_in_a_row >= max_failed_pages and more_pages:
+                logger.error("%d pages in a row failed. Finishing the queued retries only.", failed_pages_in_a_row)
+                more_pages = False
+            return
+        failed_pages_in_a_row = 0
+
+        if not cards:
+            logger.info("No more properties found. Stopping scraping.")
+            more_pages = False
+            return
+
+        if incremental:
+            # Only new listings or listings whose card changed (e.g. price drop)
+            known = known_card_hashes([card['link'] for card in cards])
+            cards = [card for card in cards if known.get(card['link']) != card['card_hash']]
+            if cards:
+                known_pages_in_a_row = 0
+            else:
+                known_pages_in_a_row += 1
+                logger.info("Page starting from index %d has no new or changed listings.", page_index)
+                if known_pages_in_a_row >= stop_after_known_pages:
+                    logger.info("%d pages in a row already known. Stopping incremental crawl.",
+                                known_pages_in_a_row)
+                    more_pages = False
+                return
+
+        # Fetch property details (strings, etc.) for the whole page at once
+        fetch_and_store([(card, 1) for card in cards])
+        logger.info("Page starting from index %d scraped successfully.", page_index,
+                    extra={"page_index": page_index, "listings": len(cards)})
+
+    try:
+        while True:
+            due = retries.pop_due()
+            if due:
+                listings = [(payload, attempt) for (kind, payload), attempt in due if kind == 'listing']
+                if listings:
+                    fetch_and_store(listings)
+                for (kind, payload), attempt in due:
+                    if kind == 'page':
+                        crawl_page(payload, attempt)
+            elif more_pages and page_index <= max_page_index:
+                crawl_page(page_index, 1)
+                page_index += 20  # Next page
+            elif retries:
+                time.sleep(retries.time_until_next())
+            else:
+                break
+    finally:
+        http_client.remove_observer(scheduler.observe)
+        http_client.set_retries(client_retries)
+        if executor is not None:
+            executor.shutdown(wait=True)
+        # Whatever is still buffered goes out even if the crawl was interrupted
+        writer.close()
+        logger.info("Bulk write totals", extra={"totals": writer.totals, "hosts": scheduler.stats()})
+
+        # Invalidate cached API responses if the crawl changed anything
+        if writer.totals['inserted'] or writer.totals['modified']:
+            generation = bump_data_generation(get_listings_collection().database)
+            logger.info("Data generation bumped to %s", generation)
+            try:
+                # Histograms for the unfiltered listing, served by /api/properties/facets
+                precompute_facets(get_listings_collection(), generation)
+            except Exception:
+                logger.exception("Precomputing facets failed")
+
+    return writer.totals
 
 if __name__ == "__main__":
+    configure_logging()
     base_url = 'https://www.daft.ie/property-for-sale/ireland?from={}&pageSize=20'
     scrape_daft_listings(base_url, max_page_index=12740)
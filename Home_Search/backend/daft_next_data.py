@@ -0,0 +1,90 @@
+import json
+import re
+from datetime import datetime, timezone
+
+# Daft is a Next.js site: the search results page embeds every listing on the
+# page as JSON in <script id="__NEXT_DATA__" type="application/json">.
+NEXT_DATA_RE = re.compile(
+    rb'<script[^>]*id=["\']__NEXT_DATA__["\'][^>]*>(.*?)</script>',
+    re.DOTALL
+)
+
+DAFT_BASE_URL = 'https://www.daft.ie'
+
+FLOOR_AREA_UNITS = {
+    'METRES_SQUARED': 'm²',
+    'FEET_SQUARED': 'ft²',
+    'ACRES': 'acres',
+    'HECTARES': 'hectares',
+}
+
+
+def extract_next_data_listings(content):
+    """
+    Return the raw listing objects from a search results page's __NEXT_DATA__
+    blob, or None when the page has no (usable) blob.
+    """
+    match = NEXT_DATA_RE.search(content)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(1))
+        listings = data['props']['pageProps']['listings']
+    except (ValueError, KeyError, TypeError):
+        return None
+    if not isinstance(listings, list):
+        return None
+    # Each entry is {"listing": {...}, ...}
+    return [item.get('listing', item) for item in listings if isinstance(item, dict)]
+
+
+def _format_floor_area(floor_area):
+    if not isinstance(floor_area, dict) or not floor_area.get('value'):
+        return None
+    unit = FLOOR_AREA_UNITS.get(floor_area.get('unit'), floor_area.get('unit') or '')
+    return f"{floor_area['value']} {unit}".strip()
+
+
+def _format_publish_date(publish_date):
+    # Epoch milliseconds -> DD/MM/YYYY, the format shown on detail pages
+    if not isinstance(publish_date, (int, float)):
+        return None
+    return datetime.fromtimestamp(publish_date / 1000, tz=timezone.utc).strftime('%d/%m/%Y')
+
+
+def _format_point(point):
+    # Already GeoJSON: {"type": "Point", "coordinates": [lng, lat]}
+    if not isinstance(point, dict) or point.get('type') != 'Point':
+        return None
+    coordinates = point.get('coordinates')
+    if not (isinstance(coordinates, list) and len(coordinates) == 2
+            and all(isinstance(value, (int, float)) for value in coordinates)):
+        return None
+    return {'type': 'Point', 'coordinates': coordinates}
+
+
+def listing_to_details(listing):
+    """
+    Map one __NEXT_DATA__ listing onto the fields scrape_daft_details produces,
+    in the same display formats. Fields the search JSON doesn't carry (e.g.
+    description, features) are left out rather than filled with placeholders.
+    """
+    path = listing.get('seoFriendlyPath')
+    if not path:
+        return None
+    link = path if path.startswith('http') else DAFT_BASE_URL + path
+
+    ber = listing.get('ber') or {}
+    details = {
+        'link': link,
+        'address': listing.get('title'),
+        'price': listing.get('price'),
+        'bedrooms': listing.get('numBedrooms'),
+        'bathrooms': listing.get('numBathrooms'),
+        'area': _format_floor_area(listing.get('floorArea')),
+        'property_type': listing.get('propertyType'),
+        'ber_rating': f"BER {ber['rating']}" if ber.get('rating') else None,
+        'date_entered': _format_publish_date(listing.get('publishDate')),
+        'location': _format_point(listing.get('point')),
+    }
+    return {key: value for key, value in details.items() if value not in (None, '')}
@@ -1,134 +1,143 @@
-import urllib.request
-from bs4 import BeautifulSoup
-import re
+from bs4 import BeautifulSoup, SoupStrainer
+from http_session import fetch_page
+import logging
+import os
 import re
 
-def scrape_daft_details(link):
+logger = logging.getLogger(__name__)
+
+# Parser backend: lxml (C) when it is installed, otherwise the pure-Python html.parser.
+# Override with DETAILS_PARSER=html.parser|lxml.
+try:
+    import lxml  # noqa: F401
+    DEFAULT_PARSER = 'lxml'
+except ImportError:
+    DEFAULT_PARSER = 'html.parser'
+PARSER_BACKEND = os.environ.get('DETAILS_PARSER', DEFAULT_PARSER)
+
+# Every node we read carries a data-testid, so only those subtrees are built
+DETAIL_NODES = SoupStrainer(attrs={'data-testid': True})
+
+BER_TITLE_RE = re.compile(r'ber_(\w+)_large', re.IGNORECASE)
+DATE_RE = re.compile(r'(\d{2}/\d{2}/\d{4})')
+
+
+def parse_daft_details(content, link, parser=None):
+    """Parses a property details page into structured data in a single pass over its data-testid nodes."""
+    soup = BeautifulSoup(content, parser or PARSER_BACKEND, parse_only=DETAIL_NODES)
+
+    # One walk over the (already filtered) tree: first node per (tag, data-testid)
+    nodes = {}
+    for tag in soup.find_all(attrs={'data-testid': True}):
+        nodes.setdefault((tag.name, tag['data-testid']), tag)
+
+    def text_of(name, testid, default):
+        tag = nodes.get((name, testid))
+        return tag.get_text(strip=True) if tag else default
+
+    # ---------------------------------------------------------------------
+    # 1. Extract address
+    # ---------------------------------------------------------------------
+    address = text_of('h1', 'address', 'Address not available.')
+
+    # ---------------------------------------------------------------------
+    # 2. Extract price
+    # ---------------------------------------------------------------------
+    price_div = nodes.get(('div', 'price'))
+    price_tag = price_div.find('h2') if price_div else None
+    price = price_tag.get_text(strip=True) if price_tag else 'Price not available.'
+
+    # ---------------------------------------------------------------------
+    # 3. Extract bedrooms, bathrooms, floor area, property type
+    # ---------------------------------------------------------------------
+    beds = text_of('p', 'beds', 'Beds not available.')
+    baths = text_of('p', 'baths', 'Baths not available.')
+    floor_area = text_of('p', 'floor-area', 'Floor area not available.')
+    property_type = text_of('p', 'property-type', 'Property type not available.')
+
+    # ---------------------------------------------------------------------
+    # 4. Extract the description
+    # ---------------------------------------------------------------------
+    description_tag = nodes.get(('div', 'description'))
+    if description_tag:
+        # Remove any <h2> heading inside
+        description_heading = description_tag.find('h2')
+        if description_heading:
+            description_heading.extract()
+        description = description_tag.get_text(strip=True)
+    else:
+        description = 'Description not available.'
+
+    # ---------------------------------------------------------------------
+    # 5. Extract property features
+    # ---------------------------------------------------------------------
+    features_list = []
+    features_div = nodes.get(('div', 'features'))
+    if features_div:
+        features_list = [item.get_text(strip=True) for item in features_div.find_all('li')]
+
+    # ---------------------------------------------------------------------
+    # 6. Extract map link (if available)
+    # ---------------------------------------------------------------------
+    map_link_tag = nodes.get(('a', 'streetview-button'))
+    map_link = map_link_tag['href'] if map_link_tag else None
+
+    # ---------------------------------------------------------------------
+    # 7.Extract BER rating
+    # ---------------------------------------------------------------------
+    ber_rating = 'BER not available.'
+    ber_div = nodes.get(('div', 'ber'))
+    if ber_div:
+        # Approach 1: aria-label="BER B2"
+        aria_div = ber_div.find(attrs={'aria-label': True})
+        if aria_div:
+            ber_rating = aria_div['aria-label']  # e.g. "BER B2"
+        else:
+            # Approach 2: <svg><title>ber_B2_large</title></svg>
+            svg_tag = ber_div.find('svg')
+            if svg_tag and svg_tag.find('title'):
+                title_text = svg_tag.find('title').get_text(strip=True)
+                # Might be "ber_B2_large" => parse "B2"
+                match = BER_TITLE_RE.search(title_text)
+                if match:
+                    ber_rating = f"BER {match.group(1)}"
+
+    # ---------------------------------------------------------------------
+    # 8.Extract date entered
+    # ---------------------------------------------------------------------
+    date_entered = 'Date not available.'
+    stats_div = nodes.get(('div', 'statistics'))
+    if stats_div:
+        # Look for DD/MM/YYYY
+        match = DATE_RE.search(stats_div.get_text())
+        if match:
+            date_entered = match.group(1)
+
+    # ---------------------------------------------------------------------
+    # Assemble final structured data
+    # ---------------------------------------------------------------------
+    return {
+        'address': address,
+        'price': price,
+        'bedrooms': beds,
+        'bathrooms': baths,
+        'area': floor_area,
+        'property_type': property_type,
+        'description': description,
+        'features': features_list,
+        'map_link': map_link,
+        'link': link,
+        'ber_rating': ber_rating,
+        'date_entered': date_entered
+    }
+
+
+def scrape_daft_details(link, parser=None):
     """Fetches and parses the property details from a given link, returning structured data."""
     try:
-        req = urllib.request.Request(
-            link,
-            headers={
-                'User-Agent': (
-                    "Brave/1.49.120"
-                )
-            }
-        )
-        resp = urllib.request.urlopen(req)
-        content = resp.read()
-
-        soup = BeautifulSoup(content, 'html.parser')
-
-        # ---------------------------------------------------------------------
-        # 1. Extract address
-        # ---------------------------------------------------------------------
-        address_tag = soup.find('h1', {'data-testid': 'address'})
-        address = address_tag.get_text(strip=True) if address_tag else 'Address not available.'
-
-        # ---------------------------------------------------------------------
-        # 2. Extract price
-        # ---------------------------------------------------------------------
-        price_div = soup.find('div', {'data-testid': 'price'})
-        price_tag = price_div.find('h2') if price_div else None
-        price = price_tag.get_text(strip=True) if price_tag else 'Price not available.'
-
-        # ---------------------------------------------------------------------
-        # 3. Extract bedrooms, bathrooms, floor area, property type
-        # ---------------------------------------------------------------------
-        beds_tag = soup.find('p', {'data-testid': 'beds'})
-        beds = beds_tag.get_text(strip=True) if beds_tag else 'Beds not available.'
-
-        baths_tag = soup.find('p', {'data-testid': 'baths'})
-        baths = baths_tag.get_text(strip=True) if baths_tag else 'Baths not available.'
-
-        floor_area_tag = soup.find('p', {'data-testid': 'floor-area'})
-        floor_area = floor_area_tag.get_text(strip=True) if floor_area_tag else 'Floor area not available.'
-
-        property_type_tag = soup.find('p', {'data-testid': 'property-type'})
-        property_type = property_type_tag.get_text(strip=True) if property_type_tag else 'Property type not available.'
-
-        # ---------------------------------------------------------------------
-        # 4. Extract the description
-        # ---------------------------------------------------------------------
-        description_tag = soup.find('div', {'data-testid': 'description'})
-        if description_tag:
-            # Remove any <h2> heading inside
-            description_heading = description_tag.find('h2')
-            if description_heading:
-                description_heading.extract()
-            description = description_tag.get_text(strip=True)
-        else:
-            description = 'Description not available.'
-
-        # ---------------------------------------------------------------------
-        # 5. Extract property features
-        # ---------------------------------------------------------------------
-        features_list = []
-        features_div = soup.find('div', {'data-testid': 'features'})
-        if features_div:
-            feature_items = features_div.find_all('li')
-            features_list = [item.get_text(strip=True) for item in feature_items]
-        else:
-            # Not all listings have this
-            pass
-
-        # ---------------------------------------------------------------------
-        # 6. Extract map link (if available)
-        # ---------------------------------------------------------------------
-        map_link_tag = soup.find('a', {'data-testid': 'streetview-button'})
-        map_link = map_link_tag['href'] if map_link_tag else None
-
-        # ---------------------------------------------------------------------
-        # 7.Extract BER rating
-        # ---------------------------------------------------------------------
-        ber_rating = 'BER not available.'
-        ber_div = soup.find('div', {'data-testid': 'ber'})
-        if ber_div:
-            # Approach 1: aria-label="BER B2"
-            aria_div = ber_div.find(attrs={'aria-label': True})
-            if aria_div:
-                ber_rating = aria_div['aria-label']  # e.g. "BER B2"
-            else:
-                # Approach 2: <svg><title>ber_B2_large</title></svg>
-                svg_tag = ber_div.find('svg')
-                if svg_tag and svg_tag.find('title'):
-                    title_text = svg_tag.find('title').get_text(strip=True)
-                    # Might be "ber_B2_large" => parse "B2"
-                    match = re.search(r'ber_(\w+)_large', title_text, re.IGNORECASE)
-                    if match:
-                        ber_rating = f"BER {match.group(1)}"
-
-        # ---------------------------------------------------------------------
-        # 8.Extract date entered
-        # ---------------------------------------------------------------------
-        date_entered = 'Date not available.'
-        stats_div = soup.find('div', {'data-testid': 'statistics'})
-        if stats_div:
-            # Look for DD/MM/YYYY
-            match = re.search(r'(\d{2}/\d{2}/\d{4})', stats_div.get_text())
-            if match:
-                date_entered = match.group(1)
-
-        # ---------------------------------------------------------------------
-        # Assemble final structured data
-        # ---------------------------------------------------------------------
-        property_details = {
-            'address': address,
-            'price': price,
-            'bedrooms': beds,
-            'bathrooms': baths,
-            'area': floor_area,
-            'property_type': property_type,
-            'description': description,
-            'features': features_list,
-            'map_link': map_link,
-            'link': link,
-            'ber_rating': ber_rating,
-            'date_entered': date_entered
-        }
-
-        return property_details
+        content = fetch_page(link)
+        return parse_daft_details(content, link, parser)
 
     except Exception as e:
-        print(f'Error fetching property details from {link}: {e}')
+        logger.warning("Error fetching property details from %s: %s", link, e)
         return None
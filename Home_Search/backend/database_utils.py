@@ -1,7 +1,14 @@
 import re
-from pymongo import MongoClient
+import threading
+from pymongo import MongoClient, ReturnDocument
 import os
 from dotenv import load_dotenv
+from metrics import MONGO_POOL_LISTENER
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
 
 load_dotenv()
 
@@ -10,61 +17,156 @@ db_password = os.getenv("MONGO_DB_PASSWORD")
 db_cluster_url = os.getenv("MONGO_DB_CLUSTER_URL")
 db_name = os.getenv("MONGO_DB_NAME")
 
-connection_string = f"mongodb+srv://{db_username}:{db_password}@{db_cluster_url}/{db_name}?retryWrites=true&w=majority"
-client = MongoClient(connection_string)
-db = client[db_name]
+# Client tuning (per process: every pre-forked worker gets its own pool)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 30000))
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+
+def get_connection_string():
+    """MONGO_URI when set (e.g. a local mongodb:// for development), otherwise the Atlas SRV string."""
+    return os.getenv("MONGO_URI") or (
+        f"mongodb+srv://{db_username}:{db_password}@{db_cluster_url}/{db_name}?retryWrites=true&w=majority"
+    )
+
+def get_client_options():
+    return {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE,
+        # Pool size, checkouts and checkout waits for /metrics
+        "event_listeners": [MONGO_POOL_LISTENER],
+    }
+
+# The client is created on first use, not at import: building it resolves the
+# SRV record, and a client must not be shared across a fork. `_client_pid`
+# records which process created it.
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_async_client = None
+_async_client_pid = None
+
+def get_client():
+    """This process' MongoClient, created (with the configured pool) on first use."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = MongoClient(get_connection_string(), **get_client_options())
+                _client_pid = pid
+    return _client
+
+def get_db():
+    return get_client()[db_name]
+
+def get_async_client():
+    """
+    This process' motor (asyncio) client for the ASGI serving path, with the
+    same pool settings as get_client(). Needs the optional 'motor' package.
+    """
+    global _async_client, _async_client_pid
+    if AsyncIOMotorClient is None:
+        raise RuntimeError("The async serving path needs the 'motor' package")
+    pid = os.getpid()
+    with _client_lock:
+        if _async_client is None or _async_client_pid != pid:
+            _async_client = AsyncIOMotorClient(get_connection_string(), **get_client_options())
+            _async_client_pid = pid
+    return _async_client
+
+def reset_client():
+    """Close the clients; the next get_client()/get_async_client() call creates a new one."""
+    global _client, _client_pid, _async_client, _async_client_pid
+    with _client_lock:
+        clients = (_client, _async_client)
+        _client = _client_pid = _async_client = _async_client_pid = None
+    for client in clients:
+        if client is not None:
+            client.close()
+
+def _forget_client_after_fork():
+    # The child must not use (or close) the parent's sockets: drop the
+    # inherited clients and lock so the first call in the child starts fresh.
+    global _client, _client_pid, _async_client, _async_client_pid, _client_lock
+    _client = _client_pid = None
+    _async_client = _async_client_pid = None
+    _client_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_client_after_fork)
 
 def get_properties_collection(collection_name):
-    return db[collection_name]
+    return get_db()[collection_name]
+
+def get_async_properties_collection(collection_name):
+    return get_async_client()[db_name][collection_name]
+
+# Bookkeeping documents (data generation, ...) live next to the listings
+META_COLLECTION = "meta"
+DATA_GENERATION_ID = "data_generation"
+
+def get_data_generation(database):
+    """Current data generation (bumped whenever the listings change), 0 if never bumped."""
+    doc = database[META_COLLECTION].find_one({"_id": DATA_GENERATION_ID})
+    return doc.get("value", 0) if doc else 0
+
+def bump_data_generation(database):
+    """Mark the listings as changed; cached search results from older generations become stale."""
+    doc = database[META_COLLECTION].find_one_and_update(
+        {"_id": DATA_GENERATION_ID},
+        {"$inc": {"value": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc["value"]
 
-def filter_properties(query):
+# Fields returned by the filter helpers (enough for a listing card)
+LISTING_SUMMARY_PROJECTION = {
+    "address": 1,
+    "price": 1,
+    "price_numeric": 1,
+    "bedrooms": 1,
+    "bedrooms_numeric": 1,
+    "bathrooms": 1,
+    "property_type": 1,
+    "link": 1,
+}
+FILTER_LIMIT = 100
+
+def filter_properties(query, limit=FILTER_LIMIT, projection=LISTING_SUMMARY_PROJECTION):
     """
-    Filter properties from the 'daft' collection where 'bedrooms' and 'price' are strings.
-    We parse the digits from the user query and from each document to do comparisons.
+    Filter properties from the 'daft' collection by the first number in the user query.
+    "3+ bedrooms" -> bedrooms_numeric >= 3, "under 400000" / "price 400000" -> price_numeric <= 400000.
+    The comparison runs in Mongo on the numeric fields; at most `limit` documents
+    (with `projection`) are read back.
     """
     collection = get_properties_collection("daft")
-    
-    # We'll gather potential docs with 'bedrooms' or 'price' if we see those words in the query
-    docs = list(collection.find())  # or filter with a broad $regex if you want fewer docs
 
     # e.g. "Show me houses with 3+ bedrooms" or "Properties under 400000"
     # We'll parse the first integer we see in the query
     match = re.search(r'(\d+)', query)
-    if not match:
-        # If no integer is found, we won't do numeric filtering
-        # You could return everything or an empty list, up to you
-        return docs
-    
-    user_number = int(match.group(1))
-    
-    filtered = []
-    
-    # If "bedroom" is in the query, do a bedroom filter
-    if "bedroom" in query.lower():
-        for doc in docs:
-            # doc['bedrooms'] might be "4 Bed", "3 bedroom", etc.
-            if 'bedrooms' in doc and isinstance(doc['bedrooms'], str):
-                bed_match = re.search(r'(\d+)', doc['bedrooms'])
-                if bed_match:
-                    doc_bed_count = int(bed_match.group(1))
-                    # If user said "3+ bedrooms," we interpret as doc_bed_count >= 3
-                    if doc_bed_count >= user_number:
-                        filtered.append(doc)
-        return filtered
-
-    # If "price" or "under" is in the query, do a price filter
-    if "price" in query.lower() or "under" in query.lower():
-        for doc in docs:
-            # doc['price'] might be "€695,000" or "695000"
-            if 'price' in doc and isinstance(doc['price'], str):
-                # remove non-digits
-                price_digits = re.sub(r'[^\d]', '', doc['price'])
-                if price_digits.isdigit():
-                    doc_price = int(price_digits)
-                    # If user said "under 400000," we interpret as doc_price <= 400000
-                    if doc_price <= user_number:
-                        filtered.append(doc)
-        return filtered
-
-    # If we didn't match "bedroom" or "price" in the query, just return all docs or empty
-    return docs
+    lowered = query.lower()
+
+    mongo_query = {}
+    if match:
+        user_number = int(match.group(1))
+
+        # If "bedroom" is in the query, do a bedroom filter
+        if "bedroom" in lowered:
+            # If user said "3+ bedrooms," we interpret as bedrooms >= 3
+            mongo_query = {"bedrooms_numeric": {"$gte": user_number}}
+
+        # If "price" or "under" is in the query, do a price filter
+        elif "price" in lowered or "under" in lowered:
+            # If user said "under 400000," we interpret as price <= 400000
+            mongo_query = {"price_numeric": {"$lte": user_number}}
+
+    # Without a number (or a bedroom/price keyword) there is nothing to filter on
+    return list(collection.find(mongo_query, projection).limit(limit))
@@ -0,0 +1,94 @@
+from database_utils import META_COLLECTION
+from query_planner import TEXT_SCORE, has_text_search
+
+# Price histogram edges; the last bucket is open-ended
+PRICE_BUCKET_BOUNDARIES = [0, 100000, 200000, 300000, 400000, 500000, 750000, 1000000, 2000000, float("inf")]
+
+# Meta document holding the unfiltered facets, computed after each scrape
+FACETS_ID = "facets"
+
+
+def _count_by(field, sort):
+    return [
+        {"$match": {field: {"$ne": None}}},
+        {"$group": {"_id": "$" + field, "count": {"$sum": 1}}},
+        {"$sort": sort},
+    ]
+
+
+def facet_histograms():
+    """The $facet sub-pipelines for every histogram, keyed by facet name."""
+    return {
+        "county": _count_by("county", {"count": -1, "_id": 1}),
+        "property_type": _count_by("property_type", {"count": -1, "_id": 1}),
+        "bedrooms": _count_by("bedrooms_numeric", {"_id": 1}),
+        "price": [
+            {"$match": {"price_numeric": {"$type": "number"}}},
+            {"$bucket": {
+                "groupBy": "$price_numeric",
+                "boundaries": PRICE_BUCKET_BOUNDARIES,
+                "default": "other",
+                "output": {"count": {"$sum": 1}},
+            }},
+        ],
+    }
+
+
+def facet_pipeline(query, skip, limit, include_results=True, projection=None):
+    """
+    One aggregation returning the page of results, the total and every
+    histogram for `query`. $text matches are ordered by relevance.
+    """
+    facets = {"total": [{"$count": "count"}]}
+    facets.update(facet_histograms())
+    if include_results:
+        results = [{"$sort": {"score": TEXT_SCORE}}] if has_text_search(query) else []
+        results += [{"$skip": skip}, {"$limit": limit}, {"$project": projection or {"_id": 0}}]
+        facets["results"] = results
+    return [{"$match": query}, {"$facet": facets}]
+
+
+def format_facets(raw):
+    """Turn the raw $facet output into {name: [{value|min/max, count}, ...]}."""
+    formatted = {
+        name: [{"value": row["_id"], "count": row["count"]} for row in raw.get(name, [])]
+        for name in ("county", "property_type", "bedrooms")
+    }
+    price = []
+    for row in raw.get("price", []):
+        if row["_id"] == "other":
+            continue
+        upper = PRICE_BUCKET_BOUNDARIES.index(row["_id"]) + 1
+        price.append({
+            "min": row["_id"],
+            "max": None if upper == len(PRICE_BUCKET_BOUNDARIES) - 1 else PRICE_BUCKET_BOUNDARIES[upper],
+            "count": row["count"],
+        })
+    formatted["price"] = price
+    return formatted
+
+
+def _total(raw):
+    return raw["total"][0]["count"] if raw.get("total") else 0
+
+
+def run_facet_search(collection, query, skip, limit, projection=None):
+    """Page of results, total and facets for `query` in one round trip."""
+    raw = next(collection.aggregate(facet_pipeline(query, skip, limit, projection=projection)), {})
+    return _total(raw), raw.get("results", []), format_facets(raw)
+
+
+def precompute_facets(collection, generation):
+    """Compute the unfiltered facets and store them (tagged with `generation`) in the meta collection."""
+    raw = next(collection.aggregate(facet_pipeline({}, 0, 0, include_results=False)), {})
+    doc = {"generation": generation, "total": _total(raw), "facets": format_facets(raw)}
+    collection.database[META_COLLECTION].replace_one({"_id": FACETS_ID}, doc, upsert=True)
+    return doc
+
+
+def get_precomputed_facets(collection, generation):
+    """(total, facets) stored for `generation`, or None when missing or computed for older data."""
+    doc = collection.database[META_COLLECTION].find_one({"_id": FACETS_ID})
+    if not doc or doc.get("generation") != generation:
+        return None
+    return doc["total"], doc["facets"]
@@ -0,0 +1,167 @@
+import argparse
+import re
+from urllib.parse import parse_qs, unquote, urlparse
+from pymongo import UpdateOne
+from database_utils import bump_data_generation, get_properties_collection
+
+# Mean Earth radius (IUGG); $centerSphere takes its radius in radians
+EARTH_RADIUS_KM = 6371.0
+DEFAULT_RADIUS_KM = 5.0
+MAX_RADIUS_KM = 200.0
+
+# "53.3498,-6.2603" as found in Street View / Maps URLs
+LAT_LNG_RE = re.compile(r'(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)')
+# Query parameters that carry "lat,lng" in the Google Maps URL flavours we've seen
+COORDINATE_PARAMS = ("viewpoint", "cbll", "ll", "q", "query", "center", "destination")
+# ... or the path form: /maps/@53.3498,-6.2603,15z
+PATH_COORDINATES_RE = re.compile(r'@' + LAT_LNG_RE.pattern)
+
+BACKFILL_BATCH_SIZE = 500
+
+
+class InvalidGeoQueryError(ValueError):
+    """Raised when near/radius/bbox request parameters can't be parsed."""
+
+
+def _valid(lat, lng):
+    return -90 <= lat <= 90 and -180 <= lng <= 180
+
+
+def _lat_lng(text):
+    match = LAT_LNG_RE.fullmatch(text.strip()) if text else None
+    if not match:
+        return None
+    lat, lng = float(match.group(1)), float(match.group(2))
+    return (lat, lng) if _valid(lat, lng) else None
+
+
+def coordinates_from_map_link(map_link):
+    """(lat, lng) from a listing's Street View / Maps link, or None."""
+    if not isinstance(map_link, str) or not map_link:
+        return None
+    parsed = urlparse(map_link)
+    params = parse_qs(parsed.query)
+    for name in COORDINATE_PARAMS:
+        for value in params.get(name, []):
+            coordinates = _lat_lng(value)
+            if coordinates:
+                return coordinates
+    match = PATH_COORDINATES_RE.search(unquote(parsed.path))
+    if match:
+        lat, lng = float(match.group(1)), float(match.group(2))
+        if _valid(lat, lng):
+            return lat, lng
+    return None
+
+
+def geojson_point(lat, lng):
+    # GeoJSON order is [longitude, latitude]
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+def location_from_details(details):
+    """GeoJSON point for a scraped listing (from its map_link), or None."""
+    coordinates = coordinates_from_map_link(details.get('map_link'))
+    return geojson_point(*coordinates) if coordinates else None
+
+
+# ---------------------------------------------------------------------
+# Query conditions (served by the location_2dsphere index)
+# ---------------------------------------------------------------------
+
+def near_condition(lat, lng, radius_km=DEFAULT_RADIUS_KM):
+    """
+    Listings within `radius_km` of a point. $geoWithin rather than $near:
+    it can be counted (count_documents) and combined with any sort.
+    The radius is converted to radians on the mean Earth radius.
+    """
+    return {"location": {"$geoWithin": {"$centerSphere": [[lng, lat], radius_km / EARTH_RADIUS_KM]}}}
+
+
+def bbox_condition(min_lng, min_lat, max_lng, max_lat):
+    """Listings inside a map viewport (south-west and north-east corners)."""
+    ring = [
+        [min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat], [min_lng, max_lat], [min_lng, min_lat],
+    ]
+    return {"location": {"$geoWithin": {"$geometry": {"type": "Polygon", "coordinates": [ring]}}}}
+
+
+def parse_geo_args(args):
+    """
+    Geo condition from request args, or None when none was asked for:
+    near=<lat>,<lng>[&radius=<km>] or bbox=<minLng>,<minLat>,<maxLng>,<maxLat>.
+    """
+    near = args.get('near')
+    bbox = args.get('bbox')
+    if near and bbox:
+        raise InvalidGeoQueryError("Use either near or bbox, not both")
+    if near:
+        coordinates = _lat_lng(near)
+        if coordinates is None:
+            raise InvalidGeoQueryError("near must be '<lat>,<lng>'")
+        try:
+            radius_km = float(args.get('radius', DEFAULT_RADIUS_KM))
+        except ValueError:
+            raise InvalidGeoQueryError("radius must be a number of kilometres")
+        if not 0 < radius_km <= MAX_RADIUS_KM:
+            raise InvalidGeoQueryError(f"radius must be between 0 and {MAX_RADIUS_KM:g} km")
+        return near_condition(*coordinates, radius_km)
+    if bbox:
+        try:
+            min_lng, min_lat, max_lng, max_lat = (float(part) for part in bbox.split(','))
+        except ValueError:
+            raise InvalidGeoQueryError("bbox must be '<minLng>,<minLat>,<maxLng>,<maxLat>'")
+        if not (_valid(min_lat, min_lng) and _valid(max_lat, max_lng)
+                and min_lng < max_lng and min_lat < max_lat):
+            raise InvalidGeoQueryError("bbox corners are out of range or not south-west/north-east")
+        return bbox_condition(min_lng, min_lat, max_lng, max_lat)
+    return None
+
+
+# ---------------------------------------------------------------------
+# Backfill for listings scraped before coordinates were stored
+# ---------------------------------------------------------------------
+
+def backfill_locations(collection, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Set `location` on every listing that has a map_link but no location yet.
+    Returns {"scanned", "updated", "unparsed"} counts.
+    """
+    counts = {"scanned": 0, "updated": 0, "unparsed": 0}
+    cursor = collection.find(
+        {"location": {"$exists": False}, "map_link": {"$type": "string"}},
+        {"_id": 1, "map_link": 1},
+    ).batch_size(batch_size)
+
+    ops = []
+    for doc in cursor:
+        counts["scanned"] += 1
+        location = location_from_details(doc)
+        if location is None:
+            counts["unparsed"] += 1
+            continue
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"location": location}}))
+        if len(ops) >= batch_size:
+            counts["updated"] += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        counts["updated"] += collection.bulk_write(ops, ordered=False).modified_count
+
+    if counts["updated"]:
+        # Cached search results don't know about the new locations
+        bump_data_generation(collection.database)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill in GeoJSON locations from stored map links.")
+    parser.add_argument("--collection", default="daft")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    counts = backfill_locations(get_properties_collection(args.collection), args.batch_size)
+    print(f"Location backfill: {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+
+class HostLimiter:
+    """
+    Per-host politeness for concurrent scraping: at most `max_per_host`
+    requests in flight to one host, and request starts to the same host
+    spaced at least `min_interval` seconds apart.
+    """
+
+    def __init__(self, max_per_host=4, min_interval=0.25):
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_start = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    def _reserve_start(self, host):
+        """Book the next start slot for a host and return how long to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.min_interval
+            return start - now
+
+    @contextmanager
+    def slot(self, url):
+        """Hold a request slot for the URL's host for the duration of the block."""
+        host = urlsplit(url).netloc
+        with self._semaphore(host):
+            delay = self._reserve_start(host)
+            if delay > 0:
+                time.sleep(delay)
+            yield
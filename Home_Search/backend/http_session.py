@@ -0,0 +1,158 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import brotli  # noqa: F401  (urllib3 decodes "br" when brotli is installed)
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+USER_AGENT = "Brave/1.49.120"
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 30)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HttpClient:
+    """
+    Pooled HTTP client shared by the scrapers.
+    Keeps connections alive per host, asks for compressed bodies (decoded
+    transparently), applies timeouts and retries transient failures
+    (connection errors, 429 and 5xx) with exponential backoff.
+
+    Observers (see add_observer) are told the status and latency of every
+    response, e.g. so the crawl scheduler can adapt its rate.
+    """
+
+    def __init__(self, pool_size=10, timeout=DEFAULT_TIMEOUT, retries=3, backoff_factor=0.5):
+        self.timeout = timeout
+        self.backoff_factor = backoff_factor
+        self._adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.set_retries(retries)
+
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self.session.headers.update({
+            "User-Agent": USER_AGENT,
+            "Accept-Encoding": ACCEPT_ENCODING,
+        })
+
+        self._lock = threading.Lock()
+        self._observers = []
+        self.responses = 0
+        self.bytes_on_wire = 0
+        self.bytes_decoded = 0
+
+    def set_retries(self, retries):
+        """
+        How many times urllib3 retries a GET itself. 0 hands every failure
+        straight back, for callers that retry and pace on their own (the
+        crawl scheduler), so backoffs don't stack.
+        """
+        self.retries = retries
+        # Read per request by the adapter, so this applies to the next GET
+        self._adapter.max_retries = Retry(
+            total=retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUSES if retries else (),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            respect_retry_after_header=True,
+        )
+
+    def add_observer(self, observer):
+        """
+        Call observer(url, status, seconds, retry_after) for every response:
+        statuses retried internally first (seconds None), then the final one.
+        Network errors and exhausted retries report status None.
+        """
+        with self._lock:
+            self._observers.append(observer)
+
+    def remove_observer(self, observer):
+        with self._lock:
+            if observer in self._observers:
+                self._observers.remove(observer)
+
+    def _notify(self, url, status, seconds, retry_after=None):
+        with self._lock:
+            observers = list(self._observers)
+        for observer in observers:
+            observer(url, status, seconds, retry_after)
+
+    def get(self, url):
+        """GET a URL and return the (decompressed) body; raises for HTTP errors."""
+        start = time.perf_counter()
+        try:
+            resp = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException:
+            self._notify(url, None, time.perf_counter() - start)
+            raise
+        elapsed = time.perf_counter() - start
+        # 429/5xx answers urllib3 already retried before this response
+        history = getattr(getattr(resp.raw, "retries", None), "history", None) or ()
+        for retried in history:
+            if retried.status is not None:
+                self._notify(url, retried.status, None)
+        self._notify(url, resp.status_code, elapsed, parse_retry_after(resp.headers.get("Retry-After")))
+        resp.raise_for_status()
+        content = resp.content
+
+        with self._lock:
+            self.responses += 1
+            # raw.tell() counts bytes read off the socket, i.e. before decompression
+            self.bytes_on_wire += resp.raw.tell() or len(content)
+            self.bytes_decoded += len(content)
+        return content
+
+    def stats(self):
+        """Bytes transferred and how often a pooled connection was reused."""
+        pools = self._adapter.poolmanager.pools
+        connections = requests_sent = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                requests_sent += pool.num_requests
+
+        with self._lock:
+            return {
+                "responses": self.responses,
+                "bytes_on_wire": self.bytes_on_wire,
+                "bytes_decoded": self.bytes_decoded,
+                "connections_opened": connections,
+                "connections_reused": max(requests_sent - connections, 0),
+            }
+
+    def close(self):
+        self.session.close()
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header given in seconds (the HTTP-date form is ignored)."""
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """The process-wide HttpClient, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def fetch_page(url):
+    """Fetch a page body through the shared client."""
+    return get_http_client().get(url)
@@ -0,0 +1,170 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+from database_utils import get_properties_collection
+
+# Indexes for the 'daft' collection, matched to the query shapes that
+# QueryPlanner, the keyset paginator and the scraper generate.
+INDEXES = [
+    # Scraper upserts on link
+    IndexModel([("link", ASCENDING)], name="link_unique", unique=True),
+    # Price ranges ("under 400k") and keyset pagination order
+    IndexModel([("price_numeric", ASCENDING), ("_id", ASCENDING)], name="price_numeric_id"),
+    # Property type (+ optional price range)
+    IndexModel([("property_type", ASCENDING), ("price_numeric", ASCENDING)], name="property_type_price"),
+    # Typed fields from normalization (+ optional price range)
+    IndexModel([("bedrooms_numeric", ASCENDING), ("price_numeric", ASCENDING)], name="bedrooms_numeric_price"),
+    IndexModel([("bathrooms_numeric", ASCENDING), ("price_numeric", ASCENDING)], name="bathrooms_numeric_price"),
+    IndexModel([("county", ASCENDING), ("price_numeric", ASCENDING)], name="county_price"),
+    IndexModel([("ber_ordinal", ASCENDING)], name="ber_ordinal"),
+    IndexModel([("area_sqm", ASCENDING)], name="area_sqm"),
+    IndexModel([("date_entered_at", DESCENDING)], name="date_entered_at"),
+    # Location regexes on address (towns and suburbs)
+    IndexModel([("address", ASCENDING)], name="address"),
+    # near/radius and bounding-box searches on the GeoJSON point
+    IndexModel([("location", GEOSPHERE)], name="location_2dsphere"),
+    # Full-text fallback ($text) for free-form search segments, ranked by textScore
+    IndexModel(
+        [("address", TEXT), ("property_type", TEXT), ("features", TEXT), ("description", TEXT)],
+        name="listing_text",
+        weights={"address": 10, "property_type": 5, "features": 3, "description": 1},
+        default_language="english",
+    ),
+]
+
+# Every collection has this one and it can't be dropped
+_ID_INDEX = "_id_"
+
+# The API creates missing indexes once per process, on first use (ENSURE_INDEXES=false to skip)
+ENSURE_INDEXES = os.environ.get("ENSURE_INDEXES", "true").lower() == "true"
+
+logger = logging.getLogger(__name__)
+_bootstrap_lock = threading.Lock()
+_bootstrapped = False
+# After a failed bootstrap, the next attempt waits at least this long
+BOOTSTRAP_RETRY_SECONDS = 30.0
+_bootstrap_failed_at = None
+
+
+def _declared(indexes):
+    return {model.document["name"]: model for model in indexes}
+
+
+def _matches(info, model):
+    """True if an entry from index_information() has the same definition as a declared IndexModel."""
+    doc = model.document
+    if bool(info.get("unique")) != bool(doc.get("unique")):
+        return False
+    if "weights" in doc:
+        # The server reports text indexes as _fts/_ftsx keys plus their weights
+        return info.get("weights", doc["weights"]) == doc["weights"]
+    return list(info["key"]) == list(doc["key"].items())
+
+
+def index_status(collection, indexes=INDEXES):
+    """
+    Compare the declared indexes with the ones on the collection.
+    Returns lists of index names: existing, missing, stale (on the collection
+    but not declared) and mismatched (same name, different definition).
+    """
+    declared = _declared(indexes)
+    current = collection.index_information()
+
+    status = {"existing": [], "missing": [], "stale": [], "mismatched": []}
+    for name, model in declared.items():
+        if name not in current:
+            status["missing"].append(name)
+        elif not _matches(current[name], model):
+            status["mismatched"].append(name)
+        else:
+            status["existing"].append(name)
+
+    status["stale"] = [name for name in current if name != _ID_INDEX and name not in declared]
+    return status
+
+
+def ensure_indexes(collection, indexes=INDEXES, drop_stale=False):
+    """
+    Idempotently create every declared index that is missing (in the background).
+    With drop_stale=True, undeclared indexes are dropped and mismatched ones rebuilt.
+    Returns the status before the run plus what was created, dropped or failed.
+    """
+    declared = _declared(indexes)
+    status = index_status(collection, indexes)
+    report = dict(status, created=[], dropped=[], failed={})
+
+    to_create = list(status["missing"])
+    if drop_stale:
+        for name in status["stale"] + status["mismatched"]:
+            collection.drop_index(name)
+            report["dropped"].append(name)
+        to_create += status["mismatched"]
+
+    for name in to_create:
+        model = declared[name]
+        try:
+            collection.create_index(
+                list(model.document["key"].items()),
+                background=True,
+                **{k: v for k, v in model.document.items() if k != "key"}
+            )
+            report["created"].append(name)
+        except OperationFailure as e:
+            # e.g. link_unique while duplicate links are still in the collection
+            report["failed"][name] = str(e)
+
+    return report
+
+
+def ensure_indexes_once(get_collection):
+    """
+    ensure_indexes(get_collection()) the first time it is called in this
+    process, so the API's indexes exist however it is served (python app.py,
+    gunicorn, uvicorn). Later calls return at once. Failures are logged, not
+    raised: searches still work without the indexes, just slower, and a call
+    BOOTSTRAP_RETRY_SECONDS later tries again.
+    """
+    global _bootstrapped, _bootstrap_failed_at
+    if _bootstrapped or not ENSURE_INDEXES:
+        return
+    with _bootstrap_lock:
+        if _bootstrapped:
+            return
+        if _bootstrap_failed_at is not None and time.monotonic() - _bootstrap_failed_at < BOOTSTRAP_RETRY_SECONDS:
+            return
+        try:
+            logger.info("Index bootstrap: %s", ensure_indexes(get_collection()))
+        except Exception:
+            _bootstrap_failed_at = time.monotonic()
+            logger.exception("Index bootstrap failed")
+        else:
+            _bootstrapped = True
+
+
+def indexes_bootstrapped():
+    return _bootstrapped or not ENSURE_INDEXES
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage MongoDB indexes for the daft collection.")
+    parser.add_argument("command", choices=["status", "ensure"], help="report index status or create missing indexes")
+    parser.add_argument("--collection", default="daft")
+    parser.add_argument("--drop-stale", action="store_true", help="drop undeclared indexes and rebuild mismatched ones")
+    args = parser.parse_args(argv)
+
+    collection = get_properties_collection(args.collection)
+    if args.command == "status":
+        result = index_status(collection)
+    else:
+        result = ensure_indexes(collection, drop_stale=args.drop_stale)
+
+    for key, names in result.items():
+        print(f"{key}: {names}")
+
+
+if __name__ == "__main__":
+    main()
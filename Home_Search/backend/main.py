@@ -1,8 +1,42 @@
-from daft_listings_scraper import scrape_daft_listings
+import argparse
+from daft_listings_scraper import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_KNOWN_PAGES_STOP,
+    EXTRACTION_DOM,
+    EXTRACTION_JSON,
+    scrape_daft_listings,
+)
+from database_utils import get_properties_collection
+from index_manager import ensure_indexes
+from structured_logging import configure_logging
 
 if __name__ == "__main__":
-    # Base URL for Daft listings
-    base_url_daft = 'https://www.daft.ie/property-for-sale/ireland?from={}&pageSize=20'
-    scrape_daft_listings(base_url_daft)
+    parser = argparse.ArgumentParser(description="Scrape Daft listings into MongoDB.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only fetch details for new or changed listings, stop early on known pages")
+    parser.add_argument("--known-pages", type=int, default=DEFAULT_KNOWN_PAGES_STOP,
+                        help="incremental mode: stop after this many consecutive already-known pages")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="detail pages fetched in parallel")
+    parser.add_argument("--max-page-index", type=int, default=12740)
+    parser.add_argument("--extraction", choices=[EXTRACTION_JSON, EXTRACTION_DOM], default=EXTRACTION_JSON,
+                        help="read listings from the page's embedded JSON or scrape every detail page")
+    args = parser.parse_args()
+    configure_logging()
 
+    # The scraper upserts on 'link', which needs its unique index to avoid a scan per listing
+    ensure_indexes(get_properties_collection('daft'))
 
+    # Base URL for Daft listings
+    base_url_daft = 'https://www.daft.ie/property-for-sale/ireland?from={}&pageSize=20'
+    if args.incremental:
+        # Early stopping relies on the newest listings coming first
+        base_url_daft += '&sort=publishDateDesc'
+    scrape_daft_listings(
+        base_url_daft,
+        max_page_index=args.max_page_index,
+        concurrency=args.concurrency,
+        incremental=args.incremental,
+        stop_after_known_pages=args.known_pages,
+        extraction=args.extraction,
+    )
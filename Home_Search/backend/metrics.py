@@ -0,0 +1,312 @@
+import threading
+import time
+from contextlib import contextmanager
+from pymongo import monitoring
+
+# In-process metrics in the Prometheus text format (served on /metrics).
+# Every worker process keeps its own registry; scrape each worker, or sum
+# them in the query.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds (1ms .. 10s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """[(sample name, ((label, value), ...), value)] for the exposition."""
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in self.samples()]
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+            return counts[-1]
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        samples = []
+        for key, (counts, total) in values:
+            for upper, count in zip(self.buckets, counts):
+                samples.append((f"{self.name}_bucket", key + (("le", _format_value(float(upper))),), count))
+            samples.append((f"{self.name}_sum", key, total))
+            samples.append((f"{self.name}_count", key, counts[-1]))
+        return samples
+
+
+class CallbackMetric(_Metric):
+    """A counter or gauge whose samples are read from `callback()` -> {label values tuple: value} at scrape time."""
+
+    def __init__(self, name, documentation, kind, callback, labelnames=(), registry=None):
+        self.kind = kind
+        self.callback = callback
+        super().__init__(name, documentation, labelnames, registry)
+
+    def samples(self):
+        try:
+            values = self.callback()
+        except Exception:
+            return []
+        return [
+            (self.name, tuple(zip(self.labelnames, label_values)), value)
+            for label_values, value in sorted(values.items())
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# -----------------------------------------------------------------------------
+# API request metrics
+# -----------------------------------------------------------------------------
+REQUEST_SECONDS = Histogram(
+    "api_request_duration_seconds", "Time from request start to response, by endpoint and status.",
+    ["endpoint", "status"],
+)
+REQUEST_PHASE_SECONDS = Histogram(
+    "api_request_phase_duration_seconds",
+    "Time spent in each phase of a request (parse, cache, count, find, drain, serialize, ...).",
+    ["endpoint", "phase"],
+)
+CACHE_REQUESTS = Counter(
+    "api_cache_requests_total", "Lookups in the API's caches, by cache and result (hit/miss).",
+    ["cache", "result"],
+)
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+class RequestTimer:
+    """
+    Phase timings for one request. Each phase is observed in
+    REQUEST_PHASE_SECONDS and listed in the Server-Timing header;
+    finish() records the whole request in REQUEST_SECONDS.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        # A phase entered more than once (e.g. two cursors) accumulates
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        REQUEST_PHASE_SECONDS.observe(seconds, endpoint=self.endpoint, phase=name)
+
+    def finish(self, status):
+        """Record the request's total time; returns the Server-Timing header value."""
+        total = time.perf_counter() - self.started
+        REQUEST_SECONDS.observe(total, endpoint=self.endpoint, status=str(status))
+        return self.server_timing(total)
+
+    def phase_ms(self):
+        """{phase: milliseconds} so far, e.g. for a log line."""
+        return {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()}
+
+    def server_timing(self, total=None):
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.phases.items()]
+        if total is not None:
+            entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+# -----------------------------------------------------------------------------
+# Mongo connection pool metrics (pymongo CMAP events; motor uses the same pools)
+# -----------------------------------------------------------------------------
+POOL_CONNECTIONS = Gauge("mongo_pool_connections", "Open connections in the pool, per server.", ["address"])
+POOL_CHECKED_OUT = Gauge("mongo_pool_checked_out_connections", "Connections currently in use, per server.", ["address"])
+POOL_CHECKOUT_SECONDS = Histogram(
+    "mongo_pool_checkout_duration_seconds",
+    "Time spent waiting for a pooled connection (pool exhaustion shows up here).",
+    ["address"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+POOL_CHECKOUT_FAILURES = Counter(
+    "mongo_pool_checkout_failures_total", "Failed connection checkouts, by reason.", ["address", "reason"],
+)
+POOL_CLEARED = Counter("mongo_pool_cleared_total", "Times the pool was cleared (e.g. after a network error).", ["address"])
+
+
+def _address(event):
+    host, port = event.address
+    return f"{host}:{port}"
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Feeds the mongo_pool_* metrics; passed to the clients as an event listener."""
+
+    def __init__(self):
+        # Checkout start times; a checkout starts and ends on the same thread
+        self._local = threading.local()
+
+    def pool_created(self, event):
+        POOL_CONNECTIONS.set(0, address=_address(event))
+        POOL_CHECKED_OUT.set(0, address=_address(event))
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        POOL_CLEARED.inc(address=_address(event))
+
+    def pool_closed(self, event):
+        POOL_CONNECTIONS.set(0, address=_address(event))
+        POOL_CHECKED_OUT.set(0, address=_address(event))
+
+    def connection_created(self, event):
+        POOL_CONNECTIONS.inc(address=_address(event))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        POOL_CONNECTIONS.dec(address=_address(event))
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def _checkout_finished(self, event):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        if started is not None:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started, address=_address(event))
+
+    def connection_check_out_failed(self, event):
+        self._checkout_finished(event)
+        POOL_CHECKOUT_FAILURES.inc(address=_address(event), reason=str(event.reason))
+
+    def connection_checked_out(self, event):
+        self._checkout_finished(event)
+        POOL_CHECKED_OUT.inc(address=_address(event))
+
+    def connection_checked_in(self, event):
+        POOL_CHECKED_OUT.dec(address=_address(event))
+
+
+MONGO_POOL_LISTENER = MongoPoolMetrics()
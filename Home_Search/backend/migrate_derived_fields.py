@@ -0,0 +1,156 @@
+import argparse
+import logging
+import time
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from database_utils import META_COLLECTION, bump_data_generation, get_properties_collection
+from facets import precompute_facets
+from normalization import normalize_listing
+from structured_logging import configure_logging
+
+# Recomputes the normalized fields (price_numeric, bedrooms_numeric, county,
+# location, ...) for listings stored before they existed, in place.
+#
+# Documents are walked in _id order in batches; each batch is one unordered
+# bulk_write that only $sets the fields whose value changed. After every
+# batch the last _id is checkpointed in the meta collection, so an
+# interrupted run picks up where it stopped.
+
+DEFAULT_BATCH_SIZE = 1000
+CHECKPOINT_ID = "migration:derived_fields"
+
+# Display fields normalize_listing reads
+SOURCE_FIELDS = ["price", "bedrooms", "bathrooms", "area", "ber_rating", "date_entered", "address", "map_link"]
+DERIVED_FIELDS = [
+    "price_numeric", "bedrooms_numeric", "bathrooms_numeric", "area_sqm",
+    "ber_ordinal", "date_entered_at", "county", "location",
+]
+
+# normalize_listing always sets these (None when unparseable). It only sets
+# location when the map link has coordinates, so a missing location doesn't
+# mean the document was never migrated (geo.backfill_locations fills it).
+ALWAYS_DERIVED_FIELDS = [field for field in DERIVED_FIELDS if field != "location"]
+
+logger = logging.getLogger(__name__)
+
+
+def _changed_fields(doc):
+    derived = normalize_listing(doc)
+    return {
+        field: value for field, value in derived.items()
+        if field not in doc or doc[field] != value
+    }
+
+
+def _missing_filter():
+    return {"$or": [{field: {"$exists": False}} for field in ALWAYS_DERIVED_FIELDS]}
+
+
+def _after(base_filter, last_id):
+    if last_id is None:
+        return base_filter
+    after = {"_id": {"$gt": last_id}}
+    return {"$and": [base_filter, after]} if base_filter else after
+
+
+def load_checkpoint(database):
+    """The unfinished run's checkpoint document, or None."""
+    checkpoint = database[META_COLLECTION].find_one({"_id": CHECKPOINT_ID})
+    if checkpoint and not checkpoint.get("finished"):
+        return checkpoint
+    return None
+
+
+def _save_checkpoint(database, **fields):
+    fields["updated_at"] = datetime.now(timezone.utc)
+    database[META_COLLECTION].update_one({"_id": CHECKPOINT_ID}, {"$set": fields}, upsert=True)
+
+
+def backfill_derived_fields(collection, batch_size=DEFAULT_BATCH_SIZE, missing_only=False, restart=False):
+    """
+    Recompute the derived fields of every listing (or only of listings
+    missing one of ALWAYS_DERIVED_FIELDS, with missing_only). Resumes from the last checkpoint unless
+    `restart`. Returns {"processed", "updated", "seconds"}.
+    """
+    database = collection.database
+    checkpoint = None if restart else load_checkpoint(database)
+    counts = {"processed": 0, "updated": 0}
+    last_id = None
+    if checkpoint:
+        last_id = checkpoint.get("last_id")
+        missing_only = checkpoint.get("missing_only", missing_only)
+        counts.update({key: checkpoint.get(key, 0) for key in counts})
+        logger.info("Resuming derived field backfill after _id %s (%d already processed)", last_id, counts["processed"])
+    else:
+        _save_checkpoint(database, last_id=None, finished=False, missing_only=missing_only,
+                         started_at=datetime.now(timezone.utc), **counts)
+
+    base_filter = _missing_filter() if missing_only else {}
+    remaining = collection.count_documents(_after(base_filter, last_id))
+    projection = {field: 1 for field in SOURCE_FIELDS + DERIVED_FIELDS}
+    start = time.monotonic()
+    done_this_run = 0
+
+    while True:
+        # Keyset over _id: every batch is an index range scan, and only one
+        # batch of documents is held in memory
+        batch = list(
+            collection
+            .find(_after(base_filter, last_id), projection)
+            .sort("_id", 1)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        ops = []
+        for doc in batch:
+            changes = _changed_fields(doc)
+            if changes:
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": changes}))
+        if ops:
+            counts["updated"] += collection.bulk_write(ops, ordered=False).modified_count
+
+        last_id = batch[-1]["_id"]
+        counts["processed"] += len(batch)
+        done_this_run += len(batch)
+        _save_checkpoint(database, last_id=last_id, **counts)
+
+        elapsed = time.monotonic() - start
+        rate = done_this_run / elapsed if elapsed else 0.0
+        eta = (remaining - done_this_run) / rate if rate else 0.0
+        logger.info("Backfill: %d/%d documents this run, %d updated, %.0f docs/s, ETA %.0fs",
+                    done_this_run, remaining, counts["updated"], rate, max(eta, 0))
+
+    counts["seconds"] = round(time.monotonic() - start, 2)
+    _save_checkpoint(database, finished=True, **{k: v for k, v in counts.items() if k != "seconds"})
+
+    if counts["updated"]:
+        # Cached responses and the precomputed facets describe the old values
+        generation = bump_data_generation(database)
+        precompute_facets(collection, generation)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute derived listing fields in place (resumable).")
+    parser.add_argument("--collection", default="daft")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--missing-only", action="store_true",
+                        help="only documents never migrated (missing a derived field other than location)")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore an unfinished run's checkpoint and start from the beginning")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    counts = backfill_derived_fields(
+        get_properties_collection(args.collection),
+        batch_size=args.batch_size,
+        missing_only=args.missing_only,
+        restart=args.restart,
+    )
+    print(f"Derived field backfill: {counts}")
+
+
+if __name__ == "__main__":
+    main()
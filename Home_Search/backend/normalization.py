@@ -0,0 +1,126 @@
+import re
+from datetime import datetime
+from geo import location_from_details
+
+# Typed fields derived from the display strings at ingest. The strings are
+# kept for the frontend; queries and facets use these (indexed) fields.
+
+# The 32 counties (also used to derive a listing's county from its address)
+COUNTIES = [
+    "carlow", "cavan", "clare", "cork", "donegal", "dublin", "galway", "kerry",
+    "kildare", "kilkenny", "laois", "leitrim", "limerick", "longford", "louth",
+    "mayo", "meath", "monaghan", "offaly", "roscommon", "sligo", "tipperary",
+    "waterford", "westmeath", "wexford", "wicklow", "antrim", "armagh", "down",
+    "fermanagh", "londonderry", "tyrone",
+]
+COUNTY_ALIASES = {"derry": "londonderry"}
+COUNTY_PREFIX_RE = re.compile(r'^(?:co\.?|county)\s+')
+
+# BER energy ratings, best first; the ordinal is the position (A1 = 1 ... G = 15)
+BER_SCALE = ["A1", "A2", "A3", "B1", "B2", "B3", "C1", "C2", "C3", "D1", "D2", "E1", "E2", "F", "G"]
+BER_ORDINALS = {rating: ordinal for ordinal, rating in enumerate(BER_SCALE, start=1)}
+BER_RE = re.compile(r'^(?:ber\s*)?([a-g][1-3]?)$', re.IGNORECASE)
+
+# Floor area units as shown on daft (and in the embedded JSON), in square metres
+AREA_UNITS_SQM = {
+    "m²": 1.0, "m2": 1.0, "sq m": 1.0, "sqm": 1.0,
+    "ft²": 0.09290304, "ft2": 0.09290304, "sq ft": 0.09290304, "sqft": 0.09290304,
+    "acre": 4046.8564224, "acres": 4046.8564224,
+    "hectare": 10000.0, "hectares": 10000.0, "ha": 10000.0,
+}
+AREA_RE = re.compile(r'^([\d,]+(?:\.\d+)?)\s*(.*)$')
+
+DATE_ENTERED_FORMAT = '%d/%m/%Y'
+
+FIRST_INT_RE = re.compile(r'(\d+)')
+
+
+def first_int(value):
+    """3 for 3, "3 Bed" or "3 Bath"; None when there is no number."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    match = FIRST_INT_RE.search(value) if isinstance(value, str) else None
+    return int(match.group(1)) if match else None
+
+
+def parse_price(value):
+    """695000 for "€695,000"; None for "Price on Application" and the like."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    digits = re.sub(r'[^\d]', '', value) if isinstance(value, str) else ''
+    return int(digits) if digits.isdigit() else None
+
+
+def parse_area_sqm(value):
+    """Floor area in square metres ("110 m²" -> 110.0, "1,200 ft²" -> 111.5), or None."""
+    match = AREA_RE.match(value.strip()) if isinstance(value, str) else None
+    if not match:
+        return None
+    factor = AREA_UNITS_SQM.get(match.group(2).strip().lower())
+    if factor is None:
+        return None
+    return round(float(match.group(1).replace(',', '')) * factor, 1)
+
+
+def ber_ordinal(rating):
+    """1 (A1) ... 15 (G) for "BER B2"-style ratings; None for exempt or missing ratings."""
+    match = BER_RE.match(rating.strip()) if isinstance(rating, str) else None
+    return BER_ORDINALS.get(match.group(1).upper()) if match else None
+
+
+def parse_date_entered(value):
+    """datetime for a "DD/MM/YYYY" date, or None."""
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.strptime(value.strip(), DATE_ENTERED_FORMAT)
+    except ValueError:
+        return None
+
+
+def canonical_county(name):
+    """ "co. dublin" / "Dublin" -> "Dublin"; None if it isn't a county."""
+    words = COUNTY_PREFIX_RE.sub('', name.strip().lower()).split() if isinstance(name, str) else []
+    if not words:
+        return None
+    county = COUNTY_ALIASES.get(words[0], words[0])
+    return county.title() if county in COUNTIES else None
+
+
+def county_from_address(address):
+    """
+    County named in an address, e.g. "1 Main St, Ranelagh, Dublin 6" -> "Dublin",
+    "Ballyvolane, Co. Cork" -> "Cork". Segments are tried from the end; None
+    when no segment starts with a county name.
+    """
+    if not isinstance(address, str):
+        return None
+    for segment in reversed(address.split(',')):
+        county = canonical_county(segment)
+        if county:
+            return county
+    return None
+
+
+def normalize_listing(details):
+    """
+    The typed fields for a scraped listing: price_numeric, bedrooms_numeric,
+    bathrooms_numeric, area_sqm, ber_ordinal, date_entered_at and county
+    (None when a value can't be parsed), plus a GeoJSON location when the
+    map link has coordinates.
+    """
+    normalized = {
+        'price_numeric': parse_price(details.get('price')),
+        'bedrooms_numeric': first_int(details.get('bedrooms')),
+        'bathrooms_numeric': first_int(details.get('bathrooms')),
+        'area_sqm': parse_area_sqm(details.get('area')),
+        'ber_ordinal': ber_ordinal(details.get('ber_rating')),
+        'date_entered_at': parse_date_entered(details.get('date_entered')),
+        'county': county_from_address(details.get('address')),
+    }
+    location = location_from_details(details)
+    if location is not None:
+        normalized['location'] = location
+    return normalized
@@ -0,0 +1,82 @@
+import base64
+import json
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING
+
+# Keyset pagination walks the collection in (price_numeric, _id) order so each
+# page is an index range scan that starts right after the last document seen.
+CURSOR_SORT = [("price_numeric", ASCENDING), ("_id", ASCENDING)]
+
+DEFAULT_LIMIT = 20
+# The map view asks for 100 listings at a time
+MAX_LIMIT = 100
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a client sends a cursor we did not issue (or that was tampered with)."""
+
+
+class InvalidPaginationError(ValueError):
+    """Raised when `limit` or `page` is not a whole number in range."""
+
+
+def parse_page_args(args):
+    """(limit, page) from request args: limit in 1..MAX_LIMIT, page >= 1."""
+    try:
+        limit = int(args.get("limit", DEFAULT_LIMIT))
+        page = int(args.get("page", 1))
+    except (TypeError, ValueError) as e:
+        raise InvalidPaginationError("limit and page must be whole numbers") from e
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidPaginationError(f"limit must be between 1 and {MAX_LIMIT}")
+    if page < 1:
+        raise InvalidPaginationError("page must be 1 or more")
+    return limit, page
+
+
+def encode_cursor(doc):
+    """Build an opaque cursor from the sort key of the last document on a page."""
+    payload = {"p": doc.get("price_numeric"), "i": str(doc["_id"])}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return the (price_numeric, _id) pair stored in a cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        price = payload["p"]
+        last_id = ObjectId(payload["i"])
+    except (ValueError, TypeError, KeyError, InvalidId) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+    if price is not None and (isinstance(price, bool) or not isinstance(price, (int, float))):
+        raise InvalidCursorError(f"Invalid cursor: {cursor}")
+    return price, last_id
+
+
+def keyset_condition(price, last_id):
+    """Condition selecting every document that sorts after (price, last_id) in CURSOR_SORT order."""
+    if price is None:
+        # Missing/null prices sort first, so after them come the remaining
+        # nulls with a larger _id and then every priced listing.
+        return {"$or": [
+            {"price_numeric": None, "_id": {"$gt": last_id}},
+            {"price_numeric": {"$ne": None}}
+        ]}
+    return {"$or": [
+        {"price_numeric": {"$gt": price}},
+        {"price_numeric": price, "_id": {"$gt": last_id}}
+    ]}
+
+
+def apply_cursor(query, cursor):
+    """Restrict a search query to the documents after the given cursor (no-op for an empty cursor)."""
+    if not cursor:
+        return query
+    condition = keyset_condition(*decode_cursor(cursor))
+    if not query:
+        return condition
+    return {"$and": [query, condition]}
@@ -0,0 +1,49 @@
+import re
+
+# Which listing fields a response carries: view=summary|full or fields=a,b,c
+VIEW_SUMMARY = "summary"
+VIEW_FULL = "full"
+VIEWS = (VIEW_SUMMARY, VIEW_FULL)
+
+# Everything a listing card shows (no description/features)
+SUMMARY_FIELDS = [
+    "address", "price", "bedrooms", "bathrooms", "area", "property_type",
+    "ber_rating", "date_entered", "map_link", "link",
+]
+
+FIELD_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*$')
+MAX_FIELDS = 30
+
+
+class InvalidProjectionError(ValueError):
+    """Raised for an unknown view or a malformed fields= list."""
+
+
+def requested_fields(args):
+    """
+    The field names asked for, or None for the full document.
+    fields= takes precedence over view=.
+    """
+    fields = args.get('fields')
+    if fields:
+        names = sorted({name.strip() for name in fields.split(',') if name.strip()})
+        if not names or len(names) > MAX_FIELDS:
+            raise InvalidProjectionError(f"fields must list between 1 and {MAX_FIELDS} field names")
+        bad = [name for name in names if not FIELD_NAME_RE.match(name) or name == "_id"]
+        if bad:
+            raise InvalidProjectionError(f"Invalid field names: {', '.join(bad)}")
+        return names
+
+    view = args.get('view') or VIEW_FULL
+    if view not in VIEWS:
+        raise InvalidProjectionError(f"view must be one of: {', '.join(VIEWS)}")
+    return list(SUMMARY_FIELDS) if view == VIEW_SUMMARY else None
+
+
+def projection_for(fields):
+    """Mongo projection for requested_fields() (never including _id)."""
+    if fields is None:
+        return {"_id": 0}
+    projection = {"_id": 0}
+    projection.update((name, 1) for name in fields)
+    return projection
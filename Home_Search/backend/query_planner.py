@@ -0,0 +1,327 @@
+import copy
+import re
+import threading
+from collections import OrderedDict
+from normalization import BER_ORDINALS, BER_SCALE, COUNTIES, canonical_county
+
+# Counties plus major towns and Dublin suburbs we recognise in a search term
+LOCATIONS = COUNTIES + [
+    # Major towns and cities
+    "athlone", "mullingar", "tullamore", "portlaoise", "naas", "navan", "drogheda", "dundalk",
+    "swords", "bray", "greystones", "arklow", "gorey", "enniscorthy", "wexford", "kilkenny",
+    "carlow", "athy", "newbridge", "kildare", "maynooth", "celbridge", "leixlip", "lucan",
+    "clondalkin", "tallaght", "dun laoghaire", "balbriggan", "skerries", "malahide", "howth",
+    "sutton", "raheny", "clontarf", "killester", "fairview", "drumcondra", "phibsborough",
+    "cabra", "blanchardstown", "castleknock", "chapelizod", "palmerstown", "ballyfermot",
+    "inchicore", "kilmainham", "dolphins barn", "crumlin", "walkinstown", "terenure",
+    "rathfarnham", "churchtown", "dundrum", "ballinteer", "sandyford", "stepaside",
+    "leopardstown", "foxrock", "cabinteely", "killiney", "dalkey", "sandycove", "glasthule",
+    "monkstown", "blackrock", "booterstown", "ballsbridge", "donnybrook", "ranelagh",
+    "rathmines", "harold's cross", "rathgar", "milltown", "clonskeagh", "goatstown",
+    "stillorgan", "kilmacud", "mount merrion", "deansgrange", "dun laoghaire", "glasnevin",
+    "santry", "beaumont", "artane", "killester", "coolock", "darndale", "donaghmede",
+    "kilbarrack", "raheny", "clontarf", "east wall", "north wall", "kilshane", "mulhuddart"
+]
+
+# Property type synonyms
+# If user says "house", we also match "detached", "semi-detached", "terraced".
+PROPERTY_TYPES = {
+    "house": ["house", "detached", "semi-detached", "terraced", "townhouse", "bungalow"],
+    "apartment": ["apartment", "flat"],
+    "detached": ["detached"],
+    "terraced": ["terraced", "end of terraced"],
+    "semi-detached": ["semi-detached"],
+    "townhouse": ["townhouse"],
+    "bungalow": ["bungalow"]
+}
+
+# Common features we might see
+FEATURE_KEYWORDS = ['garden', 'parking', 'balcony', 'view', 'garage', 'pool']
+
+DEFAULT_CACHE_SIZE = 1024
+
+# Projection/sort fragment for relevance ordering of $text results
+TEXT_SCORE = {"$meta": "textScore"}
+
+
+def normalize_search_term(search_term):
+    """Lower-case, strip and collapse whitespace so equivalent terms share a cache entry."""
+    return " ".join(search_term.lower().split())
+
+
+def text_search_condition(text):
+    """$text condition over the listing_text index (address, property_type, features, description)."""
+    return {"$text": {"$search": text}}
+
+
+def has_text_search(query):
+    """True if the query contains a $text clause (top level or directly under $and)."""
+    if "$text" in query:
+        return True
+    return any("$text" in cond for cond in query.get("$and", []))
+
+
+class QueryPlanner:
+    """
+    Converts the refined search string the chatbot/LLM produces, e.g.
+    "house 3 bed 3 bath under 400k dublin", into a MongoDB query.
+
+    Every pattern is compiled once when the planner is built, and the
+    generated queries are kept in a bounded LRU cache keyed by the
+    normalized search term, so repeated refinements skip parsing entirely.
+    """
+
+    def __init__(self, locations=LOCATIONS, property_types=PROPERTY_TYPES,
+                 feature_keywords=FEATURE_KEYWORDS, cache_size=DEFAULT_CACHE_SIZE):
+        # Locations: one alternation, longest names first so "dun laoghaire"
+        # wins over any shorter name it contains.
+        self.locations = list(dict.fromkeys(locations))
+        self._counties = set(COUNTIES)
+        self._location_rank = {loc: i for i, loc in enumerate(self.locations)}
+        alternation = "|".join(
+            re.escape(loc) for loc in sorted(self.locations, key=len, reverse=True)
+        )
+        self._location_re = re.compile(r'\b(?:' + alternation + r')\b')
+
+        # split on some words like 'and', 'with', commas, etc.
+        self._segment_split_re = re.compile(r'\band\b|\bwith\b|,')
+
+        # Regex to detect "under 400k", "over 300k", "between 200k and 300k"
+        self._price_patterns = [
+            ('under', re.compile(r'under\s*(\d+)\s*k')),
+            ('over', re.compile(r'over\s*(\d+)\s*k')),
+            ('between', re.compile(r'between\s*(\d+)\s*k\s*and\s*(\d+)\s*k')),
+        ]
+        self._standalone_price_re = re.compile(r'^(\d+)\s*k$')
+        # "3 bed" -> exactly 3, "3+ bed" -> at least 3 (same for baths)
+        self._bedroom_re = re.compile(r'(\d+)\s*(\+?)\s*bed')
+        self._bathroom_re = re.compile(r'(\d+)\s*(\+?)\s*bath')
+        # "ber b2" / "ber b" -> that rating or better
+        self._ber_re = re.compile(r'\bber\s*([a-g][1-3]?)\b')
+        # "100 sqm", "90m2" -> at least that floor area
+        self._area_re = re.compile(r'(\d+)\s*(?:sq\.?\s*m\b|sqm\b|m2\b|m²|square met)')
+
+        # e.g. if user typed "house", we search "house|detached|semi-detached|terraced"
+        self._property_types = [
+            (synonyms, "|".join(synonyms)) for synonyms in property_types.values()
+        ]
+        self._feature_keywords = list(feature_keywords)
+
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # -------------------------------------------------------------------------
+    # Cache
+    # -------------------------------------------------------------------------
+    def plan(self, search_term):
+        """Return the MongoDB query for a search term, using the LRU cache when possible."""
+        key = normalize_search_term(search_term)
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                # Callers are free to extend the query, so never hand out the cached object
+                return copy.deepcopy(cached)
+            self.misses += 1
+
+        query = self.build_query(key)
+
+        if self.cache_size > 0:
+            with self._lock:
+                self._cache[key] = query
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return copy.deepcopy(query)
+
+    def cache_info(self):
+        """Hit/miss counters and current occupancy of the query cache."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._cache),
+                "maxsize": self.cache_size,
+            }
+
+    def cache_clear(self):
+        """Drop every cached query and reset the counters."""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    # -------------------------------------------------------------------------
+    # Parsing
+    # -------------------------------------------------------------------------
+    def detect_locations(self, search_term):
+        """Locations mentioned in the (normalized) search term, in LOCATIONS order."""
+        found = set(self._location_re.findall(search_term))
+        return sorted(found, key=self._location_rank.__getitem__)
+
+    @staticmethod
+    def _count_condition(match):
+        count = int(match.group(1))
+        return {"$gte": count} if match.group(2) else count
+
+    @staticmethod
+    def _ber_upper_bound(rating):
+        # "b2" -> B2; a bare letter ("b") allows its worst band (B3)
+        rating = rating.upper()
+        if rating in BER_ORDINALS:
+            return BER_ORDINALS[rating]
+        return max(BER_ORDINALS[band] for band in BER_SCALE if band[0] == rating)
+
+    @staticmethod
+    def _text_location_condition(loc):
+        return {
+            "$or": [
+                {"address": {"$regex": loc, "$options": "i"}},
+                {"description": {"$regex": "\\bin " + loc + "\\b", "$options": "i"}}
+            ]
+        }
+
+    def _location_condition(self, loc):
+        if loc in self._counties:
+            # Listings whose county couldn't be derived (null, or not yet
+            # backfilled) are still matched on their address/description
+            return {
+                "$or": [
+                    {"county": canonical_county(loc)},
+                    dict({"county": None}, **self._text_location_condition(loc)),
+                ]
+            }
+        return self._text_location_condition(loc)
+
+    def build_query(self, search_term):
+        """Parse a normalized search term into a MongoDB query (uncached)."""
+        detected_locations = self.detect_locations(search_term)
+
+        # Create a modified search term with locations removed
+        # This prevents locations from being processed in the normal segment loop
+        modified_search_term = self._location_re.sub('', search_term)
+        segments = self._segment_split_re.split(modified_search_term)
+
+        # Start with an $and query container
+        query = {"$and": []}
+
+        def add_condition(cond):
+            """Helper to append a sub-condition into the $and list."""
+            if cond is not None and cond not in query["$and"]:
+                query["$and"].append(cond)
+
+        # Segments we couldn't interpret, searched as free text
+        text_terms = []
+
+        # Process non-location segments
+        for seg in segments:
+            seg = seg.strip()
+            if not seg:  # Skip empty segments
+                continue
+
+            matched_segment = False
+
+            # 1) Price Patterns
+            for kind, pattern in self._price_patterns:
+                match = pattern.search(seg)
+                if match:
+                    matched_segment = True
+                    if kind == 'between':
+                        # e.g. "between 200k and 300k"
+                        min_price = int(match.group(1)) * 1000
+                        max_price = int(match.group(2)) * 1000
+                        add_condition({"price_numeric": {"$gte": min_price, "$lte": max_price}})
+                    elif kind == 'over':
+                        # e.g. "over 300k"
+                        add_condition({"price_numeric": {"$gte": int(match.group(1)) * 1000}})
+                    else:
+                        # e.g. "under 400k"
+                        add_condition({"price_numeric": {"$lte": int(match.group(1)) * 1000}})
+                    break
+
+            # Also handle if user just typed "300k" (with no "under"/"over/between")
+            if not matched_segment:
+                standalone_price = self._standalone_price_re.match(seg)
+                if standalone_price:
+                    matched_segment = True
+                    # by default, treat "300k" as "under 300k"
+                    add_condition({"price_numeric": {"$lte": int(standalone_price.group(1)) * 1000}})
+
+            # 2) Property type synonyms
+            for synonyms, type_regex in self._property_types:
+                if any(syn in seg for syn in synonyms):
+                    matched_segment = True
+                    add_condition({"property_type": {"$regex": type_regex, "$options": "i"}})
+
+            # 3) Bedrooms / Bathrooms (numeric fields set at ingest)
+            # e.g. "3 bed", "4 bedroom", "2+ bath", "3 bathrooms"
+            bedroom_match = self._bedroom_re.search(seg)
+            if bedroom_match:
+                matched_segment = True
+                add_condition({"bedrooms_numeric": self._count_condition(bedroom_match)})
+
+            bathroom_match = self._bathroom_re.search(seg)
+            if bathroom_match:
+                matched_segment = True
+                add_condition({"bathrooms_numeric": self._count_condition(bathroom_match)})
+
+            # BER rating at least as good as asked for (lower ordinal is better)
+            ber_match = self._ber_re.search(seg)
+            if ber_match:
+                matched_segment = True
+                add_condition({"ber_ordinal": {"$lte": self._ber_upper_bound(ber_match.group(1))}})
+
+            # Minimum floor area
+            area_match = self._area_re.search(seg)
+            if area_match:
+                matched_segment = True
+                add_condition({"area_sqm": {"$gte": int(area_match.group(1))}})
+
+            # 4) Features (garden, parking, etc.)
+            for keyword in self._feature_keywords:
+                if keyword in seg:
+                    matched_segment = True
+                    add_condition({
+                        "$or": [
+                            {"description": {"$regex": keyword, "$options": "i"}},
+                            {"features":    {"$regex": keyword, "$options": "i"}}
+                        ]
+                    })
+
+            # 5) If none of the above matched, fall back to full-text search.
+            #    Unmatched segments are pooled into a single $text clause (Mongo
+            #    allows one per query), served by the listing_text index.
+            if not matched_segment:
+                text_terms.append(seg)
+
+        if text_terms:
+            add_condition(text_search_condition(" ".join(text_terms)))
+
+        # Handle locations as a separate OR condition: counties are an
+        # equality on the canonical county (text match for listings without
+        # one), towns still match the text
+        if detected_locations:
+            add_condition({"$or": [self._location_condition(loc) for loc in detected_locations]})
+
+        # If $and is empty (meaning user gave us nothing?), fallback again
+        if len(query["$and"]) == 0:
+            if search_term:
+                # full-text search on the entire search_term
+                query = text_search_condition(search_term)
+            else:
+                # nothing to search on: broad match on every listing
+                query = {
+                    "$or": [
+                        {"address":      {"$regex": search_term, "$options": "i"}},
+                        {"description":  {"$regex": search_term, "$options": "i"}},
+                        {"features":     {"$regex": search_term, "$options": "i"}},
+                        {"property_type": {"$regex": search_term, "$options": "i"}}
+                    ]
+                }
+
+        return query
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from bson import json_util
+from database_utils import DATA_GENERATION_ID, META_COLLECTION, get_data_generation
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+DEFAULT_MAXSIZE = 512
+DEFAULT_TTL = 300
+DEFAULT_GENERATION_CHECK_INTERVAL = 1.0
+
+
+class InMemoryBackend:
+    """Per-process LRU with a time-to-live on every entry."""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Cache shared by every worker/process through Redis (eviction left to Redis' maxmemory policy)."""
+
+    def __init__(self, url, ttl=DEFAULT_TTL, prefix="homesearch:properties:"):
+        if redis is None:
+            raise RuntimeError("RedisBackend needs the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json_util.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json_util.dumps(value), ex=self.ttl)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+
+class ResponseCache:
+    """
+    Cache of /api/properties responses keyed by the data generation plus the
+    normalized request (search term, page/cursor, limit, projection).
+
+    The scraper bumps the data generation after writing listings; since the
+    generation is part of every key, older entries stop being hit at once
+    and age out of the LRU. The generation is re-read from Mongo at most every
+    `generation_check_interval` seconds.
+    """
+
+    def __init__(self, backend=None, generation_check_interval=DEFAULT_GENERATION_CHECK_INTERVAL):
+        self.backend = backend or InMemoryBackend()
+        self.generation_check_interval = generation_check_interval
+        self._generation = None
+        self._generation_checked_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def current_generation(self, collection):
+        """
+        Data generation for the collection's database, or None when it can't
+        be determined (responses are then not cached).
+        """
+        generation = self._fresh_generation()
+        if generation is not None:
+            return generation
+        now = time.monotonic()
+        try:
+            generation = get_data_generation(collection.database)
+        except Exception:
+            return None
+        return self._remember_generation(generation, now)
+
+    async def current_generation_async(self, collection):
+        """current_generation() for an async (motor) collection."""
+        generation = self._fresh_generation()
+        if generation is not None:
+            return generation
+        now = time.monotonic()
+        try:
+            doc = await collection.database[META_COLLECTION].find_one({"_id": DATA_GENERATION_ID})
+        except Exception:
+            return None
+        return self._remember_generation(doc.get("value", 0) if doc else 0, now)
+
+    def _fresh_generation(self):
+        with self._lock:
+            if (self._generation is not None
+                    and time.monotonic() - self._generation_checked_at < self.generation_check_interval):
+                return self._generation
+        return None
+
+    def _remember_generation(self, generation, checked_at):
+        if not isinstance(generation, int):
+            return None
+        with self._lock:
+            self._generation = generation
+            self._generation_checked_at = checked_at
+        return generation
+
+    @staticmethod
+    def make_key(generation, **request_parts):
+        return json.dumps([generation, request_parts], sort_keys=True, separators=(",", ":"))
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value)
+
+    # Redis calls block, so on the event loop they go through a worker thread;
+    # the in-process LRU is quicker than the thread hop
+    async def get_async(self, key):
+        if isinstance(self.backend, InMemoryBackend):
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def set_async(self, key, value):
+        if isinstance(self.backend, InMemoryBackend):
+            return self.set(key, value)
+        return await asyncio.to_thread(self.set, key, value)
+
+    def clear(self):
+        """Drop every entry and forget the last generation read."""
+        self.backend.clear()
+        with self._lock:
+            self._generation = None
+            self.hits = 0
+            self.misses = 0
+
+    def cache_info(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "generation": self._generation}
+
+
+def create_response_cache(redis_url=None, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL,
+                          generation_check_interval=DEFAULT_GENERATION_CHECK_INTERVAL):
+    """In-process cache, or a Redis-backed shared one when redis_url is given."""
+    backend = RedisBackend(redis_url, ttl) if redis_url else InMemoryBackend(maxsize, ttl)
+    return ResponseCache(backend, generation_check_interval)
@@ -1,119 +1,61 @@
 import re
-from pymongo import MongoClient
-import os
-from dotenv import load_dotenv
+from database_utils import FILTER_LIMIT, LISTING_SUMMARY_PROJECTION, get_properties_collection
 
-load_dotenv()
+def build_filter_query(query):
+    """
+    Turn a user query into a MongoDB filter on the numeric fields.
+    "3 bedrooms" -> exactly 3, "3+ bedrooms" -> at least 3,
+    "under 400k" -> price <= 400000, "400k" -> within 10% of 400000.
+    """
+    lowered = query.lower()
+    bedroom_match = re.search(r'(\d+)\s*(\+)?\s*(bed|bedroom|bedrooms)', lowered)
+    price_match = re.search(r'(\d[\d,.]*)\s*(k|thousand|million|m|€|euro|eur)?', lowered)
+
+    # Process bedroom filters (checked first: "3 bedrooms" is not a price)
+    if bedroom_match:
+        bed_count = int(bedroom_match.group(1))
+        if bedroom_match.group(2) == "+":  # For "3+ bedrooms"
+            return {"bedrooms_numeric": {"$gte": bed_count}}
+        return {"bedrooms_numeric": bed_count}
+
+    if price_match:
+        price_value = price_match.group(1).replace(',', '').replace('.', '')
+        price_unit = price_match.group(2) if price_match.group(2) else ""
+
+        price = int(price_value)
 
-db_username = os.getenv("MONGO_DB_USERNAME")
-db_password = os.getenv("MONGO_DB_PASSWORD")
-db_cluster_url = os.getenv("MONGO_DB_CLUSTER_URL")
-db_name = os.getenv("MONGO_DB_NAME")
+        if price_unit and ('k' in price_unit or 'thousand' in price_unit):
+            price *= 1000
+        elif price_unit and ('m' in price_unit or 'million' in price_unit):
+            price *= 1000000
 
-connection_string = f"mongodb+srv://{db_username}:{db_password}@{db_cluster_url}/{db_name}?retryWrites=true&w=majority"
-client = MongoClient(connection_string)
-db = client[db_name]
+        if "under" in lowered or "less than" in lowered or "below" in lowered:
+            return {"price_numeric": {"$lte": price}}
+        # look for properties around this price (±10%)
+        return {"price_numeric": {"$gte": price * 0.9, "$lte": price * 1.1}}
 
-def get_properties_collection(collection_name):
-    return db[collection_name]
+    if "price" in lowered or "under" in lowered or "€" in query:
+        # Asked about price without a number: anything that has one
+        return {"price_numeric": {"$ne": None}}
 
-def filter_properties(query):
+    return {}
+
+def filter_properties(query, limit=FILTER_LIMIT, projection=LISTING_SUMMARY_PROJECTION):
     """
-    Filter properties from the database where values are strings.
-    We parse the digits from the user query and from each document to do comparisons.
+    Filter properties from the database by price or bedrooms.
+    The comparison runs in Mongo on price_numeric / bedrooms_numeric and the
+    matches are streamed back through a cursor, at most `limit` of them.
     """
     collection = get_properties_collection("daft")
-    
-   
-    price_match = re.search(r'(\d[\d,.]*)\s*(k|thousand|million|m|€|euro|eur)?', query.lower())
-    bedroom_match = re.search(r'(\d+)\s*(\+)?\s*(bed|bedroom|bedrooms)', query.lower())
-    
-   
-    mongo_query = {}
-    
-    
-    if price_match or "price" in query.lower() or "under" in query.lower() or "€" in query:
-        
-        if price_match:
-            price_value = price_match.group(1).replace(',', '').replace('.', '')
-            price_unit = price_match.group(2) if price_match.group(2) else ""
-            
-          
-            price = int(price_value)
-        
-            if price_unit and ('k' in price_unit or 'thousand' in price_unit):
-                price *= 1000
-            elif price_unit and ('m' in price_unit or 'million' in price_unit):
-                price *= 1000000
-                
-            if "under" in query.lower() or "less than" in query.lower() or "below" in query.lower():
-                mongo_query = {
-                    "price": {"$regex": f".*\\d.*"}  
-                }
-
-            else:
-                mongo_query = {
-                    "price": {"$regex": f".*\\d.*"} 
-                }
-        else:
-            mongo_query = {
-                "price": {"$regex": f".*\\d.*"}  
-            }
-    
-    # Process bedroom filters
-    elif bedroom_match:
-        bed_count = int(bedroom_match.group(1))
-        is_plus = bedroom_match.group(2) == "+"
-        
-        bedroom_pattern = f"{'[0-9]+' if is_plus else bed_count}"
-        mongo_query = {
-            "bedrooms": {"$regex": bedroom_pattern, "$options": "i"}
-        }
 
-    docs = list(collection.find(mongo_query))
     filtered_results = []
-    
-    for doc in docs:
-        should_include = True
-        
-        # Price filtering
-        if price_match and "price" in doc:
-            # Extract numeric value from the price field
-            doc_price_str = doc["price"] if isinstance(doc["price"], str) else str(doc["price"])
-            doc_price_match = re.search(r'[\d,]+', doc_price_str)
-            
-            if doc_price_match:
-                # Convert to numeric
-                doc_price = int(doc_price_match.group(0).replace(',', ''))
-                
-                # Apply the filter
-                if "under" in query.lower() or "less than" in query.lower() or "below" in query.lower():
-                    should_include = doc_price <= price
-                else:
-                    #look for properties around this price (±10%)
-                    should_include = (doc_price >= price * 0.9) and (doc_price <= price * 1.1)
-        
-        # Bedroom filtering
-        elif bedroom_match and "bedrooms" in doc:
-            doc_bed_str = doc["bedrooms"] if isinstance(doc["bedrooms"], str) else str(doc["bedrooms"])
-            doc_bed_match = re.search(r'(\d+)', doc_bed_str)
-            
-            if doc_bed_match:
-                doc_beds = int(doc_bed_match.group(1))
-                
-                # Apply the filter
-                if is_plus:  # For "3+ bedrooms"
-                    should_include = doc_beds >= bed_count
-                else:        # For "3 bedrooms"
-                    should_include = doc_beds == bed_count
-        
-        if should_include:
-            # Ensure the document has an ID
-            if "_id" in doc:
-                # Convert ObjectId to string
-                doc["id"] = str(doc["_id"])
-                del doc["_id"]
-            
-            filtered_results.append(doc)
-    
-    return filtered_results
\ No newline at end of file
+    for doc in collection.find(build_filter_query(query), projection).limit(limit):
+        # Ensure the document has an ID
+        if "_id" in doc:
+            # Convert ObjectId to string
+            doc["id"] = str(doc["_id"])
+            del doc["_id"]
+
+        filtered_results.append(doc)
+
+    return filtered_results
@@ -0,0 +1,87 @@
+import gzip
+import json
+import os
+from datetime import date, datetime
+from bson import ObjectId
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# JSON_SERIALIZER=orjson|json picks the encoder; orjson (Rust) when installed
+DEFAULT_SERIALIZER = "orjson" if orjson is not None else "json"
+
+# Bodies smaller than this go out uncompressed (not worth the CPU / framing)
+DEFAULT_COMPRESS_MIN_SIZE = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+def _default(value):
+    # Types Mongo documents carry that JSON doesn't know
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _orjson_dumps(obj):
+    # orjson writes datetimes as ISO 8601 itself, like _default does for json
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+SERIALIZERS = {"json": _json_dumps}
+if orjson is not None:
+    SERIALIZERS["orjson"] = _orjson_dumps
+
+
+def get_serializer(name=None):
+    """bytes-returning dumps() for `name` (default: JSON_SERIALIZER, else the fastest installed)."""
+    name = name or os.environ.get("JSON_SERIALIZER") or DEFAULT_SERIALIZER
+    if name not in SERIALIZERS:
+        raise RuntimeError(f"JSON serializer {name!r} is not available (installed: {', '.join(SERIALIZERS)})")
+    return SERIALIZERS[name]
+
+
+def accepted_encodings(accept_encoding):
+    """Encodings from an Accept-Encoding header the client accepts (q > 0)."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def compress(body, accept_encoding, min_size=DEFAULT_COMPRESS_MIN_SIZE):
+    """
+    (body, content_encoding) for a response body: brotli when the client
+    accepts it and the package is installed, else gzip, else unchanged
+    (content_encoding None). Bodies under min_size are left alone.
+    """
+    if len(body) < min_size:
+        return body, None
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    if "gzip" in accepted or "*" in accepted:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+    return body, None
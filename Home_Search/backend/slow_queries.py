@@ -0,0 +1,299 @@
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from bson.son import SON
+from pymongo.errors import CollectionInvalid
+from metrics import Counter
+from serialization import get_serializer
+from structured_logging import get_request_id
+
+# Slow-query log: when a search's database phases (count + find + drain)
+# take longer than SLOW_QUERY_MS, the page find and the count are explained
+# with executionStats on a background thread and the plan summary (query
+# shape, stages, indexes, docs examined vs returned) is stored for later
+# index work.
+#
+#   SLOW_QUERY_MS=300              threshold; 0 turns the log off
+#   SLOW_QUERY_SINK=mongo|file|off capped 'slow_queries' collection, or a rotating JSON-lines file
+#   SLOW_QUERY_FILE=slow_queries.jsonl
+#   SLOW_QUERY_SHAPE_INTERVAL=60   explain a given query shape at most once per this many seconds
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 300))
+SLOW_QUERY_SINK = os.environ.get("SLOW_QUERY_SINK", "mongo").lower()
+SLOW_QUERY_FILE = os.environ.get("SLOW_QUERY_FILE", "slow_queries.jsonl")
+SLOW_QUERY_SHAPE_INTERVAL = float(os.environ.get("SLOW_QUERY_SHAPE_INTERVAL", 60))
+
+SLOW_QUERY_COLLECTION = "slow_queries"
+CAPPED_SIZE_BYTES = 16 * 1024 * 1024
+FILE_MAX_BYTES = 10 * 1024 * 1024
+FILE_BACKUP_COUNT = 5
+
+# Explains waiting for the worker; beyond this, slow queries are counted but not explained
+MAX_PENDING = 32
+# Query shapes remembered for the once-per-interval rule
+MAX_TRACKED_SHAPES = 1024
+
+# Request phases (see metrics.RequestTimer) that are database time
+DB_PHASES = ("count", "find", "drain", "query")
+
+# Operators whose array holds sub-queries; any other array is a value
+LOGICAL_OPERATORS = ("$and", "$or", "$nor")
+
+logger = logging.getLogger(__name__)
+_dumps = get_serializer()
+
+SLOW_QUERIES = Counter("slow_queries_total", "Searches over the slow-query threshold, by whether a COLLSCAN was used.",
+                       ["collscan"])
+SLOW_QUERIES_NOT_EXPLAINED = Counter(
+    "slow_queries_not_explained_total",
+    "Slow searches that were not explained (shape explained recently, worker backlog, or explain failed).",
+    ["reason"],
+)
+
+
+def query_shape(query):
+    """The query with every value replaced by "?" (field names and operators kept)."""
+    if isinstance(query, dict):
+        return {
+            key: [query_shape(clause) for clause in value] if key in LOGICAL_OPERATORS and isinstance(value, list)
+            else query_shape(value)
+            for key, value in query.items()
+        }
+    return "?"
+
+
+def shape_id(shape):
+    return hashlib.sha1(json.dumps(shape, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _plan_section(explain):
+    # find explains carry queryPlanner at the top; aggregate explains either
+    # do too (whole pipeline pushed down) or nest it in the $cursor stage
+    if "queryPlanner" in explain:
+        return explain
+    for stage in explain.get("stages", []):
+        if "$cursor" in stage:
+            return stage["$cursor"]
+    return explain
+
+
+def summarize_explain(explain):
+    """Winning plan stages and indexes, COLLSCAN flag and the executionStats counters of an explain result."""
+    section = _plan_section(explain)
+    winning = section.get("queryPlanner", {}).get("winningPlan", {})
+    winning = winning.get("queryPlan", winning)  # slot-based engine wraps the plan
+
+    stages, indexes = [], []
+    pending = [winning]
+    while pending:
+        node = pending.pop(0)
+        if "stage" in node:
+            stages.append(node["stage"])
+        if "indexName" in node:
+            indexes.append(node["indexName"])
+        if "inputStage" in node:
+            pending.append(node["inputStage"])
+        pending.extend(node.get("inputStages", []))
+
+    stats = section.get("executionStats", {})
+    return {
+        "stages": stages,
+        "indexes": indexes,
+        "collscan": "COLLSCAN" in stages,
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "n_returned": stats.get("nReturned"),
+        "execution_ms": stats.get("executionTimeMillis"),
+    }
+
+
+def explain_find(collection, spec, verbosity="executionStats"):
+    """explain of the find described by an app.properties_page_spec() dict."""
+    command = SON([("find", collection.name), ("filter", spec["filter"])])
+    if spec.get("projection"):
+        command["projection"] = spec["projection"]
+    if spec.get("sort"):
+        command["sort"] = SON(spec["sort"])
+    if spec.get("skip"):
+        command["skip"] = spec["skip"]
+    if spec.get("limit"):
+        command["limit"] = spec["limit"]
+    return collection.database.command("explain", command, verbosity=verbosity)
+
+
+def explain_count(collection, query, verbosity="executionStats"):
+    """explain of count_documents(query) (the same pipeline pymongo sends)."""
+    command = SON([
+        ("aggregate", collection.name),
+        ("pipeline", [{"$match": query}, {"$group": {"_id": 1, "n": {"$sum": 1}}}]),
+        ("cursor", {}),
+    ])
+    return collection.database.command("explain", command, verbosity=verbosity)
+
+
+# -----------------------------------------------------------------------------
+# Sinks
+# -----------------------------------------------------------------------------
+class MongoSlowQuerySink:
+    """Stores records in a capped collection next to the searched one (created on first write)."""
+
+    def __init__(self, name=SLOW_QUERY_COLLECTION, size_bytes=CAPPED_SIZE_BYTES):
+        self.name = name
+        self.size_bytes = size_bytes
+        self._created = False
+
+    def write(self, collection, record):
+        database = collection.database
+        if not self._created:
+            try:
+                database.create_collection(self.name, capped=True, size=self.size_bytes)
+            except CollectionInvalid:
+                pass  # already there
+            self._created = True
+        # Queries have $-prefixed keys, which don't belong in stored documents
+        stored = dict(record, query=_dumps(record["query"]).decode(), query_shape=json.dumps(record["query_shape"]))
+        database[self.name].insert_one(stored)
+
+
+class FileSlowQuerySink:
+    """Appends records as JSON lines to a size-rotated local file."""
+
+    def __init__(self, path=SLOW_QUERY_FILE, max_bytes=FILE_MAX_BYTES, backup_count=FILE_BACKUP_COUNT):
+        self.path = path
+        self._handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                             encoding="utf-8", delay=True)
+
+    def write(self, collection, record):
+        line = _dumps(record).decode()
+        self._handler.handle(logging.makeLogRecord({"msg": line}))
+
+    def close(self):
+        self._handler.close()
+
+
+class SlowQueryLog:
+    """
+    Decides which searches are slow and explains them off the request
+    thread (one worker per process, at most MAX_PENDING queued, each query
+    shape at most once per `shape_interval` seconds).
+    """
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, sink=None, shape_interval=SLOW_QUERY_SHAPE_INTERVAL,
+                 max_pending=MAX_PENDING):
+        self.threshold_ms = threshold_ms
+        self.sink = sink
+        self.shape_interval = shape_interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._explained_at = OrderedDict()
+        self._futures = set()
+        self._executor = None
+        self._executor_pid = None
+
+    @property
+    def enabled(self):
+        return self.sink is not None and self.threshold_ms > 0
+
+    def _get_executor(self):
+        # A forked worker doesn't inherit the parent's thread
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+            self._executor_pid = pid
+            self._futures = set()
+        return self._executor
+
+    def _admit(self, key, now):
+        # Called with the lock held: not explained recently and room in the queue
+        explained_at = self._explained_at.get(key)
+        if explained_at is not None and now - explained_at < self.shape_interval:
+            return "recent"
+        if len(self._futures) >= self.max_pending:
+            return "backlog"
+        self._explained_at[key] = now
+        self._explained_at.move_to_end(key)
+        while len(self._explained_at) > MAX_TRACKED_SHAPES:
+            self._explained_at.popitem(last=False)
+        return None
+
+    def observe(self, collection, spec, timer, count_query=None, **context):
+        """
+        Check one search's database time (from `timer`) against the threshold
+        and, if it is slow, queue the explain of its page find (`spec`) and
+        count (`count_query`). Returns True when an explain was queued.
+        `context` (e.g. search_term, endpoint) is stored with the record.
+        """
+        if not self.enabled or collection is None:
+            return False
+        timings = timer.phase_ms()
+        db_ms = sum(timings.get(phase, 0.0) for phase in DB_PHASES)
+        if db_ms < self.threshold_ms:
+            return False
+
+        shape = query_shape(count_query if count_query is not None else spec["filter"])
+        key = f"{collection.name}:{shape_id(shape)}"
+        with self._lock:
+            executor = self._get_executor()
+            skipped = self._admit(key, time.monotonic())
+            if skipped:
+                SLOW_QUERIES_NOT_EXPLAINED.inc(reason=skipped)
+                return False
+            record = dict(
+                context,
+                captured_at=datetime.now(timezone.utc),
+                request_id=get_request_id(),
+                collection=collection.name,
+                shape_id=key.split(":", 1)[1],
+                query_shape=shape,
+                query=count_query if count_query is not None else spec["filter"],
+                db_ms=round(db_ms, 2),
+                timings_ms=timings,
+            )
+            future = executor.submit(self._explain, collection, spec, count_query, record)
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+        return True
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _explain(self, collection, spec, count_query, record):
+        try:
+            plans = {"find": summarize_explain(explain_find(collection, spec))}
+            if count_query is not None:
+                plans["count"] = summarize_explain(explain_count(collection, count_query))
+            record["plans"] = plans
+            record["collscan"] = any(plan["collscan"] for plan in plans.values())
+            SLOW_QUERIES.inc(collscan=str(record["collscan"]).lower())
+            logger.warning("Slow query", extra={
+                "shape_id": record["shape_id"], "db_ms": record["db_ms"], "collscan": record["collscan"],
+                "docs_examined": plans["find"]["docs_examined"], "n_returned": plans["find"]["n_returned"],
+            })
+            self.sink.write(collection, record)
+        except Exception:
+            SLOW_QUERIES_NOT_EXPLAINED.inc(reason="error")
+            logger.warning("Could not explain slow query %s", record["shape_id"], exc_info=True)
+
+    def flush(self, timeout=None):
+        """Wait for the queued explains to finish."""
+        with self._lock:
+            futures = list(self._futures)
+        wait(futures, timeout=timeout)
+
+
+def create_slow_query_log(threshold_ms=SLOW_QUERY_MS, sink=SLOW_QUERY_SINK, path=SLOW_QUERY_FILE,
+                          shape_interval=SLOW_QUERY_SHAPE_INTERVAL):
+    """SlowQueryLog for the configured sink ('mongo', 'file' or 'off')."""
+    if sink == "mongo":
+        return SlowQueryLog(threshold_ms, MongoSlowQuerySink(), shape_interval)
+    if sink == "file":
+        return SlowQueryLog(threshold_ms, FileSlowQuerySink(path), shape_interval)
+    return SlowQueryLog(threshold_ms, None, shape_interval)
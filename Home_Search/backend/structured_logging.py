@@ -0,0 +1,239 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import uuid
+import zlib
+from datetime import datetime, timezone
+from metrics import Counter
+from serialization import get_serializer
+
+# Logging for the API and the scrapers. Records are put on a bounded queue
+# and written by a listener thread, so a request or crawl thread never waits
+# on stdout (records are dropped, and counted, if the queue is full).
+# Output is one JSON object per line carrying the request ID.
+#
+#   LOG_LEVEL=DEBUG|INFO|WARNING|...   (default INFO)
+#   LOG_FORMAT=json|text               (default json)
+#   LOG_REQUEST_SAMPLE_RATE=0.01       share of requests whose per-request lines (INFO) are kept
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+LOG_REQUEST_SAMPLE_RATE = float(os.environ.get("LOG_REQUEST_SAMPLE_RATE", 0.01))
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+
+# Incoming X-Request-ID values we pass through (anything else gets a fresh ID)
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+LOG_RECORDS_DROPPED = Counter("log_records_dropped_total", "Log records dropped because the log queue was full.")
+
+_dumps = get_serializer()
+
+# -----------------------------------------------------------------------------
+# Request IDs (a context variable: per thread under Flask, per task under ASGI)
+# -----------------------------------------------------------------------------
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def new_request_id(incoming=None):
+    """The client's X-Request-ID if it looks like one, else a new random ID."""
+    if incoming and REQUEST_ID_RE.match(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+
+def set_request_id(request_id):
+    """Bind `request_id` to the current context; returns a token for reset_request_id."""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps each record with the current request ID (in the thread that logs it, before the queue)."""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = _request_id.get()
+        return True
+
+
+class RequestSampler(logging.Filter):
+    """
+    Keeps the records of a `rate` share of requests, decided per request ID
+    so a sampled request keeps all of its lines. WARNING and above always pass.
+    """
+
+    def __init__(self, rate=None):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = LOG_REQUEST_SAMPLE_RATE if self.rate is None else self.rate
+        if rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        request_id = _request_id.get()
+        if request_id is None:
+            return random.random() < rate
+        return zlib.crc32(request_id.encode()) % 10000 < rate * 10000
+
+
+def get_request_logger(name):
+    """Logger for per-request lines (`name`.requests, logged at INFO), sampled by RequestSampler."""
+    logger = logging.getLogger(f"{name}.requests")
+    if not any(isinstance(f, RequestSampler) for f in logger.filters):
+        logger.addFilter(RequestSampler())
+    return logger
+
+
+# -----------------------------------------------------------------------------
+# Formatting
+# -----------------------------------------------------------------------------
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, message, request_id, plus any extra= fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        # json.dumps(default=str) for an extra= value the serializer doesn't know
+        return _encode(entry)
+
+
+def _encode(value):
+    try:
+        return _dumps(value).decode("utf-8")
+    except TypeError:
+        return json.dumps(value, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    """TEXT_FORMAT, then any extra= fields as key=<JSON value>."""
+
+    def format(self, record):
+        if getattr(record, "request_id", None) is None:
+            record.request_id = "-"
+        return super().format(record)
+
+    def formatMessage(self, record):
+        line = super().formatMessage(record)
+        extras = [f"{key}={_encode(value)}" for key, value in vars(record).items() if key not in _RECORD_ATTRS]
+        return " ".join([line] + extras)
+
+
+# -----------------------------------------------------------------------------
+# Queue handler / listener
+# -----------------------------------------------------------------------------
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+    def prepare(self, record):
+        # Resolve the message and traceback here, where the arguments are
+        # still valid, but keep extra= fields and request_id for the formatter
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+_output_handlers = []
+
+
+def _start_listener():
+    global _listener
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *_output_handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def configure_logging(level=None, fmt=None, stream=None):
+    """
+    Route the root logger through the queue handler (once per process;
+    later calls only change the level). Entry points call this: the API
+    modules at import, the scraper CLIs in __main__.
+    """
+    global _queue_handler, _output_handlers
+    level = (level or LOG_LEVEL).upper()
+    with _lock:
+        root = logging.getLogger()
+        root.setLevel(level)
+        if _queue_handler is not None:
+            return
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(_TextFormatter(TEXT_FORMAT) if (fmt or LOG_FORMAT) == "text" else JsonFormatter())
+        _output_handlers = [output]
+
+        _queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(RequestContextFilter())
+        root.addHandler(_queue_handler)
+        _start_listener()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Write out whatever is queued and stop the listener thread."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _restart_listener_after_fork():
+    # The listener thread doesn't survive a fork (and the queue's lock may
+    # have been held by it): a forked worker gets a fresh queue and listener
+    global _lock
+    _lock = threading.Lock()
+    if _queue_handler is not None:
+        _queue_handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+        _start_listener()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listener_after_fork)
@@ -3,4 +3,26 @@ import sys
 import os
 
 # Add parent directory to Python path so tests can import app modules
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
\ No newline at end of file
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# The API would otherwise build indexes on whatever collection the first
+# request sees; tests that want the bootstrap turn it back on
+os.environ.setdefault("ENSURE_INDEXES", "false")
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """Each test starts with an empty /api/properties response cache."""
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.response_cache.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def reset_mongo_client():
+    """Don't let a client created (or mocked) in one test leak into the next."""
+    yield
+    database_utils = sys.modules.get('database_utils')
+    if database_utils is not None:
+        database_utils.reset_client()
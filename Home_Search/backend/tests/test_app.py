@@ -1,7 +1,25 @@
 import pytest
 import json
-from app import app, parse_search_query
+from app import app, build_properties_response, parse_search_query
+from query_planner import QueryPlanner
+from pagination import decode_cursor, encode_cursor, keyset_condition
+from bson import ObjectId
+from response_cache import InMemoryBackend, ResponseCache
+from geo import EARTH_RADIUS_KM
+from serialization import SERIALIZERS, get_serializer
+from structured_logging import (
+    LOG_RECORDS_DROPPED, TEXT_FORMAT, JsonFormatter, NonBlockingQueueHandler, RequestContextFilter, RequestSampler,
+    _TextFormatter, reset_request_id, set_request_id,
+)
+import io
+import logging
+import logging.handlers
+import queue
+from datetime import datetime
+import gzip
+import time
 from unittest.mock import patch, MagicMock
+import mongomock
 
 @pytest.fixture
 def client():
@@ -28,11 +46,12 @@ def test_parse_search_query_beds():
     query = parse_search_query("3 bed house")
     assert "$and" in query
     
-    # Check for bedroom condition
+    # Check for bedroom condition (on the numeric field set at ingest)
     bed_match = False
     for condition in query["$and"]:
-        if "bedrooms" in condition:
+        if "bedrooms_numeric" in condition:
             bed_match = True
+            assert condition["bedrooms_numeric"] == 3
             break
     assert bed_match, "Bedroom condition not found in query"
 
@@ -51,6 +70,88 @@ def test_parse_search_query_price():
             break
     assert price_match, "Price condition not found in query"
 
+def test_query_planner_cache_hits():
+    """Test repeated (normalized) search terms are served from the planner cache"""
+    planner = QueryPlanner(cache_size=8)
+    first = planner.plan("House 3 bed under 400k")
+    second = planner.plan("  house 3 bed   under 400k ")
+
+    assert first == second
+    assert planner.cache_info() == {"hits": 1, "misses": 1, "size": 1, "maxsize": 8}
+
+def test_query_planner_cache_returns_copies():
+    """Test mutating a returned query does not corrupt the cached entry"""
+    planner = QueryPlanner()
+    query = planner.plan("dublin")
+    query["$and"].append({"price_numeric": {"$lte": 1}})
+
+    assert {"price_numeric": {"$lte": 1}} not in planner.plan("dublin")["$and"]
+
+def test_query_planner_cache_eviction():
+    """Test the cache is bounded and evicts the least recently used term"""
+    planner = QueryPlanner(cache_size=2)
+    planner.plan("cork")
+    planner.plan("dublin")
+    planner.plan("cork")      # refresh cork
+    planner.plan("galway")    # evicts dublin
+    planner.plan("dublin")
+
+    info = planner.cache_info()
+    assert info["size"] == 2
+    assert info["hits"] == 1
+    assert info["misses"] == 4
+
+def test_parse_search_query_typed_fields():
+    """Test counts, county, BER and floor area become range/equality predicates on the typed fields"""
+    query = parse_search_query("3+ bed 2 bath, ber b, over 100 sqm in cork")
+    assert {"bedrooms_numeric": {"$gte": 3}} in query["$and"]
+    assert {"bathrooms_numeric": 2} in query["$and"]
+    assert {"ber_ordinal": {"$lte": 6}} in query["$and"]  # B3 or better
+    assert {"area_sqm": {"$gte": 100}} in query["$and"]
+    assert {"$or": [{"$or": [
+        {"county": "Cork"},
+        {"county": None, "$or": [
+            {"address": {"$regex": "cork", "$options": "i"}},
+            {"description": {"$regex": "\\bin cork\\b", "$options": "i"}},
+        ]},
+    ]}]} in query["$and"]
+    # Only the fallback for listings without a county is a regex
+    assert "$regex" not in json.dumps([c for c in query["$and"] if "$or" not in c])
+
+def test_county_search_matches_listings_without_county():
+    """Test a county search still finds listings whose county couldn't be derived"""
+    collection = mongomock.MongoClient()['test_db']['daft']
+    collection.insert_many([
+        {"link": "1", "address": "1 Main St, Douglas, Co. Cork", "county": "Cork"},
+        {"link": "2", "address": "Apt 4, The Marina, Cork T12"},                 # never backfilled
+        {"link": "3", "address": "Apt 2, Riverside Quay", "county": None,         # unparseable county
+         "description": "Bright apartment in Cork city centre."},
+        {"link": "4", "address": "2 Quay Rd, Galway", "county": "Galway"},
+        {"link": "5", "address": "3 Cork Road, Waterford", "county": "Waterford"},
+    ])
+    query = parse_search_query("cork")
+    assert sorted(doc["link"] for doc in collection.find(query)) == ["1", "2", "3"]
+
+def test_query_planner_multi_word_location():
+    """Test multi-word locations are detected once and removed from the segments"""
+    planner = QueryPlanner()
+    query = planner.plan("2 bed in dun laoghaire")
+
+    location_condition = query["$and"][-1]
+    assert len(location_condition["$or"]) == 1
+    assert location_condition["$or"][0]["$or"][0] == {"address": {"$regex": "dun laoghaire", "$options": "i"}}
+
+def test_parse_search_query_text_fallback():
+    """Test unmatched segments are pooled into a single $text clause"""
+    query = parse_search_query("3 bed, near the sea, quiet cul de sac")
+    text_conditions = [c for c in query["$and"] if "$text" in c]
+    assert text_conditions == [{"$text": {"$search": "near the sea quiet cul de sac"}}]
+    assert not any("$regex" in str(c) and "sea" in str(c) for c in query["$and"])
+
+def test_parse_search_query_whole_term_text_fallback():
+    """Test a term with nothing to interpret becomes a full-text query"""
+    assert parse_search_query("cosy cottage") == {"$and": [{"$text": {"$search": "cosy cottage"}}]}
+
 @patch('app.get_properties_collection')
 def test_get_properties_no_params(mock_get_collection, client):
     """Test /api/properties endpoint with no parameters"""
@@ -80,9 +181,12 @@ def test_get_properties_no_params(mock_get_collection, client):
     # Check response structure
     assert 'properties' in data
     assert 'total' in data
-    assert 'queryUsed' in data
+    assert 'queryUsed' not in data  # only echoed when debugging
     assert data['total'] == 1
 
+    data = json.loads(client.get('/api/properties?debug=1').data)
+    assert data['queryUsed'] == {}
+
 @patch('app.get_properties_collection')
 def test_get_properties_with_search(mock_get_collection, client):
     """Test /api/properties endpoint with search parameter"""
@@ -155,4 +259,303 @@ def test_get_properties_error(mock_get_collection, client):
     assert response.status_code == 500
     data = json.loads(response.data)
     assert 'error' in data
-    assert 'Database error' in data['error']
\ No newline at end of file
+    assert 'Database error' in data['error']
+
+def test_cursor_round_trip():
+    """Test a cursor decodes back to the sort key it was built from"""
+    oid = ObjectId()
+    assert decode_cursor(encode_cursor({"price_numeric": 350000, "_id": oid})) == (350000, oid)
+    assert decode_cursor(encode_cursor({"price_numeric": None, "_id": oid})) == (None, oid)
+
+def test_keyset_condition_null_price():
+    """Test the keyset condition after an unpriced listing also includes every priced one"""
+    oid = ObjectId()
+    condition = keyset_condition(None, oid)
+    assert {"price_numeric": {"$ne": None}} in condition["$or"]
+    assert {"price_numeric": None, "_id": {"$gt": oid}} in condition["$or"]
+
+@patch('app.get_properties_collection')
+def test_get_properties_invalid_cursor(mock_get_collection, client):
+    """Test a malformed cursor is rejected with 400"""
+    mock_get_collection.return_value = MagicMock()
+
+    response = client.get('/api/properties?cursor=not-a-cursor')
+    assert response.status_code == 400
+    assert 'Invalid cursor' in json.loads(response.data)['error']
+
+@patch('app.get_properties_collection')
+def test_get_properties_invalid_limit_and_page(mock_get_collection, client):
+    """Test limit/page that are not whole numbers in range are rejected with 400, before any query"""
+    mock_collection = MagicMock()
+    mock_get_collection.return_value = mock_collection
+
+    for query_string in ["limit=0&cursor=", "limit=abc", "limit=-5", "limit=101", "page=0", "page=x"]:
+        response = client.get(f'/api/properties?{query_string}')
+        assert response.status_code == 400, query_string
+        assert 'error' in json.loads(response.data)
+    mock_collection.find.assert_not_called()
+    mock_collection.count_documents.assert_not_called()
+
+@patch('app.get_properties_collection')
+def test_get_property_facets_invalid_limit_and_page(mock_get_collection, client):
+    """Test the facets endpoint rejects bad limit/page with 400 before building the pipeline"""
+    mock_collection = MagicMock()
+    mock_get_collection.return_value = mock_collection
+
+    for query_string in ["limit=0", "limit=-1", "limit=abc", "limit=101", "page=0"]:
+        response = client.get(f'/api/properties/facets?{query_string}')
+        assert response.status_code == 400, query_string
+    mock_collection.aggregate.assert_not_called()
+    mock_collection.find.assert_not_called()
+
+def test_build_properties_response_empty_cursor_page():
+    """Test an empty cursor page ends the walk instead of failing on its last document"""
+    response = build_properties_response([], 0, {}, "", 0)
+    assert response["nextCursor"] is None
+    assert response["properties"] == []
+
+@patch('app.get_properties_collection')
+def test_get_properties_text_search_sorted_by_relevance(mock_get_collection, client):
+    """Test full-text searches are ordered by textScore and the score is not returned"""
+    mock_collection = MagicMock()
+    mock_get_collection.return_value = mock_collection
+    mock_cursor = MagicMock()
+    mock_cursor.sort.return_value = mock_cursor
+    mock_cursor.skip.return_value = mock_cursor
+    mock_cursor.limit.return_value = [{"address": "Seaview Cottage", "score": 2.5}]
+    mock_collection.find.return_value = mock_cursor
+    mock_collection.count_documents.return_value = 1
+
+    response = client.get('/api/properties?searchTerm=cosy+cottage')
+    data = json.loads(response.data)
+
+    projection = mock_collection.find.call_args[0][1]
+    assert projection["score"] == {"$meta": "textScore"}
+    mock_cursor.sort.assert_called_once_with([("score", {"$meta": "textScore"})])
+    assert data['properties'] == [{"address": "Seaview Cottage"}]
+
+
+def test_response_cache_backend_lru_and_ttl():
+    """Test the in-memory backend evicts least recently used entries and expires old ones"""
+    backend = InMemoryBackend(maxsize=2, ttl=0.05)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    backend.get("a")
+    backend.set("c", 3)  # evicts b
+    assert backend.get("b") is None
+    assert backend.get("a") == 1
+
+    time.sleep(0.06)
+    assert backend.get("a") is None
+    assert backend.get("c") is None
+
+def test_response_cache_async_keeps_network_calls_off_the_event_loop():
+    """Test get_async/set_async run a blocking (e.g. Redis) backend on a worker thread"""
+    import asyncio
+    import threading
+
+    class RecordingBackend:
+        def __init__(self):
+            self.entries = {}
+            self.threads = []
+
+        def get(self, key):
+            self.threads.append(threading.get_ident())
+            return self.entries.get(key)
+
+        def set(self, key, value):
+            self.threads.append(threading.get_ident())
+            self.entries[key] = value
+
+    backend = RecordingBackend()
+    cache = ResponseCache(backend)
+
+    async def round_trip():
+        await cache.set_async("k", {"total": 1})
+        return await cache.get_async("k"), threading.get_ident()
+
+    value, loop_thread = asyncio.run(round_trip())
+    assert value == {"total": 1}
+    assert len(backend.threads) == 2
+    assert loop_thread not in backend.threads
+
+def test_response_cache_skips_unknown_generation():
+    """Test responses are not cached when the data generation can't be read"""
+    cache = ResponseCache()
+    collection = MagicMock()
+    collection.database.__getitem__.return_value.find_one.side_effect = Exception("no meta")
+    assert cache.current_generation(collection) is None
+
+
+@patch('app.get_properties_collection')
+def test_get_properties_near_and_bbox(mock_get_collection, client):
+    """Test near/radius and bbox narrow the search with indexed $geoWithin conditions"""
+    mock_collection = MagicMock()
+    mock_get_collection.return_value = mock_collection
+    mock_cursor = MagicMock()
+    mock_cursor.skip.return_value = mock_cursor
+    mock_cursor.limit.return_value = []
+    mock_collection.find.return_value = mock_cursor
+    mock_collection.count_documents.return_value = 0
+
+    response = client.get('/api/properties?searchTerm=3+bed&near=53.35,-6.26&radius=2')
+    assert response.status_code == 200
+    query = mock_collection.count_documents.call_args[0][0]
+    assert query["location"] == {"$geoWithin": {"$centerSphere": [[-6.26, 53.35], 2 / EARTH_RADIUS_KM]}}
+    assert "$and" in query  # the search term still applies
+
+    client.get('/api/properties?bbox=-6.3,53.3,-6.2,53.4')
+    polygon = mock_collection.count_documents.call_args[0][0]["location"]["$geoWithin"]["$geometry"]
+    assert polygon["coordinates"][0][0] == polygon["coordinates"][0][-1] == [-6.3, 53.3]
+
+    for bad in ['near=dublin', 'near=53.35,-6.26&radius=-1', 'bbox=-6.2,53.4,-6.3,53.3', 'bbox=1,2,3']:
+        response = client.get(f'/api/properties?{bad}')
+        assert response.status_code == 400, bad
+
+
+@patch('app.get_properties_collection')
+def test_get_properties_compression(mock_get_collection, client):
+    """Test large responses are gzip-compressed when the client accepts it"""
+    mock_collection = MagicMock()
+    mock_get_collection.return_value = mock_collection
+    mock_cursor = MagicMock()
+    mock_cursor.skip.return_value = mock_cursor
+    mock_cursor.limit.return_value = [
+        {"address": f"{i} Main St, Dublin", "description": "Bright and spacious " * 20,
+         "listed": datetime(2024, 3, 5), "ref": ObjectId("64b7f0c2a1b2c3d4e5f60718")}
+        for i in range(20)
+    ]
+    mock_collection.find.return_value = mock_cursor
+    mock_collection.count_documents.return_value = 20
+
+    response = client.get('/api/properties', headers={"Accept-Encoding": "gzip, deflate"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    data = json.loads(gzip.decompress(response.data))
+    assert len(data['properties']) == 20
+    assert data['properties'][0]['listed'] == "2024-03-05T00:00:00"
+    assert data['properties'][0]['ref'] == "64b7f0c2a1b2c3d4e5f60718"
+
+    # No Accept-Encoding (or gzip refused): plain JSON
+    response = client.get('/api/properties', headers={"Accept-Encoding": "gzip;q=0"})
+    assert "Content-Encoding" not in response.headers
+    assert json.loads(response.data)['total'] == 20
+
+def test_serializers_agree():
+    """Test the orjson and stdlib serializers produce the same JSON"""
+    payload = {"a": [1, 2.5, None, "é"], "when": datetime(2024, 3, 5, 12, 30), "id": ObjectId("64b7f0c2a1b2c3d4e5f60718")}
+    outputs = [json.loads(get_serializer(name)(payload)) for name in SERIALIZERS]
+    assert all(output == outputs[0] for output in outputs)
+    assert outputs[0]["when"] == "2024-03-05T12:30:00"
+
+@patch('app.get_properties_collection')
+def test_server_timing_and_metrics(mock_get_collection, client):
+    """Test request phases are reported in Server-Timing and exposed on /metrics"""
+    mock_collection = MagicMock()
+    mock_get_collection.return_value = mock_collection
+    mock_collection.database.__getitem__.return_value.find_one.return_value = {"value": 1}
+    mock_cursor = MagicMock()
+    mock_cursor.skip.return_value = mock_cursor
+    mock_cursor.limit.return_value = [{"address": "1 Main St, Cork"}, {"address": "2 Main St, Cork"}]
+    mock_collection.find.return_value = mock_cursor
+    mock_collection.count_documents.return_value = 1
+
+    response = client.get('/api/properties?searchTerm=2+bed+cork')
+    phases = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+    assert phases == ["cache", "parse", "count", "find", "drain", "serialize", "compress", "total"]
+    # Same search again: answered from the response cache
+    response = client.get('/api/properties?searchTerm=2+bed+cork')
+    assert "count" not in response.headers["Server-Timing"]
+
+    response = client.get('/metrics')
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    text = response.get_data(as_text=True)
+    assert "# TYPE api_request_phase_duration_seconds histogram" in text
+    assert 'api_request_phase_duration_seconds_bucket{endpoint="get_properties",phase="count",le="+Inf"}' in text
+    assert 'api_request_duration_seconds_count{endpoint="get_properties",status="200"}' in text
+    assert 'api_cache_requests_total{cache="response",result="hit"}' in text
+    assert 'query_planner_cache_requests_total{result="miss"}' in text
+
+
+def test_structured_logging_queue_and_json():
+    """Test records go through the queue as JSON lines with the request ID and extra fields"""
+    stream = io.StringIO()
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+    handler = NonBlockingQueueHandler(queue.Queue(100))
+    handler.addFilter(RequestContextFilter())
+    listener = logging.handlers.QueueListener(handler.queue, output)
+    logger = logging.getLogger("test.structured")
+    logger.propagate = False
+    logger.addHandler(handler)
+    listener.start()
+    token = set_request_id("req-123")
+    try:
+        logger.warning("Query for %s", "dublin", extra={"query": {"county": "Dublin"}, "when": datetime(2024, 3, 5)})
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("Failed")
+    finally:
+        reset_request_id(token)
+        listener.stop()
+        logger.removeHandler(handler)
+
+    first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert first["message"] == "Query for dublin"
+    assert first["level"] == "WARNING"
+    assert first["request_id"] == "req-123"
+    assert first["query"] == {"county": "Dublin"}
+    assert first["when"] == "2024-03-05T00:00:00"
+    assert "ValueError: boom" in second["exc_info"]
+
+    # A full queue drops records instead of blocking the caller
+    full = NonBlockingQueueHandler(queue.Queue(1))
+    dropped = LOG_RECORDS_DROPPED.value()
+    for _ in range(3):
+        full.handle(logging.LogRecord("test", logging.INFO, __file__, 1, "line", (), None))
+    assert LOG_RECORDS_DROPPED.value() == dropped + 2
+
+def test_request_sampler_and_request_id_header(client):
+    """Test per-request lines are sampled per request ID, and X-Request-ID is echoed"""
+    sampler = RequestSampler(rate=0.5)
+    debug = logging.LogRecord("app.requests", logging.DEBUG, __file__, 1, "line", (), None)
+    warning = logging.LogRecord("app.requests", logging.WARNING, __file__, 1, "line", (), None)
+    kept = 0
+    for i in range(200):
+        token = set_request_id(f"request-{i}")
+        decision = sampler.filter(debug)
+        assert sampler.filter(debug) == decision  # same request, same decision
+        assert sampler.filter(warning)
+        kept += decision
+        reset_request_id(token)
+    assert 50 < kept < 150
+    assert not RequestSampler(rate=0).filter(debug)
+
+    response = client.get('/api/property', headers={"X-Request-ID": "abc-123"})
+    assert response.headers["X-Request-ID"] == "abc-123"
+    response = client.get('/api/property', headers={"X-Request-ID": "not valid\u00e9"})
+    assert len(response.headers["X-Request-ID"]) == 32
+
+@patch('app.get_properties_collection')
+def test_sampled_request_lines_at_info_and_text_extras(mock_get_collection, client, caplog):
+    """Test sampled per-request lines are INFO (shown at the default level) and text output keeps extra fields"""
+    mock_collection = MagicMock()
+    mock_get_collection.return_value = mock_collection
+    mock_cursor = MagicMock()
+    mock_cursor.skip.return_value = mock_cursor
+    mock_cursor.limit.return_value = [{"address": "1 Main St, Cork"}]
+    mock_collection.find.return_value = mock_cursor
+    mock_collection.count_documents.return_value = 1
+
+    caplog.set_level(logging.INFO)
+    with patch('structured_logging.LOG_REQUEST_SAMPLE_RATE', 1.0):
+        client.get('/api/properties?searchTerm=2+bed+cork')
+    lines = [record for record in caplog.records if record.name == "app.requests"]
+    assert [record.getMessage() for record in lines] == ["Generated query", "Database query"]
+    assert all(record.levelno == logging.INFO for record in lines)
+
+    record = logging.makeLogRecord({"name": "daft_listings_scraper", "levelno": logging.INFO, "levelname": "INFO",
+                                    "msg": "Bulk write totals", "totals": {"inserted": 2}, "request_id": None})
+    line = _TextFormatter(TEXT_FORMAT).format(record)
+    assert line.endswith('INFO daft_listings_scraper [-] Bulk write totals totals={"inserted":2}')
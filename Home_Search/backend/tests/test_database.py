@@ -1,8 +1,27 @@
 # File: tests/test_database.py
 import pytest
 from unittest.mock import patch, MagicMock
+import os
 import re
-from database_utils import get_properties_collection, filter_properties
+import subprocess
+import sys
+import time
+import database_utils
+from database_utils import get_client, get_properties_collection, filter_properties
+from index_manager import INDEXES, ensure_indexes, index_status
+import mongomock
+from pymongo.errors import BulkWriteError
+from bulk_writer import BulkUpsertWriter
+from geo import backfill_locations
+from migrate_derived_fields import backfill_derived_fields, load_checkpoint
+from metrics import (
+    MONGO_POOL_LISTENER, POOL_CHECKED_OUT, POOL_CHECKOUT_FAILURES, POOL_CHECKOUT_SECONDS, POOL_CONNECTIONS,
+    MongoPoolMetrics,
+)
+from pymongo import monitoring
+from slow_queries import FileSlowQuerySink, SlowQueryLog, query_shape, summarize_explain
+from metrics import RequestTimer
+import json
 
 @patch('database_utils.MongoClient')
 def test_get_properties_collection(mock_mongo_client):
@@ -19,6 +38,38 @@ def test_get_properties_collection(mock_mongo_client):
     # Just check that the function returns something
     assert collection is not None
 
+def test_import_does_not_connect():
+    """Test importing the app and scrapers doesn't create a Mongo client"""
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = (
+        "import database_utils, app, daft_listings_scraper, index_manager; "
+        "assert database_utils._client is None"
+    )
+    env = dict(os.environ, MONGO_DB_CLUSTER_URL="unresolvable.invalid")
+    subprocess.run([sys.executable, "-c", code], cwd=backend_dir, env=env, check=True, timeout=60)
+
+@patch('database_utils.MongoClient')
+def test_get_client_is_lazy_pooled_and_recreated_after_fork(mock_mongo_client, monkeypatch):
+    """Test the client is built once per process with the configured pool"""
+    mock_mongo_client.side_effect = lambda *args, **kwargs: MagicMock()
+    monkeypatch.setattr(database_utils, 'MONGO_MAX_POOL_SIZE', 7)
+    monkeypatch.setattr(database_utils, 'MONGO_READ_PREFERENCE', 'secondaryPreferred')
+
+    client = get_client()
+    assert get_client() is client
+    assert mock_mongo_client.call_count == 1
+    kwargs = mock_mongo_client.call_args.kwargs
+    assert kwargs['maxPoolSize'] == 7
+    assert kwargs['readPreference'] == 'secondaryPreferred'
+    assert kwargs['serverSelectionTimeoutMS'] > 0
+    assert kwargs['event_listeners'] == [MONGO_POOL_LISTENER]
+
+    # A forked worker (different pid) gets its own client; the parent's is left alone
+    monkeypatch.setattr(database_utils.os, 'getpid', lambda: -1)
+    child_client = get_client()
+    assert child_client is not client
+    client.close.assert_not_called()
+
 @patch('database_utils.get_properties_collection')
 def test_filter_properties_bedrooms(mock_get_collection):
     """Test filtering properties by bedroom count"""
@@ -32,33 +83,35 @@ def test_filter_properties_bedrooms(mock_get_collection):
     # Setup mock
     mock_collection = MagicMock()
     mock_get_collection.return_value = mock_collection
-    mock_collection.find.return_value = mock_properties
+    mock_collection.find.return_value.limit.return_value = mock_properties
     
     # Call function
     result = filter_properties("3 bedroom")
     
-    # Assertions - check that 3-bed property is included
+    # Assertions - the bedroom comparison is pushed into Mongo
+    assert mock_collection.find.call_args[0][0] == {"bedrooms_numeric": {"$gte": 3}}
+    mock_collection.find.return_value.limit.assert_called_once_with(100)
     assert any(p["bedrooms"] == "3 Bed" for p in result)
 
 @patch('database_utils.get_properties_collection')
 def test_filter_properties_price(mock_get_collection):
     """Test filtering properties by price"""
-    # Mock data
+    # Mock data (Mongo only returns the matching documents)
     mock_properties = [
         {"price": "€350,000", "bedrooms": "3 Bed"},
-        {"price": "€275,000", "bedrooms": "2 Bed"},
-        {"price": "€450,000", "bedrooms": "4 Bed"}
+        {"price": "€275,000", "bedrooms": "2 Bed"}
     ]
     
     # Setup mock
     mock_collection = MagicMock()
     mock_get_collection.return_value = mock_collection
-    mock_collection.find.return_value = mock_properties
+    mock_collection.find.return_value.limit.return_value = mock_properties
     
     # Call function
     result = filter_properties("under 400000")
     
     # Assertions
+    assert mock_collection.find.call_args[0][0] == {"price_numeric": {"$lte": 400000}}
     assert any(p["price"] == "€350,000" for p in result)
     assert any(p["price"] == "€275,000" for p in result)
     assert not any(p["price"] == "€450,000" for p in result)
@@ -76,11 +129,14 @@ def test_filter_properties_location(mock_get_collection):
     # Setup mock
     mock_collection = MagicMock()
     mock_get_collection.return_value = mock_collection
-    mock_collection.find.return_value = mock_properties
+    mock_collection.find.return_value.limit.return_value = mock_properties
     
     # Call function
     result = filter_properties("dublin")
     
+    # No number to compare on: unfiltered, but still limited
+    assert mock_collection.find.call_args[0][0] == {}
+    mock_collection.find.return_value.limit.assert_called_once_with(100)
     # Assertions - check Dublin properties are included
     dublin_addresses = ["123 Main St, Dublin", "789 Church Rd, Dublin"]
     for addr in dublin_addresses:
@@ -114,7 +170,7 @@ def test_filter_properties_complex_query(mock_get_collection):
     # Setup mock
     mock_collection = MagicMock()
     mock_get_collection.return_value = mock_collection
-    mock_collection.find.return_value = mock_properties
+    mock_collection.find.return_value.limit.return_value = mock_properties
     
     # Call function - complex query with multiple filters
     result = filter_properties("3 bedroom house in dublin")
@@ -123,4 +179,290 @@ def test_filter_properties_complex_query(mock_get_collection):
     assert any(p["address"] == "123 Main St, Dublin" and 
               p["bedrooms"] == "3 Bed" and 
               p["property_type"] == "House" 
-              for p in result)
\ No newline at end of file
+              for p in result)
+
+def test_ensure_indexes_creates_missing():
+    """Test the index manager creates every declared index and is idempotent"""
+    collection = mongomock.MongoClient()['test_db']['daft']
+
+    assert len(index_status(collection)["missing"]) == len(INDEXES)
+
+    report = ensure_indexes(collection)
+    assert len(report["created"]) == len(INDEXES)
+    assert collection.index_information()["link_unique"]["unique"] is True
+
+    report = ensure_indexes(collection)
+    assert report["created"] == []
+    assert len(report["existing"]) == len(INDEXES)
+
+def test_api_creates_indexes_on_first_request(monkeypatch):
+    """Test the API builds missing indexes once per process, however it is served"""
+    import app as app_module
+    import index_manager
+    monkeypatch.setattr(index_manager, "ENSURE_INDEXES", True)
+    monkeypatch.setattr(index_manager, "_bootstrapped", False)
+    monkeypatch.setattr(index_manager, "_bootstrap_failed_at", None)
+    collection = mongomock.MongoClient()['test_db']['daft']
+
+    with patch('app.get_properties_collection', return_value=collection) as get_collection:
+        client = app_module.app.test_client()
+        client.get('/metrics')
+        client.get('/metrics')
+
+    assert get_collection.call_count == 1
+    assert index_status(collection)["missing"] == []
+
+def test_index_bootstrap_retries_after_failure(monkeypatch):
+    """Test a failed index bootstrap is tried again by a later call"""
+    import index_manager
+    monkeypatch.setattr(index_manager, "ENSURE_INDEXES", True)
+    monkeypatch.setattr(index_manager, "_bootstrapped", False)
+    monkeypatch.setattr(index_manager, "_bootstrap_failed_at", None)
+    collection = mongomock.MongoClient()['test_db']['daft']
+    get_collection = MagicMock(side_effect=[Exception("server selection timeout"), collection, collection])
+
+    index_manager.ensure_indexes_once(get_collection)
+    assert not index_manager.indexes_bootstrapped()
+    # Within the retry interval the failure is not retried on every request
+    index_manager.ensure_indexes_once(get_collection)
+    assert get_collection.call_count == 1
+
+    monkeypatch.setattr(index_manager, "BOOTSTRAP_RETRY_SECONDS", 0)
+    index_manager.ensure_indexes_once(get_collection)
+    assert get_collection.call_count == 2
+    assert index_manager.indexes_bootstrapped()
+    assert index_status(collection)["missing"] == []
+
+    index_manager.ensure_indexes_once(get_collection)
+    assert get_collection.call_count == 2
+
+def test_ensure_indexes_drop_stale():
+    """Test undeclared indexes are reported and only dropped on request"""
+    collection = mongomock.MongoClient()['test_db']['daft']
+    collection.create_index("description", name="old_description")
+
+    report = ensure_indexes(collection)
+    assert report["stale"] == ["old_description"]
+    assert "old_description" in collection.index_information()
+
+    report = ensure_indexes(collection, drop_stale=True)
+    assert report["dropped"] == ["old_description"]
+    assert "old_description" not in collection.index_information()
+
+
+def test_bulk_writer_flushes_by_size():
+    """Test upserts are written in batches once batch_size is reached"""
+    collection = mongomock.MongoClient()['test_db']['daft']
+    collection.insert_one({"link": "https://www.daft.ie/property/0", "price": "€1"})
+
+    with BulkUpsertWriter(collection, batch_size=2, flush_interval=0) as writer:
+        for i in range(3):
+            writer.upsert({"link": f"https://www.daft.ie/property/{i}"}, {"$set": {"price": f"€{i + 100}"}})
+        # Two operations flushed, one still buffered
+        assert len(writer.batches) == 1
+        assert collection.count_documents({}) == 2
+
+    # Leaving the block flushes the rest
+    assert [b["operations"] for b in writer.batches] == [2, 1]
+    assert writer.totals["inserted"] == 2
+    assert writer.totals["modified"] == 1
+    assert collection.count_documents({}) == 3
+
+def test_bulk_writer_flushes_by_time():
+    """Test a partially filled batch is flushed once it is older than flush_interval"""
+    collection = mongomock.MongoClient()['test_db']['daft']
+    writer = BulkUpsertWriter(collection, batch_size=100, flush_interval=0.05)
+    writer.upsert({"link": "a"}, {"$set": {"price": "€1"}})
+
+    time.sleep(0.2)
+    assert collection.count_documents({}) == 1
+    writer.close()
+
+def test_bulk_writer_counts_failures():
+    """Test failed operations in an unordered batch are counted, not raised"""
+    collection = MagicMock()
+    collection.bulk_write.side_effect = BulkWriteError({
+        "nUpserted": 1, "nModified": 0, "nMatched": 0,
+        "writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate key"}]
+    })
+
+    writer = BulkUpsertWriter(collection, batch_size=10, flush_interval=0)
+    writer.upsert({"link": "a"}, {"$set": {}})
+    writer.upsert({"link": "b"}, {"$set": {}})
+    stats = writer.flush()
+
+    assert stats == {"operations": 2, "inserted": 1, "modified": 0, "matched": 0, "failed": 1}
+    assert collection.bulk_write.call_args[1] == {"ordered": False}
+    writer.close()
+
+
+def test_backfill_locations():
+    """Test existing listings get a GeoJSON location from their map link"""
+    collection = mongomock.MongoClient()['test_db']['daft']
+    collection.insert_many([
+        {"link": "a", "map_link": "https://www.google.com/maps/@?api=1&map_action=pano&viewpoint=53.35,-6.26"},
+        {"link": "b", "map_link": "https://maps.example.com/view"},
+        {"link": "c", "map_link": None},
+        {"link": "d", "map_link": "https://www.google.com/maps/@51.9,-8.47,15z",
+         "location": {"type": "Point", "coordinates": [0, 0]}},
+    ])
+
+    counts = backfill_locations(collection, batch_size=1)
+
+    assert counts == {"scanned": 2, "updated": 1, "unparsed": 1}
+    assert collection.find_one({"link": "a"})["location"] == {"type": "Point", "coordinates": [-6.26, 53.35]}
+    assert collection.find_one({"link": "d"})["location"]["coordinates"] == [0, 0]
+    assert collection.database["meta"].find_one({"_id": "data_generation"})["value"] == 1
+
+
+def test_backfill_derived_fields_resumes_after_interruption():
+    """Test the migration fills derived fields batch by batch and resumes from its checkpoint"""
+    collection = mongomock.MongoClient()['test_db']['daft']
+    collection.insert_many([
+        {"link": str(i), "price": f"€{300 + i},000", "bedrooms": "3 Bed", "bathrooms": "2 Bath",
+         "address": f"{i} Main St, Co. Galway"}
+        for i in range(10)
+    ])
+    # Already migrated: nothing to write for this one
+    collection.update_one({"link": "0"}, {"$set": {"price_numeric": 300000, "bedrooms_numeric": 3}})
+
+    real_bulk_write = collection.bulk_write
+    calls = []
+
+    def failing_third_batch(ops, **kwargs):
+        calls.append(len(ops))
+        if len(calls) == 3:
+            raise RuntimeError("connection lost")
+        return real_bulk_write(ops, **kwargs)
+
+    with patch.object(collection, 'bulk_write', side_effect=failing_third_batch):
+        with pytest.raises(RuntimeError):
+            backfill_derived_fields(collection, batch_size=3)
+    assert load_checkpoint(collection.database)["processed"] == 6
+
+    counts = backfill_derived_fields(collection, batch_size=3)
+    assert counts["processed"] == 10
+    assert load_checkpoint(collection.database) is None  # finished
+
+    for doc in collection.find():
+        assert doc["price_numeric"] == (300 + int(doc["link"])) * 1000
+        assert doc["bathrooms_numeric"] == 2
+        assert doc["county"] == "Galway"
+    assert collection.count_documents({"price_numeric": {"$lte": 305000}}) == 6
+
+
+def test_backfill_derived_fields_missing_only_skips_listings_without_location():
+    """Test --missing-only doesn't keep reprocessing listings that have no coordinates to derive"""
+    collection = mongomock.MongoClient()['test_db']['daft']
+    collection.insert_many([
+        {"link": "a", "price": "€300,000", "address": "1 Main St, Co. Galway",
+         "map_link": "https://www.google.com/maps/@?api=1&map_action=pano&viewpoint=53.27,-9.05"},
+        {"link": "b", "price": "€250,000", "address": "2 Main St, Co. Galway"},  # no map link
+    ])
+
+    assert backfill_derived_fields(collection, missing_only=True)["processed"] == 2
+    assert "location" not in collection.find_one({"link": "b"})
+    assert backfill_derived_fields(collection, missing_only=True)["processed"] == 0
+
+
+def test_pool_metrics_listener():
+    """Test the pool listener tracks open and checked-out connections and checkout waits"""
+    listener = MongoPoolMetrics()
+    address = ("pool-test", 27017)
+    label = "pool-test:27017"
+
+    listener.pool_created(monitoring.PoolCreatedEvent(address, {}))
+    for connection_id in (1, 2):
+        listener.connection_created(monitoring.ConnectionCreatedEvent(address, connection_id))
+        listener.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(address))
+        listener.connection_checked_out(monitoring.ConnectionCheckedOutEvent(address, connection_id))
+    listener.connection_checked_in(monitoring.ConnectionCheckedInEvent(address, 1))
+    listener.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(address))
+    listener.connection_check_out_failed(monitoring.ConnectionCheckOutFailedEvent(address, "timeout"))
+
+    assert POOL_CONNECTIONS.value(address=label) == 2
+    assert POOL_CHECKED_OUT.value(address=label) == 1
+    assert POOL_CHECKOUT_SECONDS.count(address=label) == 3
+    assert POOL_CHECKOUT_FAILURES.value(address=label, reason="timeout") == 1
+
+    listener.connection_closed(monitoring.ConnectionClosedEvent(address, 2, "idle"))
+    assert POOL_CONNECTIONS.value(address=label) == 1
+
+
+# Trimmed explain("executionStats") output of a find that used an index
+FIND_EXPLAIN = {
+    "queryPlanner": {"winningPlan": {
+        "stage": "LIMIT",
+        "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "county_1_price_numeric_1"}},
+    }},
+    "executionStats": {"nReturned": 20, "totalDocsExamined": 20, "totalKeysExamined": 20, "executionTimeMillis": 3},
+}
+# ...and of the count pipeline, planned in its $cursor stage with a collection scan
+COUNT_EXPLAIN = {"stages": [{"$cursor": {
+    "queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}},
+    "executionStats": {"nReturned": 41250, "totalDocsExamined": 100000, "totalKeysExamined": 0,
+                       "executionTimeMillis": 412},
+}}]}
+
+
+def test_slow_query_shape_and_explain_summary():
+    """Test query shapes drop the values and explain output is summarized"""
+    query = {"$and": [{"county": "Cork"}, {"$or": [{"price_numeric": {"$lte": 300000}}, {"bedrooms_numeric": 3}]}],
+             "property_type": {"$in": ["Detached", "Bungalow"]}}
+    assert query_shape(query) == {
+        "$and": [{"county": "?"}, {"$or": [{"price_numeric": {"$lte": "?"}}, {"bedrooms_numeric": "?"}]}],
+        "property_type": {"$in": "?"},
+    }
+    assert query_shape({"county": "Dublin"}) == query_shape({"county": "Cork"})
+
+    find = summarize_explain(FIND_EXPLAIN)
+    assert find["stages"] == ["LIMIT", "FETCH", "IXSCAN"]
+    assert find["indexes"] == ["county_1_price_numeric_1"]
+    assert not find["collscan"]
+    assert (find["docs_examined"], find["n_returned"]) == (20, 20)
+
+    count = summarize_explain(COUNT_EXPLAIN)
+    assert count["collscan"]
+    assert (count["docs_examined"], count["n_returned"]) == (100000, 41250)
+
+    # The slot-based engine nests the plan under queryPlan
+    sbe = {"queryPlanner": {"winningPlan": {"queryPlan": {"stage": "COLLSCAN"}, "slotBasedPlan": {}}}}
+    assert summarize_explain(sbe)["stages"] == ["COLLSCAN"]
+
+
+def test_slow_query_log_explains_in_background(tmp_path):
+    """Test slow searches are explained once per shape and written to the rotating file"""
+    collection = MagicMock()
+    collection.name = "daft"
+    collection.database.command.side_effect = lambda name, command, verbosity: (
+        FIND_EXPLAIN if "find" in command else COUNT_EXPLAIN
+    )
+    path = tmp_path / "slow.jsonl"
+    log = SlowQueryLog(threshold_ms=100, sink=FileSlowQuerySink(str(path)), shape_interval=60)
+    spec = {"filter": {"county": "Cork"}, "projection": {"_id": 1}, "sort": None, "skip": 0, "limit": 20}
+
+    fast = RequestTimer("test")
+    fast.add("count", 0.01)
+    assert not log.observe(collection, spec, fast, count_query={"county": "Cork"})
+
+    slow = RequestTimer("test")
+    slow.add("count", 0.09)
+    slow.add("find", 0.03)
+    assert log.observe(collection, spec, slow, count_query={"county": "Cork"}, search_term="cork")
+    # Same shape again within the interval: not explained twice
+    assert not log.observe(collection, dict(spec, filter={"county": "Kerry"}), slow, count_query={"county": "Kerry"})
+    log.flush(timeout=5)
+
+    find_command = collection.database.command.call_args_list[0].args[1]
+    assert find_command["find"] == "daft" and find_command["limit"] == 20
+    assert collection.database.command.call_args_list[0].kwargs == {"verbosity": "executionStats"}
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 1
+    record = records[0]
+    assert record["search_term"] == "cork"
+    assert record["query_shape"] == {"county": "?"}
+    assert record["db_ms"] == 120.0
+    assert record["collscan"] is True
+    assert record["plans"]["find"]["indexes"] == ["county_1_price_numeric_1"]
+    assert record["plans"]["count"]["docs_examined"] == 100000
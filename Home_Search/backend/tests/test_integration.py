@@ -1,8 +1,15 @@
 # File: tests/test_integration.py
 import pytest
+import asyncio
+from datetime import datetime
 import json
 import os
-from app import app
+from app import app, response_cache
+import app as app_module
+import asgi_app
+from database_utils import bump_data_generation
+from facets import precompute_facets
+from projections import SUMMARY_FIELDS
 from unittest.mock import patch, MagicMock
 import mongomock
 
@@ -32,6 +39,8 @@ def client():
                 "bedrooms": "3 Bed",
                 "bedrooms_numeric": 3,
                 "bathrooms": "2 Bath",
+                "bathrooms_numeric": 2,
+                "county": "Dublin",
                 "property_type": "Semi-Detached",
                 "description": "Beautiful house with garden and parking",
                 "features": ["Garden", "Parking", "Central Heating"]
@@ -43,6 +52,8 @@ def client():
                 "bedrooms": "4 Bed",
                 "bedrooms_numeric": 4,
                 "bathrooms": "3 Bath",
+                "bathrooms_numeric": 3,
+                "county": "Dublin",
                 "property_type": "Detached",
                 "description": "Spacious family home with large garden",
                 "features": ["Garden", "Garage", "Fireplace"]
@@ -54,6 +65,9 @@ def client():
                 "bedrooms": "2 Bed",
                 "bedrooms_numeric": 2,
                 "bathrooms": "1 Bath",
+                "bathrooms_numeric": 1,
+                "date_entered_at": datetime(2024, 3, 5),
+                "county": "Cork",
                 "property_type": "Terraced",
                 "description": "Cozy terraced house in city center",
                 "features": ["Renovated", "City Center"]
@@ -93,6 +107,14 @@ def test_search_flow(client):
     assert len(data['properties']) == 1
     assert data['properties'][0]['price'] == "€275,000"
     
+    # Test 4b: Filter by bathrooms (bathrooms_numeric, so "1 bath" doesn't match "12 Bath")
+    response = client.get('/api/properties?searchTerm=1+bath')
+    data = json.loads(response.data)
+    assert [prop['bathrooms'] for prop in data['properties']] == ["1 Bath"]
+    response = client.get('/api/properties?searchTerm=2%2B+bath')
+    data = json.loads(response.data)
+    assert sorted(prop['bathrooms'] for prop in data['properties']) == ["2 Bath", "3 Bath"]
+    
     # Test 5: Complex filter
     response = client.get('/api/properties?searchTerm=dublin+3+bed+under+400k')
     data = json.loads(response.data)
@@ -125,4 +147,287 @@ def test_search_query_parsing_integration(mock_parse_search_query, client):
     client.get('/api/properties?searchTerm=house+in+dublin')
     
     # Verify parse_search_query was called with correct argument
-    mock_parse_search_query.assert_called_once_with('house in dublin')  # + is converted to space
\ No newline at end of file
+    mock_parse_search_query.assert_called_once_with('house in dublin')  # + is converted to space
+def test_cursor_pagination(client):
+    """Test keyset pagination walks every property once, ordered by price"""
+    response = client.get('/api/properties?limit=2&cursor=')
+    data = json.loads(response.data)
+    assert data['total'] == 3
+    assert [p['price_numeric'] for p in data['properties']] == [275000, 350000]
+    assert all('_id' not in p for p in data['properties'])
+    assert data['nextCursor']
+
+    response = client.get(f"/api/properties?limit=2&cursor={data['nextCursor']}")
+    data = json.loads(response.data)
+    assert [p['price_numeric'] for p in data['properties']] == [450000]
+    assert data['nextCursor'] is None
+
+def test_cursor_pagination_with_search(client):
+    """Test keyset pagination composes with the parsed search query"""
+    response = client.get('/api/properties?searchTerm=dublin&limit=1&cursor=')
+    data = json.loads(response.data)
+    assert data['total'] == 2
+    assert data['properties'][0]['price'] == "€350,000"
+
+    response = client.get(f"/api/properties?searchTerm=dublin&limit=1&cursor={data['nextCursor']}")
+    data = json.loads(response.data)
+    assert data['properties'][0]['price'] == "€450,000"
+
+
+def test_response_cache_invalidated_by_data_generation(client, monkeypatch):
+    """Test repeated searches are served from cache until the data generation changes"""
+    monkeypatch.setattr(response_cache, 'generation_check_interval', 0)
+    collection = app_module.get_properties_collection("daft")
+
+    first = json.loads(client.get('/api/properties?searchTerm=cork').data)
+    assert first['total'] == 1
+
+    collection.insert_one({
+        "address": "1 Quay Street, Cork", "price": "€300,000", "price_numeric": 300000, "county": "Cork",
+        "bedrooms": "2 Bed", "property_type": "Apartment", "description": "", "features": []
+    })
+
+    # Same (normalized) search: cached response, new listing not visible yet
+    cached = json.loads(client.get('/api/properties?searchTerm=Cork+').data)
+    assert cached == first
+    assert response_cache.cache_info()["hits"] == 1
+
+    # The scraper bumps the generation after writing -> fresh results
+    bump_data_generation(collection.database)
+    fresh = json.loads(client.get('/api/properties?searchTerm=cork').data)
+    assert fresh['total'] == 2
+
+
+def test_facets_endpoint(client):
+    """Test results, total and histograms come back from the facets endpoint"""
+    collection = app_module.get_properties_collection("daft")
+
+    data = json.loads(client.get('/api/properties/facets?searchTerm=dublin&debug=1').data)
+    listing = json.loads(client.get('/api/properties?searchTerm=dublin&debug=1').data)
+    assert data['total'] == 2
+    assert data['properties'] == listing['properties']
+    assert data['queryUsed'] == listing['queryUsed']
+    assert data['facets']['county'] == [{"value": "Dublin", "count": 2}]
+    assert data['facets']['bedrooms'] == [{"value": 3, "count": 1}, {"value": 4, "count": 1}]
+    assert data['facets']['price'] == [
+        {"min": 300000, "max": 400000, "count": 1},
+        {"min": 400000, "max": 500000, "count": 1},
+    ]
+
+    data = json.loads(client.get('/api/properties/facets').data)
+    assert data['total'] == 3
+    assert data['facets']['county'] == [{"value": "Dublin", "count": 2}, {"value": "Cork", "count": 1}]
+    assert {row['value'] for row in data['facets']['property_type']} == {"Semi-Detached", "Detached", "Terraced"}
+
+
+def test_facets_endpoint_uses_precomputed_facets(client, monkeypatch):
+    """Test the unfiltered facets come from the post-scrape snapshot for the current generation"""
+    monkeypatch.setattr(response_cache, 'generation_check_interval', 0)
+    collection = app_module.get_properties_collection("daft")
+    generation = bump_data_generation(collection.database)
+    precompute_facets(collection, generation)
+
+    # Not visible in the snapshot until the next scrape recomputes it
+    collection.insert_one({"address": "1 Quay Street, Co. Cork", "price_numeric": 300000, "county": "Cork"})
+    data = json.loads(client.get('/api/properties/facets?limit=10').data)
+    assert data['total'] == 3
+    assert len(data['properties']) == 4
+
+    # A newer generation makes the snapshot stale: facets are aggregated live
+    bump_data_generation(collection.database)
+    data = json.loads(client.get('/api/properties/facets?limit=10').data)
+    assert data['total'] == 4
+    assert {"value": "Cork", "count": 2} in data['facets']['county']
+
+
+def test_summary_view_and_fields(client):
+    """Test view=summary and fields= project the listing documents"""
+    full = client.get('/api/properties?searchTerm=dublin')
+    summary = client.get('/api/properties?searchTerm=dublin&view=summary')
+    full_data, summary_data = json.loads(full.data), json.loads(summary.data)
+
+    assert summary_data['total'] == full_data['total']
+    for prop in summary_data['properties']:
+        assert set(prop) <= set(SUMMARY_FIELDS)
+        assert 'description' not in prop and 'features' not in prop
+    assert [p['address'] for p in summary_data['properties']] == [p['address'] for p in full_data['properties']]
+    assert len(summary.data) < len(full.data)
+
+    data = json.loads(client.get('/api/properties?fields=price,address').data)
+    assert all(set(prop) == {"address", "price"} for prop in data['properties'])
+
+    # Cursor pages still get a nextCursor without leaking the keyset fields
+    data = json.loads(client.get('/api/properties?view=summary&limit=1&cursor=').data)
+    assert data['nextCursor']
+    assert 'price_numeric' not in data['properties'][0]
+
+    assert client.get('/api/properties?view=tiny').status_code == 400
+    assert client.get('/api/properties?fields=$where').status_code == 400
+
+
+def test_property_detail(client):
+    """Test a single listing can be fetched by link or id"""
+    collection = app_module.get_properties_collection("daft")
+    doc = collection.find_one({"address": "78 Church Road, Cork"})
+    collection.update_one({"_id": doc["_id"]}, {"$set": {"link": "https://www.daft.ie/for-sale/78"}})
+
+    by_link = json.loads(client.get('/api/property?link=https://www.daft.ie/for-sale/78').data)['property']
+    by_id = json.loads(client.get(f"/api/property?id={doc['_id']}").data)['property']
+    assert by_link == by_id
+    assert by_id['id'] == str(doc['_id'])
+    assert by_id['description'] == "Cozy terraced house in city center"
+
+    data = json.loads(client.get(f"/api/property?id={doc['_id']}&fields=price").data)
+    assert data['property'] == {"id": str(doc['_id']), "price": "€275,000"}
+
+    assert client.get('/api/property?link=https://www.daft.ie/nothing').status_code == 404
+    assert client.get('/api/property?id=not-an-id').status_code == 400
+    assert client.get('/api/property').status_code == 400
+
+
+class AsyncCursor:
+    """Motor-style cursor over a mongomock cursor"""
+
+    def __init__(self, cursor, tracker):
+        self._cursor = cursor
+        self._tracker = tracker
+
+    def sort(self, *args):
+        self._cursor = self._cursor.sort(*args)
+        return self
+
+    def skip(self, n):
+        self._cursor = self._cursor.skip(n)
+        return self
+
+    def limit(self, n):
+        self._cursor = self._cursor.limit(n)
+        return self
+
+    async def to_list(self, length):
+        async with self._tracker:
+            return list(self._cursor)[:length]
+
+
+class InFlightTracker:
+    """Records how many fake round trips were awaited at the same time"""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    async def __aenter__(self):
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+        await asyncio.sleep(0.01)
+
+    async def __aexit__(self, *exc):
+        self.current -= 1
+
+
+class AsyncDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name):
+        return AsyncCollection(self._database[name], InFlightTracker())
+
+
+class AsyncCollection:
+    """Motor-style collection over a mongomock collection"""
+
+    def __init__(self, collection, tracker):
+        self._collection = collection
+        self.tracker = tracker
+        self.database = AsyncDatabase(collection.database)
+
+    async def count_documents(self, query):
+        async with self.tracker:
+            return self._collection.count_documents(query)
+
+    async def find_one(self, *args):
+        return self._collection.find_one(*args)
+
+    def find(self, *args):
+        return AsyncCursor(self._collection.find(*args), self.tracker)
+
+
+def call_asgi(path, query_string=""):
+    """Run one GET through the ASGI app, returning (status, headers, body)"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query_string.encode()}
+    asyncio.run(asgi_app.app(scope, receive, send))
+    start, body = messages
+    return start["status"], dict(start["headers"]), body["body"]
+
+
+def test_asgi_properties_match_flask(client, monkeypatch):
+    """Test the async endpoint returns the same JSON as the Flask one"""
+    collection = AsyncCollection(app_module.get_properties_collection("daft"), InFlightTracker())
+    monkeypatch.setattr(asgi_app, 'get_collection', lambda: collection)
+
+    for query_string in ["", "searchTerm=dublin", "searchTerm=3+bed&limit=1&page=2",
+                         "searchTerm=dublin&limit=1&cursor="]:
+        response_cache.clear()
+        expected = json.loads(client.get(f'/api/properties?{query_string}').data)
+        response_cache.clear()
+        status, headers, body = call_asgi('/api/properties', query_string)
+        assert status == 200
+        assert headers[b"access-control-allow-origin"] == b"*"
+        assert headers[b"server-timing"].startswith(b"cache;dur=")
+        assert json.loads(body) == expected
+
+    # count_documents and the page fetch were awaited concurrently
+    assert collection.tracker.peak == 2
+
+
+def test_asgi_errors(client, monkeypatch):
+    """Test the async endpoint's error statuses"""
+    collection = AsyncCollection(app_module.get_properties_collection("daft"), InFlightTracker())
+    monkeypatch.setattr(asgi_app, 'get_collection', lambda: collection)
+
+    status, _, body = call_asgi('/api/properties', 'cursor=not-a-cursor')
+    assert status == 400
+    assert "error" in json.loads(body)
+
+    status, _, _ = call_asgi('/api/nothing-here')
+    assert status == 404
+
+    status, headers, body = call_asgi('/metrics')
+    assert status == 200
+    assert b"api_request_duration_seconds_count" in body
+
+
+def test_benchmark_suite_smoke():
+    """Test the benchmark suite runs every benchmark on a small dataset and flags regressions"""
+    from benchmarks.run_benchmarks import BENCHMARKS, compare_to_baseline, run_benchmarks
+
+    results = run_benchmarks(size=300, rounds=1)
+    assert set(results["benchmarks"]) | set(results["skipped"]) == set(BENCHMARKS)
+    assert results["dataset"] == {"backend": "mongomock", "size": 300, "seed": 1234}
+    assert all(stats["calls"] > 0 for stats in results["benchmarks"].values())
+
+    # Same machine speed: 2x slower than the baseline is a regression, 1.2x isn't
+    baseline = {
+        "calibration_ms": results["calibration_ms"],
+        "dataset": results["dataset"],
+        "benchmarks": {
+            "get_properties": {"median_ms": results["benchmarks"]["get_properties"]["median_ms"] / 2},
+            "parse_search_query.cold": {"median_ms": results["benchmarks"]["parse_search_query.cold"]["median_ms"] / 1.2},
+        },
+    }
+    report = compare_to_baseline(results, baseline, threshold=1.5)
+    assert report["get_properties"][0] == "regression"
+    assert report["parse_search_query.cold"][0] == "ok"
+    assert report["parse_search_query.warm"] == ("no baseline", None)
+
+    # Database timings are only compared on the same dataset
+    baseline["dataset"] = dict(results["dataset"], size=100000)
+    assert compare_to_baseline(results, baseline)["get_properties"] == ("dataset differs", None)
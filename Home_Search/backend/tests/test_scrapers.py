@@ -3,11 +3,26 @@ import pytest
 from unittest.mock import patch, MagicMock
 from io import BytesIO
 from bs4 import BeautifulSoup
-from daft_property_details_scraper import scrape_daft_details
-from daft_listings_scraper import scrape_daft_listings
+from daft_property_details_scraper import scrape_daft_details, parse_daft_details
+from daft_listings_scraper import scrape_daft_listings, fetch_listing_details, card_fingerprint
+from daft_next_data import extract_next_data_listings, listing_to_details
+from normalization import county_from_address, normalize_listing
+from datetime import datetime
+from geo import coordinates_from_map_link
+import json
+from host_limiter import HostLimiter
+from crawl_scheduler import CrawlScheduler, FetchFailed, RetryQueue, is_retryable_error
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from http_session import HttpClient, get_http_client
+import gzip
+import mongomock
+import threading
+import time
 
-@patch('urllib.request.urlopen')
-def test_scrape_daft_details(mock_urlopen):
+@patch('daft_property_details_scraper.fetch_page')
+def test_scrape_daft_details(mock_fetch_page):
     """Test property details scraper"""
     # Create mock HTML content
     mock_html = """
@@ -37,9 +52,7 @@ def test_scrape_daft_details(mock_urlopen):
     """
     
     # Configure the mock to return our HTML
-    mock_response = MagicMock()
-    mock_response.read.return_value = mock_html.encode('utf-8')
-    mock_urlopen.return_value = mock_response
+    mock_fetch_page.return_value = mock_html.encode('utf-8')
     
     # Call the function
     result = scrape_daft_details("https://example.com/property")
@@ -59,8 +72,8 @@ def test_scrape_daft_details(mock_urlopen):
     assert result['ber_rating'] == "BER B2"
     assert result['date_entered'] == "12/01/2023"
 
-@patch('urllib.request.urlopen')
-def test_scrape_daft_details_missing_data(mock_urlopen):
+@patch('daft_property_details_scraper.fetch_page')
+def test_scrape_daft_details_missing_data(mock_fetch_page):
     """Test scraper with missing data elements"""
     # Create mock HTML with missing elements
     mock_html = """
@@ -74,9 +87,7 @@ def test_scrape_daft_details_missing_data(mock_urlopen):
     """
     
     # Configure the mock to return our HTML
-    mock_response = MagicMock()
-    mock_response.read.return_value = mock_html.encode('utf-8')
-    mock_urlopen.return_value = mock_response
+    mock_fetch_page.return_value = mock_html.encode('utf-8')
     
     # Call the function
     result = scrape_daft_details("https://example.com/property")
@@ -90,11 +101,11 @@ def test_scrape_daft_details_missing_data(mock_urlopen):
     assert result['description'] == "Description not available."
     assert result['features'] == []  # Empty list for missing features
 
-@patch('urllib.request.urlopen')
-def test_scrape_daft_details_error_handling(mock_urlopen):
+@patch('daft_property_details_scraper.fetch_page')
+def test_scrape_daft_details_error_handling(mock_fetch_page):
     """Test scraper error handling"""
     # Configure the mock to raise an exception
-    mock_urlopen.side_effect = Exception("Network error")
+    mock_fetch_page.side_effect = Exception("Network error")
     
     # Call the function
     result = scrape_daft_details("https://example.com/property")
@@ -103,9 +114,9 @@ def test_scrape_daft_details_error_handling(mock_urlopen):
     assert result is None
 
 @patch('daft_listings_scraper.scrape_daft_details')
-@patch('urllib.request.urlopen')
+@patch('daft_listings_scraper.fetch_page')
 @patch('daft_listings_scraper.get_properties_collection')
-def test_scrape_daft_listings(mock_get_collection, mock_urlopen, mock_scrape_details):
+def test_scrape_daft_listings(mock_get_collection, mock_fetch_page, mock_scrape_details):
     """Test listings scraper"""
     # Mock collection
     mock_collection = MagicMock()
@@ -122,9 +133,7 @@ def test_scrape_daft_listings(mock_get_collection, mock_urlopen, mock_scrape_det
     """
     
     # Configure mock response
-    mock_response = MagicMock()
-    mock_response.read.return_value = mock_html.encode('utf-8')
-    mock_urlopen.return_value = mock_response
+    mock_fetch_page.return_value = mock_html.encode('utf-8')
     
     # Mock property details
     mock_scrape_details.return_value = {
@@ -139,4 +148,442 @@ def test_scrape_daft_listings(mock_get_collection, mock_urlopen, mock_scrape_det
     scrape_daft_listings('https://example.com/listings?from={}', max_page_index=0)
     
     # Verify scrape_daft_details was called for both links
-    assert mock_scrape_details.call_count >= 2
\ No newline at end of file
+    assert mock_scrape_details.call_count >= 2
+
+@patch('daft_listings_scraper.scrape_daft_details')
+def test_fetch_listing_details_keeps_order(mock_scrape_details):
+    """Test parallel detail fetches come back in listing order, errors in place"""
+    links = [f"https://www.daft.ie/property/{i}" for i in range(6)]
+
+    def fake_details(link):
+        index = int(link.rsplit('/', 1)[1])
+        time.sleep(0.01 * (6 - index))  # later links finish first
+        if index == 3:
+            raise ValueError("boom")
+        return {'link': link}
+    mock_scrape_details.side_effect = fake_details
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = fetch_listing_details(links, executor, HostLimiter(max_per_host=6, min_interval=0))
+
+    assert [link for link, _, _ in results] == links
+    assert [details['link'] for _, details, error in results if error is None] == links[:3] + links[4:]
+    assert isinstance(results[3][2], ValueError)
+
+def test_host_limiter_spaces_requests():
+    """Test request starts to one host are spaced by min_interval"""
+    limiter = HostLimiter(max_per_host=4, min_interval=0.05)
+    starts = []
+
+    def request():
+        with limiter.slot("https://www.daft.ie/property/1"):
+            starts.append(time.monotonic())
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for _ in range(4):
+            executor.submit(request)
+
+    # Four starts need at least three intervals between first and last
+    assert len(starts) == 4
+    assert max(starts) - min(starts) >= 0.14
+
+
+class _GzipHandler(BaseHTTPRequestHandler):
+    """Keep-alive handler serving gzip bodies; /flaky fails once with 503"""
+    protocol_version = "HTTP/1.1"
+    flaky_calls = 0
+
+    def do_GET(self):
+        if self.path == "/flaky" and _GzipHandler.flaky_calls == 0:
+            _GzipHandler.flaky_calls += 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = gzip.compress(b"<html>" + b"listing " * 500 + b"</html>")
+        self.send_response(200)
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def http_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _GzipHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def test_http_client_reuses_connections_and_decompresses(http_server):
+    """Test the pooled client keeps the connection alive and decodes gzip"""
+    client = HttpClient(backoff_factor=0)
+    for _ in range(3):
+        content = client.get(http_server + "/listing")
+        assert content.startswith(b"<html>listing")
+
+    stats = client.stats()
+    assert stats["responses"] == 3
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 2
+    assert stats["bytes_on_wire"] < stats["bytes_decoded"]
+    client.close()
+
+def test_http_client_retries_transient_errors(http_server):
+    """Test 5xx responses are retried with backoff and reported to observers"""
+    _GzipHandler.flaky_calls = 0
+    client = HttpClient(backoff_factor=0)
+    observed = []
+    client.add_observer(lambda url, status, seconds, retry_after: observed.append((status, seconds is None)))
+    assert client.get(http_server + "/flaky").startswith(b"<html>")
+    assert observed == [(503, True), (200, False)]
+    client.close()
+
+def test_http_client_without_retries_hands_back_failures(http_server):
+    """Test set_retries(0) leaves a 503 to the caller (the crawl's retry queue) instead of retrying it"""
+    _GzipHandler.flaky_calls = 0
+    client = HttpClient(backoff_factor=0)
+    client.set_retries(0)
+    observed = []
+    client.add_observer(lambda url, status, seconds, retry_after: observed.append(status))
+    with pytest.raises(requests.HTTPError) as error:
+        client.get(http_server + "/flaky")
+    assert error.value.response.status_code == 503
+    assert observed == [503]
+    assert is_retryable_error(error.value)
+    client.close()
+
+def test_crawl_scheduler_adapts_rate_and_concurrency():
+    """Test fast answers speed a host up, 429/5xx halve it once per cooldown, Retry-After pauses it"""
+    scheduler = CrawlScheduler(rate=2.0, min_rate=0.5, max_rate=4.0, concurrency=2, max_concurrency=4,
+                               target_latency=1.0, decrease_cooldown=60)
+    url = "https://www.daft.ie/property/1"
+    for _ in range(20):
+        scheduler.observe(url, 200, 0.1)
+    fast = scheduler.stats()["www.daft.ie"]
+    assert fast["rate"] == 4.0 and fast["concurrency"] == 4
+
+    scheduler.observe(url, 200, 5.0)  # slow: no change
+    scheduler.observe(url, 404, 0.1)  # about the URL, not the site: no change
+    assert scheduler.stats()["www.daft.ie"]["rate"] == 4.0
+
+    scheduler.observe(url, 429, 0.1)
+    scheduler.observe(url, 503, 0.1)  # within the cooldown: counted, not halved again
+    backed_off = scheduler.stats()["www.daft.ie"]
+    assert backed_off["rate"] == 2.0 and backed_off["concurrency"] == 2
+    assert backed_off["congested"] == 2
+
+    # The status seen inside a slot is handed to the caller
+    with patch("time.sleep"), scheduler.slot(url) as attempt:
+        scheduler.observe(url, 503, 0.1, retry_after=30)
+    assert attempt.status == 503
+    with patch("time.sleep") as sleep, scheduler.slot(url):
+        pass
+    assert sleep.call_args.args[0] >= 29
+
+    assert is_retryable_error(FetchFailed(url, 503))
+    assert is_retryable_error(requests.ConnectionError())
+    assert not is_retryable_error(FetchFailed(url, 404))
+    assert not is_retryable_error(ValueError("parse error"))
+
+def test_retry_queue_backoff():
+    """Test retries become due after an exponential, capped backoff and stop at max_attempts"""
+    retries = RetryQueue(base_delay=1.0, max_delay=4.0, max_attempts=3)
+    assert [retries.backoff(attempt) <= limit for attempt, limit in ((1, 1), (2, 2), (3, 4), (6, 4))] == [True] * 4
+    assert retries.backoff(3) >= 2.0
+
+    assert retries.push("a", 1)
+    assert retries.pop_due() == []
+    assert 0.5 <= retries.time_until_next() <= 1.0
+    assert not retries.push("b", 3)
+    assert len(retries) == 1
+
+    retries = RetryQueue(base_delay=0, max_attempts=3)
+    retries.push("a", 2)
+    assert retries.pop_due() == [("a", 3)]
+
+
+LISTINGS_PAGE = """
+<html>
+<body>
+    <a class="sc-b457dee4-17 kUElAW" href="/property/123"><span>€395,000</span><p>1 Known Road</p></a>
+    <a class="sc-b457dee4-17 kUElAW" href="/property/456"><span>€250,000</span><p>2 New Road</p></a>
+</body>
+</html>
+"""
+
+def _listing_cards():
+    return BeautifulSoup(LISTINGS_PAGE, 'html.parser').find_all('a', class_='sc-b457dee4-17 kUElAW')
+
+@patch('daft_listings_scraper.scrape_daft_details')
+@patch('daft_listings_scraper.fetch_page')
+def test_scrape_daft_listings_incremental_skips_known(mock_fetch_page, mock_scrape_details):
+    """Test incremental mode only fetches details for new or changed cards"""
+    collection = mongomock.MongoClient()['test_db']['daft']
+    known_card = _listing_cards()[0]
+    collection.insert_one({'link': 'https://www.daft.ie/property/123', 'card_hash': card_fingerprint(known_card)})
+
+    mock_fetch_page.return_value = LISTINGS_PAGE.encode('utf-8')
+    mock_scrape_details.side_effect = lambda link: {'address': '2 New Road', 'price': '€250,000', 'bedrooms': '3 Bed', 'link': link}
+
+    with patch('daft_listings_scraper.properties_collection', collection), patch('time.sleep'):
+        scrape_daft_listings('https://example.com/listings?from={}', max_page_index=0, incremental=True)
+
+    mock_scrape_details.assert_called_once_with('https://www.daft.ie/property/456')
+    stored = collection.find_one({'link': 'https://www.daft.ie/property/456'})
+    assert stored['card_hash'] == card_fingerprint(_listing_cards()[1])
+
+@patch('daft_listings_scraper.scrape_daft_details')
+@patch('daft_listings_scraper.fetch_page')
+def test_scrape_daft_listings_incremental_stops_early(mock_fetch_page, mock_scrape_details):
+    """Test incremental mode stops after a run of fully known pages"""
+    collection = mongomock.MongoClient()['test_db']['daft']
+    collection.insert_many([
+        {'link': 'https://www.daft.ie' + card.get('href'), 'card_hash': card_fingerprint(card)}
+        for card in _listing_cards()
+    ])
+    mock_fetch_page.return_value = LISTINGS_PAGE.encode('utf-8')
+
+    with patch('daft_listings_scraper.properties_collection', collection), patch('time.sleep'):
+        scrape_daft_listings('https://example.com/listings?from={}', max_page_index=1000,
+                             incremental=True, stop_after_known_pages=2)
+
+    assert mock_fetch_page.call_count == 2
+    mock_scrape_details.assert_not_called()
+
+
+@patch('daft_listings_scraper.scrape_daft_details')
+@patch('daft_listings_scraper.fetch_page')
+def test_scrape_daft_listings_retries_failures(mock_fetch_page, mock_scrape_details):
+    """Test a 503 results page and a failed detail page are retried instead of ending the crawl"""
+    collection = mongomock.MongoClient()['test_db']['daft']
+    unavailable = requests.HTTPError(response=MagicMock(status_code=503))
+    empty = "<html><body></body></html>".encode('utf-8')
+    mock_fetch_page.side_effect = [unavailable, LISTINGS_PAGE.encode('utf-8'), empty]
+    failures = {'https://www.daft.ie/property/456': 1}
+
+    client_retries = []
+
+    def details(link):
+        client_retries.append(get_http_client().retries)
+        if failures.get(link):
+            failures[link] -= 1
+            return None  # scrape_daft_details' answer to any error
+        return {'address': '1 Known Road', 'price': '€395,000', 'link': link}
+    mock_scrape_details.side_effect = details
+
+    with patch('daft_listings_scraper.properties_collection', collection), patch('time.sleep'):
+        scrape_daft_listings('https://example.com/listings?from={}', max_page_index=20,
+                             retries=RetryQueue(base_delay=0))
+
+    # Page 0 failed, was retried once its (zero) backoff elapsed, then page 20 ended the results
+    assert [call.args[0] for call in mock_fetch_page.call_args_list] == [
+        'https://example.com/listings?from=0', 'https://example.com/listings?from=0',
+        'https://example.com/listings?from=20',
+    ]
+    assert [call.args[0] for call in mock_scrape_details.call_args_list].count('https://www.daft.ie/property/456') == 2
+    assert collection.count_documents({}) == 2
+    # The shared client's own retries are off only for the crawl
+    assert set(client_retries) == {0}
+    assert get_http_client().retries == 3
+
+
+def _available_parsers():
+    parsers = ['html.parser']
+    try:
+        import lxml  # noqa: F401
+        parsers.append('lxml')
+    except ImportError:
+        pass
+    return parsers
+
+DETAILS_PAGE = """
+<html>
+<body>
+    <nav><a href="/">Home</a><p data-testid="beds">Not a real beds node</p></nav>
+    <h1 data-testid="address">9 Sea Road, Howth</h1>
+    <div data-testid="price"><span>Asking</span><h2>€1,250,000</h2></div>
+    <p data-testid="beds">4 Bed</p>
+    <div data-testid="description"><h2>Description</h2><p>Big <b>house</b>.</p></div>
+    <div data-testid="features"><ul><li>Sea views</li><li>Garden</li></ul></div>
+    <div data-testid="ber"><svg><title>ber_A3_large</title></svg></div>
+    <div data-testid="statistics"><p>Entered 03/02/2024</p><p>Views 1,200</p></div>
+</body>
+</html>
+"""
+
+@pytest.mark.parametrize('parser', _available_parsers())
+def test_parse_daft_details_backends(parser):
+    """Test every parser backend extracts the same fields in one pass"""
+    result = parse_daft_details(DETAILS_PAGE.encode('utf-8'), "https://www.daft.ie/property/9", parser)
+
+    assert result == {
+        'address': '9 Sea Road, Howth',
+        'price': '€1,250,000',
+        'bedrooms': 'Not a real beds node',  # first match in document order, as soup.find did
+        'bathrooms': 'Baths not available.',
+        'area': 'Floor area not available.',
+        'property_type': 'Property type not available.',
+        'description': 'Bighouse.',
+        'features': ['Sea views', 'Garden'],
+        'map_link': None,
+        'link': 'https://www.daft.ie/property/9',
+        'ber_rating': 'BER A3',
+        'date_entered': '03/02/2024'
+    }
+
+
+def _next_data_page(listings):
+    blob = json.dumps({"props": {"pageProps": {"listings": [{"listing": l} for l in listings]}}})
+    return f"""<html><body><div id="__next"></div>
+    <script id="__NEXT_DATA__" type="application/json">{blob}</script></body></html>"""
+
+COMPLETE_LISTING = {
+    "id": 1, "title": "1 Main Street, Ranelagh, Dublin 6", "seoFriendlyPath": "/for-sale/house-1-main-street/1",
+    "price": "€695,000", "numBedrooms": "3 Bed", "numBathrooms": "2 Bath", "propertyType": "Terrace",
+    "floorArea": {"unit": "METRES_SQUARED", "value": "110"}, "ber": {"rating": "C1"},
+    "publishDate": 1673481600000
+}
+PARTIAL_LISTING = {
+    "id": 2, "title": "Site at Ballyboy, Co. Offaly", "seoFriendlyPath": "/for-sale/site-ballyboy/2",
+    "price": "€80,000", "propertyType": "Site"
+}
+
+def test_listing_to_details_formats():
+    """Test embedded JSON listings map onto the detail scraper's display formats"""
+    assert listing_to_details(COMPLETE_LISTING) == {
+        'link': 'https://www.daft.ie/for-sale/house-1-main-street/1',
+        'address': '1 Main Street, Ranelagh, Dublin 6',
+        'price': '€695,000',
+        'bedrooms': '3 Bed',
+        'bathrooms': '2 Bath',
+        'area': '110 m²',
+        'property_type': 'Terrace',
+        'ber_rating': 'BER C1',
+        'date_entered': '12/01/2023'
+    }
+    assert extract_next_data_listings(b"<html><body>no blob</body></html>") is None
+
+@patch('daft_listings_scraper.scrape_daft_details')
+@patch('daft_listings_scraper.fetch_page')
+def test_scrape_daft_listings_json_extraction(mock_fetch_page, mock_scrape_details):
+    """Test JSON mode stores listings from one request and fetches details only for gaps"""
+    collection = mongomock.MongoClient()['test_db']['daft']
+    mock_fetch_page.return_value = _next_data_page([COMPLETE_LISTING, PARTIAL_LISTING]).encode('utf-8')
+    mock_scrape_details.return_value = {
+        'address': 'Site at Ballyboy, Co. Offaly', 'price': '€80,000',
+        'bedrooms': 'Beds not available.', 'bathrooms': 'Baths not available.',
+        'property_type': 'Site', 'description': 'Half acre site.', 'features': [],
+        'link': 'https://www.daft.ie/for-sale/site-ballyboy/2'
+    }
+
+    # Description and features of the complete listing were stored by an earlier crawl
+    collection.insert_one({'link': 'https://www.daft.ie/for-sale/house-1-main-street/1',
+                           'description': 'Period home.', 'features': ['Garden']})
+
+    with patch('daft_listings_scraper.properties_collection', collection), patch('time.sleep'):
+        scrape_daft_listings('https://example.com/listings?from={}', max_page_index=0)
+
+    mock_scrape_details.assert_called_once_with('https://www.daft.ie/for-sale/site-ballyboy/2')
+    complete = collection.find_one({'link': 'https://www.daft.ie/for-sale/house-1-main-street/1'})
+    assert complete['price_numeric'] == 695000
+    assert complete['bedrooms_numeric'] == 3
+    assert complete['ber_rating'] == 'BER C1'
+    assert complete['description'] == 'Period home.'
+    partial = collection.find_one({'link': 'https://www.daft.ie/for-sale/site-ballyboy/2'})
+    assert partial['description'] == 'Half acre site.'
+
+@patch('daft_listings_scraper.scrape_daft_details')
+@patch('daft_listings_scraper.fetch_page')
+def test_scrape_daft_listings_json_extraction_fetches_description(mock_fetch_page, mock_scrape_details):
+    """Test a new listing complete in the JSON still gets description and features from its detail page"""
+    collection = mongomock.MongoClient()['test_db']['daft']
+    mock_fetch_page.return_value = _next_data_page([COMPLETE_LISTING]).encode('utf-8')
+    mock_scrape_details.return_value = {
+        'address': '1 Main Street, Ranelagh, Dublin 6', 'price': '€695,000',
+        'description': 'Period home close to the village.', 'features': ['Garden', 'Gas fired central heating'],
+        'link': 'https://www.daft.ie/for-sale/house-1-main-street/1'
+    }
+
+    with patch('daft_listings_scraper.properties_collection', collection), patch('time.sleep'):
+        scrape_daft_listings('https://example.com/listings?from={}', max_page_index=0)
+
+    mock_scrape_details.assert_called_once_with('https://www.daft.ie/for-sale/house-1-main-street/1')
+    stored = collection.find_one({'link': 'https://www.daft.ie/for-sale/house-1-main-street/1'})
+    assert stored['description'] == 'Period home close to the village.'
+    assert stored['features'] == ['Garden', 'Gas fired central heating']
+    assert stored['bedrooms_numeric'] == 3
+
+
+@pytest.mark.parametrize("address, county", [
+    ("1 Main St, Ranelagh, Dublin 6", "Dublin"),
+    ("Ballyvolane, Co. Cork", "Cork"),
+    ("The Old Rectory, Kilcoole, County Wicklow", "Wicklow"),
+    ("12 Down Road, Newry, Co. Down", "Down"),
+    ("Apartment 4, The Docks", None),
+    (None, None),
+])
+def test_county_from_address(address, county):
+    """Test the county stored with each listing for the facet histograms"""
+    assert county_from_address(address) == county
+
+
+@pytest.mark.parametrize("map_link, coordinates", [
+    ("https://www.google.com/maps/@?api=1&map_action=pano&viewpoint=53.3498,-6.2603", (53.3498, -6.2603)),
+    ("https://maps.google.com/maps?q=&layer=c&cbll=51.8969,-8.4863", (51.8969, -8.4863)),
+    ("https://www.google.com/maps/@53.2707,-9.0568,15z", (53.2707, -9.0568)),
+    ("https://www.google.com/maps/@?api=1&map_action=pano&viewpoint=153.1,-6.2", None),
+    ("https://maps.example.com/view", None),
+    (None, None),
+])
+def test_coordinates_from_map_link(map_link, coordinates):
+    """Test lat/lng extraction from Street View / Maps links"""
+    assert coordinates_from_map_link(map_link) == coordinates
+
+def test_next_data_listing_point():
+    """Test the embedded JSON's GeoJSON point is kept as the listing location"""
+    details = listing_to_details({
+        'seoFriendlyPath': '/for-sale/house/1', 'title': '1 Main St',
+        'point': {'type': 'Point', 'coordinates': [-6.26, 53.35]},
+    })
+    assert details['location'] == {'type': 'Point', 'coordinates': [-6.26, 53.35]}
+    assert 'location' not in listing_to_details({'seoFriendlyPath': '/for-sale/house/2', 'point': {}})
+
+
+def test_normalize_listing():
+    """Test the typed fields derived from a listing's display strings"""
+    normalized = normalize_listing({
+        'address': '4 The Crescent, Ballincollig, Co. Cork',
+        'price': '€395,000',
+        'bedrooms': '3 Bed',
+        'bathrooms': '12 Bath',
+        'area': '1,200 ft²',
+        'ber_rating': 'BER B2',
+        'date_entered': '05/03/2024',
+        'map_link': 'https://www.google.com/maps/@?api=1&map_action=pano&viewpoint=51.88,-8.59',
+    })
+    assert normalized == {
+        'price_numeric': 395000,
+        'bedrooms_numeric': 3,
+        'bathrooms_numeric': 12,
+        'area_sqm': 111.5,
+        'ber_ordinal': 5,
+        'date_entered_at': datetime(2024, 3, 5),
+        'county': 'Cork',
+        'location': {'type': 'Point', 'coordinates': [-8.59, 51.88]},
+    }
+
+    placeholders = normalize_listing({
+        'price': 'Price on Application', 'bedrooms': 'Beds not available.', 'area': '110 m²',
+        'ber_rating': 'BER SI_666', 'date_entered': 'Date not available.', 'map_link': None,
+    })
+    assert placeholders['price_numeric'] is None
+    assert placeholders['bedrooms_numeric'] is None
+    assert placeholders['area_sqm'] == 110.0
+    assert placeholders['ber_ordinal'] is None
+    assert placeholders['date_entered_at'] is None
+    assert 'location' not in placeholders
@@ -38,7 +38,7 @@ function App() {
     const fetchAllProperties = async () => {
       try {
         const response = await axios.get(`${API_BASE_URL}/api/properties`, {
-          params: { limit: 100 }
+          params: { limit: 100, view: 'summary' }
         });
         const propertiesWithIds = (response.data.properties || []).map(property => ({
           ...property,
@@ -38,7 +38,7 @@ function PropertyList({
       setLoading(true);
       try {
         const response = await axios.get(`${API_BASE_URL}/api/properties`, {
-          params: { page, limit, searchTerm },
+          params: { page, limit, searchTerm, view: 'summary' },
         });
         const propertiesWithIds = (response.data.properties || []).map(property => ({
           ...property,
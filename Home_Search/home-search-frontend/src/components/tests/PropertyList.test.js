@@ -60,7 +60,7 @@ describe('PropertyList Component', () => {
     // Check API was called with correct params
     expect(axios.get).toHaveBeenCalledWith(
       'http://127.0.0.1:8080/api/properties',
-      { params: { page: 1, limit: 12, searchTerm: '' } }
+      { params: { page: 1, limit: 12, searchTerm: '', view: 'summary' } }
     );
   });
 
@@ -96,7 +96,7 @@ describe('PropertyList Component', () => {
     await waitFor(() => {
       expect(axios.get).toHaveBeenCalledWith(
         'http://127.0.0.1:8080/api/properties',
-        { params: { page: 1, limit: 12, searchTerm: 'dublin' } }
+        { params: { page: 1, limit: 12, searchTerm: 'dublin', view: 'summary' } }
       );
     });
     